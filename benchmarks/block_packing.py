@@ -0,0 +1,115 @@
+"""
+Compares the containers planned by filling blocks in the order files are received (the current block is finished when
+a file doesn't fit in it, unless the file is bigger than a container or stored_files.should_split_small_files is set,
+in that case the file is fragmented) with the ones planned by the BlockPacker (stored_files.packing_window), for random
+file sizes
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/block_packing.py [<amount of files> [<packing window> [<max container MB>]]]
+"""
+import random
+import sys
+import time
+
+from fcb.processing.filesystem.BlockPacker import BlockPacker, PackingBin
+
+
+class _FileInfo(object):
+    def __init__(self, size):
+        self.size = size
+
+
+def gen_sizes(files_count, max_content_size):
+    random.seed(1)
+    sizes = []
+    for _ in xrange(files_count):
+        kind = random.random()
+        if kind < 0.7:  # small files
+            sizes.append(random.randint(1, max_content_size // 100))
+        elif kind < 0.98:  # medium files
+            sizes.append(random.randint(max_content_size // 100, max_content_size // 2))
+        else:  # files bigger than a container
+            sizes.append(random.randint(max_content_size, max_content_size * 3))
+    return sizes
+
+
+def plan_in_order(sizes, max_content_size, should_split_small_files):
+    """ :return: (list of containers content sizes, amount of fragments) """
+    containers = []
+    fragments = 0
+    current = 0
+    for size in sizes:
+        if current + size <= max_content_size:
+            current += size
+            continue
+        if size <= max_content_size and not should_split_small_files:
+            containers.append(current)
+            current = size
+            continue
+        # split the file so the first part fits in the current block and the remaining in new blocks
+        fragments += 1
+        size -= max_content_size - current
+        containers.append(max_content_size)
+        while size > max_content_size:
+            fragments += 1
+            size -= max_content_size
+            containers.append(max_content_size)
+        fragments += 1
+        current = size
+    if current:
+        containers.append(current)
+    return containers, fragments
+
+
+def plan_packed(sizes, max_content_size, packing_window):
+    """ :return: (list of containers content sizes, amount of fragments) (same logic as _CompressorJob) """
+    packer = BlockPacker(max_content_size, 0)
+    containers = []
+    fragments = 0
+    window = []
+    current_bin = None
+
+    def pack(is_final):
+        bins = packer.pack(window, [] if current_bin is None else [current_bin])
+        del window[:]
+        kept_bin = None if is_final or not bins else bins.pop()
+        containers.extend(a_bin.content_size for a_bin in bins)
+        return kept_bin if kept_bin is None else PackingBin(kept_bin.content_size, kept_bin.files_count)
+
+    for size in sizes:
+        if size > max_content_size:
+            parts = (size + max_content_size - 1) // max_content_size
+            fragments += parts
+            containers.extend([max_content_size] * (size // max_content_size))
+            if size % max_content_size:
+                window.append(_FileInfo(size % max_content_size))
+        else:
+            window.append(_FileInfo(size))
+        if len(window) >= packing_window:
+            current_bin = pack(False)
+    pack(True)
+    return containers, fragments
+
+
+def main():
+    files_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    packing_window = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    max_content_size = (int(sys.argv[3]) if len(sys.argv) > 3 else 100) * 1000 * 1000
+
+    sizes = gen_sizes(files_count, max_content_size)
+    print "%d files (%d bytes), max container content size %d bytes" % (files_count, sum(sizes), max_content_size)
+    print "%-24s %12s %10s %10s %10s" % ("planning", "containers", "avg fill", "fragments", "secs")
+    for name, planner in (("in order", lambda: plan_in_order(sizes, max_content_size, False)),
+                          ("in order (split small)", lambda: plan_in_order(sizes, max_content_size, True)),
+                          ("packed (window %d)" % packing_window,
+                           lambda: plan_packed(sizes, max_content_size, packing_window))):
+        start = time.time()
+        containers, fragments = planner()
+        secs = time.time() - start
+        assert sum(containers) == sum(sizes)
+        print "%-24s %12d %9.1f%% %10d %10.2f" % (
+            name, len(containers), 100.0 * sum(containers) / (len(containers) * max_content_size), fragments, secs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measures encryption/decryption throughput of the cipher modes (cbc and ctr_hmac with 1..N workers)
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/cipher.py [<size in MB> [<max workers>]]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from fcb.processing.transformations.Cipher import Cipher, MODE_CBC, MODE_CTR_HMAC
+
+
+def gen_input_file(size_in_mb):
+    f = tempfile.NamedTemporaryFile(prefix="bench_cipher_", delete=False)
+    for _ in xrange(size_in_mb):
+        f.write(os.urandom(1000 * 1000))
+    f.close()
+    return f.name
+
+
+def run(input_path, mode, workers):
+    key = Cipher.gen_key(32)
+    encrypted_path = input_path + ".enc"
+    decrypted_path = input_path + ".dec"
+    try:
+        start = time.time()
+        Cipher.encrypt_file(key=key, in_filename=input_path, out_filename=encrypted_path, mode=mode, workers=workers)
+        encrypt_time = time.time() - start
+        start = time.time()
+        Cipher.decrypt_file(key=key, in_filename=encrypted_path, out_filename=decrypted_path)
+        decrypt_time = time.time() - start
+        assert os.path.getsize(decrypted_path) == os.path.getsize(input_path), "round trip failed"
+        return encrypt_time, decrypt_time
+    finally:
+        for path in (encrypted_path, decrypted_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def main():
+    size_in_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+
+    input_path = gen_input_file(size_in_mb)
+    try:
+        print "Input: %d MB, cpus: %d" % (size_in_mb, multiprocessing.cpu_count())
+        print "%-10s %8s %10s %10s %10s %10s" % ("mode", "workers", "enc secs", "enc MB/s", "dec secs", "dec MB/s")
+        runs = [(MODE_CBC, 1)]
+        workers = 1
+        while workers <= max_workers:
+            runs.append((MODE_CTR_HMAC, workers))
+            workers *= 2
+        for mode, workers in runs:
+            encrypt_time, decrypt_time = run(input_path, mode, workers)
+            print "%-10s %8d %10.2f %10.2f %10.2f %10.2f" % (
+                mode, workers, encrypt_time, size_in_mb / encrypt_time, decrypt_time, size_in_mb / decrypt_time)
+    finally:
+        os.remove(input_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Measures container compression throughput when using 1..N compression workers
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/compression_scaling.py [<size in MB> [<max workers>]]
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+from subprocess32 import check_call
+
+from fcb.processing.filesystem.Compressor import Block
+from fcb.processing.models.FileInfo import FileInfo
+
+
+def gen_input_file(size_in_mb):
+    """ generates a (partially compressible) file of the requested size """
+    words = ["".join(chr(random.randint(97, 122)) for _ in xrange(random.randint(2, 12))) for _ in xrange(5000)]
+    f = tempfile.NamedTemporaryFile(prefix="bench_compression_", delete=False)
+    written = 0
+    while written < size_in_mb * 1000 * 1000:
+        line = " ".join(random.choice(words) for _ in xrange(20)) + os.urandom(8).encode("hex") + "\n"
+        f.write(line)
+        written += len(line)
+    f.close()
+    return f.name
+
+
+def run(input_path, workers):
+    block = Block(destinations=[], compression_workers=workers)
+    block.add(FileInfo(input_path))
+    start = time.time()
+    block.finish()
+    elapsed = time.time() - start
+    output = block.processed_data_file_info
+    # make sure the result is a valid container for standard tools (python 2 bz2 only reads the first stream)
+    with open(os.devnull, "wb") as dev_null:
+        check_call(["tar", "tjf", output.path], stdout=dev_null)
+    os.remove(output.path)
+    return elapsed, output.size
+
+
+def main():
+    size_in_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else multiprocessing.cpu_count()
+
+    input_path = gen_input_file(size_in_mb)
+    try:
+        print "Input: %d MB, cpus: %d" % (size_in_mb, multiprocessing.cpu_count())
+        print "%8s %10s %10s %8s" % ("workers", "seconds", "MB/s", "speedup")
+        base = None
+        workers = 1
+        while workers <= max_workers:
+            elapsed, _ = run(input_path, workers)
+            base = elapsed if base is None else base
+            print "%8d %10.2f %10.2f %8.2f" % (workers, elapsed, size_in_mb / elapsed, base / elapsed)
+            workers *= 2
+    finally:
+        os.remove(input_path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Measures the queries done on the hot paths over a synthetic database with the version 3 schema (no indexes) and
+after upgrading it to the current version (see fcb.database.upgrade)
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/database.py [<amount of uploaded files> [<amount of queries>]]
+"""
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from fcb.database import upgrade
+from fcb.database.schema import Base, ProgramInformation, UploadedFile, FilesContainer, FileFragment, \
+    FilesDestinations, Destination
+
+_FILES_PER_CONTAINER = 10
+_INSERT_BULK_SIZE = 10000
+
+
+def _sha1(kind, number):
+    return "%s%036x" % (kind, number)
+
+
+def _bulk_insert(connection, table, rows):
+    bulk = []
+    for row in rows:
+        bulk.append(row)
+        if len(bulk) == _INSERT_BULK_SIZE:
+            connection.execute(table.insert(), bulk)
+            bulk = []
+    if bulk:
+        connection.execute(table.insert(), bulk)
+
+
+def gen_database(db_path, files_count):
+    """ generates a version 3 database (no indexes) with files_count uploaded files """
+    engine = create_engine("sqlite:///" + db_path)
+    Base.metadata.create_all(engine)
+    start_date = datetime.datetime(2015, 1, 1)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.drop(bind=connection)
+        connection.execute(ProgramInformation.__table__.insert(), [dict(name="db_version", value="3")])
+        connection.execute(Destination.__table__.insert(),
+                           [dict(id=1, destination="mail_1"), dict(id=2, destination="mail_2")])
+        containers_count = files_count // _FILES_PER_CONTAINER + 1
+        _bulk_insert(connection, FilesContainer.__table__, (
+            dict(id=i, sha1=_sha1("c", i), file_name="archive_%d.tar.bz2" % i, encryption_key="key",
+                 container_size=1000, upload_date=start_date + datetime.timedelta(minutes=i))
+            for i in xrange(containers_count)))
+        _bulk_insert(connection, FilesDestinations.__table__, (
+            dict(file_containers_id=i, destinations_id=destination, verification_info="msg_%d_%d" % (destination, i)
+                 if i % 100 else None)
+            for i in xrange(containers_count) for destination in (1, 2)))
+        _bulk_insert(connection, UploadedFile.__table__, (
+            dict(id=i, sha1=_sha1("f", i), file_name=u"file_%d" % i, fragment_count=2 if i % 10 == 0 else 0,
+                 upload_date=start_date + datetime.timedelta(minutes=i // _FILES_PER_CONTAINER))
+            for i in xrange(files_count)))
+        _bulk_insert(connection, FileFragment.__table__, (
+            dict(fragment_sha1=_sha1("p", i * 2 + fragment), fragment_name=u"file_%d_part_%d" % (i, fragment),
+                 fragment_number=fragment, file_id=i)
+            for i in xrange(0, files_count, 10) for fragment in (1, 2)))
+    return engine, containers_count
+
+
+def run_queries(session, files_count, containers_count, queries_count):
+    """ :return: list of (query name, seconds) """
+    queries = (
+        ("uploaded file by sha1", lambda: session
+            .query(UploadedFile)
+            .filter(UploadedFile.sha1 == _sha1("f", random.randrange(files_count)))
+            .order_by(UploadedFile.upload_date.desc()).first()),
+        ("file fragments", lambda: session
+            .query(FileFragment)
+            .filter(FileFragment.file_id == random.randrange(0, files_count, 10)).all()),
+        ("container key by sha1", lambda: session
+            .query(FilesContainer.encryption_key)
+            .filter(FilesContainer.sha1 == _sha1("c", random.randrange(containers_count))).scalar()),
+        ("container by name", lambda: session
+            .query(FilesContainer)
+            .filter(FilesContainer.file_name == "archive_%d.tar.bz2" % random.randrange(containers_count)).one()),
+        ("verified container", lambda: session
+            .query(FilesDestinations)
+            .filter(FilesDestinations.verification_info == "msg_1_%d" % random.randrange(1, 100)).one()),
+        ("bytes uploaded in date", lambda: FilesDestinations.get_bytes_uploaded_in_date(
+            session, ["mail_1"], datetime.datetime(2015, 1, 1) + datetime.timedelta(days=random.randrange(100)))),
+    )
+    results = []
+    for name, query in queries:
+        start = time.time()
+        for _ in xrange(queries_count):
+            query()
+        results.append((name, time.time() - start))
+    return results
+
+
+def main():
+    files_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000 * 1000
+    queries_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    db_path = tempfile.mktemp(prefix="bench_database_", suffix=".db")
+    try:
+        start = time.time()
+        engine, containers_count = gen_database(db_path, files_count)
+        print "Database with %d uploaded files (%d containers) generated in %.2f secs" % (
+            files_count, containers_count, time.time() - start)
+        session = sessionmaker(bind=engine)()
+
+        before = run_queries(session, files_count, containers_count, queries_count)
+        start = time.time()
+        upgrade.upgrade(session)
+        session.commit()
+        print "Upgraded in %.2f secs" % (time.time() - start)
+        after = run_queries(session, files_count, containers_count, queries_count)
+
+        print "%d queries of each kind" % queries_count
+        print "%-24s %12s %14s" % ("query", "v3 secs", "upgraded secs")
+        for (name, before_secs), (_, after_secs) in zip(before, after):
+            print "%-24s %12.3f %14.3f" % (name, before_secs, after_secs)
+        session.close()
+    finally:
+        if os.path.exists(db_path):
+            os.remove(db_path)
+
+
+if __name__ == '__main__':
+    main()
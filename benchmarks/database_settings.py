@@ -0,0 +1,128 @@
+"""
+Measures the database workload of a backup (AlreadyProcessedFilter checking the input files and SentLog saving the
+sent containers) with the previous SQLite settings (SQLite defaults) and with the current <database> defaults
+(see fcb.utils.Settings._Database)
+
+Each profile runs twice over the same input files: the first run sends every file, the second one finds all of them
+already sent (their sha1 is taken from the digest cache)
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/database_settings.py [<amount of files> [<files per container>]]
+"""
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from fcb.database.helpers import configure_database, get_db_writer
+from fcb.database.schema import Base, ProgramInformation, DB_VERSION
+from fcb.processing.filters.AlreadyProcessedFilter import AlreadyProcessedFilter
+from fcb.processing.models.FileInfo import FileInfo
+from fcb.sending.SentLog import SentLog
+from fcb.utils.Settings import _Database, _Size
+
+
+class _Block(object):
+    pass
+
+
+def previous_settings(path):
+    database_settings = _Database()
+    database_settings.path = path
+    database_settings.journal_mode = "DELETE"
+    database_settings.synchronous = "FULL"
+    database_settings.cache_size = _Size("2M")
+    database_settings.mmap_size = _Size("0")
+    database_settings.temp_store = "DEFAULT"
+    database_settings.busy_timeout = 5
+    return database_settings
+
+
+def current_settings(path):
+    database_settings = _Database()
+    database_settings.path = path
+    return database_settings
+
+
+def gen_input_files(directory, files_count):
+    paths = []
+    for i in xrange(files_count):
+        path = os.path.join(directory, "file_%d" % i)
+        with open(path, "wb") as f:
+            f.write("content of file %d\n" % i)
+        paths.append(path)
+    return paths
+
+
+def gen_database(database_settings):
+    engine = create_engine(database_settings.connect_string)
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(ProgramInformation(name="db_version", value=str(DB_VERSION)))
+    session.commit()
+    session.close()
+    engine.dispose()
+
+
+def new_block(number, file_infos):
+    block = _Block()
+    block.send_destinations = ["mail_1", "mail_2"]
+    block.destinations_verif_data = {"mail_1": "msg_%d" % number}
+    block.cipher_key = "key"
+    block.latest_file_info = FileInfo("/tmp/archive_%d" % number, sha1=hashlib.sha1("c%d" % number).hexdigest(),
+                                      size=1000)
+    block.content_file_infos = file_infos
+    return block
+
+
+def run_backup(input_paths, files_per_container):
+    """ :return: (seconds, amount of files sent) """
+    start = time.time()
+    already_processed_filter = AlreadyProcessedFilter()
+    sent_log = SentLog(sent_log=None)
+    pending = []
+    blocks_count = 0
+    for path in input_paths:
+        file_info = already_processed_filter.process_data(FileInfo(path))
+        if file_info is not None:
+            pending.append(file_info)
+        if len(pending) == files_per_container:
+            block = new_block(blocks_count, pending)
+            already_processed_filter.on_block_processed(block)
+            sent_log._log_in_db(block)
+            get_db_writer().flush()  # containers are far apart in a real backup, each one is saved on its own
+            blocks_count += 1
+            pending = []
+    already_processed_filter.on_stopped()
+    get_db_writer().flush()
+    return time.time() - start, blocks_count * files_per_container
+
+
+def main():
+    files_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    files_per_container = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    work_dir = tempfile.mkdtemp(prefix="bench_database_settings_")
+    try:
+        input_paths = gen_input_files(work_dir, files_count)
+        print "%d files, %d files per container" % (files_count, files_per_container)
+        print "%-10s %14s %14s" % ("settings", "1st run secs", "2nd run secs")
+        for name, settings_builder in (("previous", previous_settings), ("current", current_settings)):
+            database_settings = settings_builder(os.path.join(work_dir, "%s.db" % name))
+            gen_database(database_settings)
+            configure_database(database_settings)
+            first_secs, sent = run_backup(input_paths, files_per_container)
+            second_secs, sent_again = run_backup(input_paths, files_per_container)
+            assert sent == files_count - files_count % files_per_container and sent_again == 0
+            print "%-10s %14.2f %14.2f" % (name, first_secs, second_secs)
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Measures the time required to hash files with the previous implementation (128 bytes reads) and the current one
+(large buffers, mmap, several digests in one pass and many files concurrently)
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/digest.py [<size in MB> [<amount of files> [<max workers>]]]
+"""
+import hashlib
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from functools import partial
+
+from fcb.utils import digest
+
+
+def previous_gen_sha1(file_path):
+    """ gen_sha1 as implemented before (128 bytes reads) """
+    with open(file_path, mode='rb') as f:
+        d = hashlib.sha1()
+        for buf in iter(partial(f.read, 128), b''):
+            d.update(buf)
+    return d.hexdigest()
+
+
+def gen_input_file(size_in_mb):
+    f = tempfile.NamedTemporaryFile(prefix="bench_digest_", delete=False)
+    for _ in xrange(size_in_mb):
+        f.write(os.urandom(1000 * 1000))
+    f.close()
+    return f.name
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    result = function(*args, **kwargs)
+    return time.time() - start, result
+
+
+def main():
+    size_in_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    files_count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    max_workers = int(sys.argv[3]) if len(sys.argv) > 3 else multiprocessing.cpu_count()
+
+    input_path = gen_input_file(size_in_mb)
+    try:
+        print "Single file: %d MB, cpus: %d" % (size_in_mb, multiprocessing.cpu_count())
+        print "%-22s %10s %10s" % ("version", "secs", "MB/s")
+        expected = None
+        for name, function in (
+                ("previous (128 B)", previous_gen_sha1),
+                ("buffered (1 MiB)", lambda path: digest.gen_digests(path, mmap_threshold=0)[0]),
+                ("mmap", lambda path: digest.gen_digests(path, mmap_threshold=1)[0]),
+                ("sha1+sha256 buffered",
+                 lambda path: digest.gen_digests(path, ("sha1", "sha256"), mmap_threshold=0)[0]),
+                ("sha1+sha256 separated", lambda path: [digest.gen_digests(path, (algorithm,), mmap_threshold=0)[0]
+                                                        for algorithm in ("sha1", "sha256")][0])):
+            secs, sha1 = timed(function, input_path)
+            expected = sha1 if expected is None else expected
+            assert sha1 == expected, "%s gives a different sha1" % name
+            print "%-22s %10.2f %10.2f" % (name, secs, size_in_mb / secs)
+    finally:
+        os.remove(input_path)
+
+    file_size_in_mb = max(1, size_in_mb // files_count)
+    input_paths = [gen_input_file(file_size_in_mb) for _ in xrange(files_count)]
+    try:
+        print "\n%d files of %d MB" % (files_count, file_size_in_mb)
+        print "%-22s %10s %10s" % ("workers", "secs", "MB/s")
+        workers = 1
+        while workers <= max_workers:
+            secs, _ = timed(lambda: list(digest.gen_digests_of_files(input_paths, workers=workers)))
+            print "%-22d %10.2f %10.2f" % (workers, secs, files_count * file_size_in_mb / secs)
+            workers *= 2
+    finally:
+        for path in input_paths:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
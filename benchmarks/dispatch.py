@@ -0,0 +1,119 @@
+"""
+Measures the time files_cloud_backuper takes to send a synthetic tree of tiny files, and the amount of circuits events
+dispatched meanwhile. Containers are sent by FakeSender and saved by a directory destination (containers are only
+created for destinations with settings). Other checkouts of the repository (e.g. one of the revision previous to the
+direct dispatch of the worker pools results and the coalescing of bookkeeping events) can be measured too to compare
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/dispatch.py [<amount of files> [<other repository root> ...]]
+"""
+import os
+import random
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+_FILES_PER_DIRECTORY = 1000
+_TIMEOUT_SECS = 24 * 60 * 60
+
+# runs files_cloud_backuper (INFO log level) counting the events dispatched, the amount is written to events.txt
+_RUNNER = """
+import atexit, logging, runpy, sys
+import fcb.log_configuration
+fcb.log_configuration.logger.setLevel(logging.INFO)
+from circuits.core.manager import Manager
+dispatched = [0]
+original_dispatcher = Manager._dispatcher
+def counting_dispatcher(self, *args):
+    dispatched[0] += 1
+    return original_dispatcher(self, *args)
+Manager._dispatcher = counting_dispatcher
+atexit.register(lambda: open("events.txt", "w").write(str(dispatched[0])))
+sys.argv = ["files_cloud_backuper", "conf.xml", "tree"]
+runpy.run_module("fcb.files_cloud_backuper", run_name="__main__")
+"""
+
+_CONFIGURATION = """<configuration>
+    <default_limits><max_container_content_size>10M</max_container_content_size></default_limits>
+    <stored_files><should_encrypt>0</should_encrypt></stored_files>
+    <dir_destination><path>out</path></dir_destination>
+    <fake_sender/>
+</configuration>
+"""
+
+
+def gen_tree(path, files_count):
+    random.seed(1)
+    for number in xrange(files_count):
+        directory = os.path.join(path, "d%04d" % (number // _FILES_PER_DIRECTORY))
+        if number % _FILES_PER_DIRECTORY == 0:
+            os.makedirs(directory)
+        with open(os.path.join(directory, "f%d" % number), "wb") as f:
+            # the number makes the content unique (files with the same content are saved once)
+            f.write("%d\n%s" % (number, os.urandom(random.randint(0, 64))))
+
+
+def count_sent_files(database_path):
+    """ :return: amount of files saved in database as sent """
+    connection = sqlite3.connect(database_path)
+    try:
+        return connection.execute("SELECT COUNT(*) FROM files_in_containers").fetchone()[0]
+    finally:
+        connection.close()
+
+
+def measure(repository_root, tree_path, files_count):
+    """ :return: (secs until every file was saved as sent, events dispatched) """
+    work_path = tempfile.mkdtemp(prefix="bench_dispatch_")
+    try:
+        os.symlink(tree_path, os.path.join(work_path, "tree"))
+        os.mkdir(os.path.join(work_path, "out"))
+        with open(os.path.join(work_path, "conf.xml"), "w") as f:
+            f.write(_CONFIGURATION)
+        environment = dict(os.environ, PYTHONPATH=os.path.abspath(repository_root))
+        with open(os.devnull, "w") as devnull:
+            subprocess.check_call([sys.executable, "-m", "fcb.database.schema"], cwd=work_path, env=environment,
+                                  stdout=devnull, stderr=devnull)
+            start = time.time()
+            process = subprocess.Popen([sys.executable, "-c", _RUNNER], cwd=work_path, env=environment,
+                                       stdout=devnull, stderr=devnull)
+        sent = 0
+        while sent < files_count and process.poll() is None and time.time() - start < _TIMEOUT_SECS:
+            time.sleep(0.5)
+            sent = count_sent_files(os.path.join(work_path, "data.db"))
+        secs = time.time() - start
+        if process.poll() is None:
+            process.send_signal(signal.SIGINT)
+            process.wait()
+        if sent < files_count:
+            raise RuntimeError("Only %d of %d files were sent by '%s'" % (sent, files_count, repository_root))
+        with open(os.path.join(work_path, "events.txt")) as f:
+            return secs, int(f.read())
+    finally:
+        shutil.rmtree(work_path)
+
+
+def main():
+    files_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    repository_roots = ["."] + sys.argv[2:]
+
+    tree_path = tempfile.mkdtemp(prefix="bench_dispatch_tree_")
+    try:
+        start = time.time()
+        gen_tree(tree_path, files_count)
+        print "%d files generated in %.1f secs" % (files_count, time.time() - start)
+        print "%-40s %10s %12s %14s %16s" % ("repository", "secs", "files/sec", "events", "events per file")
+        for repository_root in repository_roots:
+            secs, events = measure(repository_root, tree_path, files_count)
+            print "%-40s %10.1f %12.1f %14d %16.2f" % (
+                repository_root, secs, files_count / secs, events, float(events) / files_count)
+    finally:
+        shutil.rmtree(tree_path)
+
+
+if __name__ == '__main__':
+    main()
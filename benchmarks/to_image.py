@@ -0,0 +1,124 @@
+"""
+Measures the time required to convert a container to image (and back) with the previous per byte implementation
+and the current (vectorized and chunked) ones, and the effect of the image dimensions when the container has a
+prime amount of pixels
+
+Usage (from the repository root):
+    PYTHONPATH=. python benchmarks/to_image.py [<size in MB> [<size in MB of the previous implementation run>]]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy
+from PIL import Image
+
+from fcb.processing.transformations import ToImage
+
+
+def previous_to_image_array(file_path):
+    """ to image conversion as implemented before being vectorized (byte by byte) """
+    data = numpy.fromfile(file_path, numpy.uint8)
+    orig_len = len(data)
+    pad_req = (3 - (orig_len % 3))
+    pad_req += 3 if pad_req == 0 else 0
+    final_len = orig_len + pad_req
+    num_of_pixels = final_len // 3
+    w, h = ToImage._determine_dimensions(num_of_pixels)
+    reshaped = numpy.zeros((w, h, 3), dtype=numpy.uint8)
+    for i in xrange(final_len):
+        sidx = i // 3
+        y = sidx % h
+        x = sidx // h
+        s = i % 3
+        reshaped[x, y, s] = data[i] if i < orig_len else 0
+    reshaped[-1, -1, 2] = pad_req
+    return reshaped
+
+
+def previous_from_file_to_image(file_path, img_path):
+    Image.fromarray(previous_to_image_array(file_path), 'RGB').save(img_path, format='PNG')
+
+
+def line_from_file_to_image(file_path, img_path):
+    """ to image conversion using the "line" image previously generated for prime amounts of pixels """
+    data = numpy.fromfile(file_path, numpy.uint8)
+    pixels = numpy.zeros((len(data) // 3 + 1) * 3, dtype=numpy.uint8)
+    pixels[:len(data)] = data
+    pixels[-1] = len(pixels) - len(data)
+    Image.fromarray(pixels.reshape((1, -1, 3)), 'RGB').save(img_path, format='PNG')
+
+
+def gen_input_file(size_in_mb, extra_bytes=0):
+    """ generates a random (as containers are compressed and/or encrypted) file of the requested size """
+    f = tempfile.NamedTemporaryFile(prefix="bench_to_image_", delete=False)
+    for _ in xrange(size_in_mb):
+        f.write(os.urandom(1000 * 1000))
+    f.write(os.urandom(extra_bytes))
+    f.close()
+    return f.name
+
+
+def prime_pixels_extra_bytes(size_in_mb):
+    """ :return: bytes to add to size_in_mb MB so the exact image has a prime amount of pixels """
+    pixels = size_in_mb * 1000 * 1000 // 3 + 1
+    while len(ToImage._prime_factors(pixels)) != 1:
+        pixels += 1
+    return pixels * 3 - 1 - size_in_mb * 1000 * 1000
+
+
+def timed(function, *args, **kwargs):
+    start = time.time()
+    function(*args, **kwargs)
+    return time.time() - start
+
+
+def run(name, size_in_mb, input_path, to_image):
+    img_path = input_path + ".png"
+    out_path = input_path + ".out"
+    try:
+        encode_time = timed(to_image, input_path, img_path)
+        decode_time = timed(ToImage.from_image_to_file, img_path, out_path)
+        with open(input_path, "rb") as original, open(out_path, "rb") as decoded:
+            assert original.read() == decoded.read(), "round trip failed"
+        print "%-12s %8d %10.2f %10.2f %10.2f" % (
+            name, size_in_mb, encode_time, size_in_mb / encode_time, decode_time)
+        with open(img_path, "rb") as img_file:
+            return img_file.read()
+    finally:
+        for path in (img_path, out_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def main():
+    size_in_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    previous_size_in_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+
+    print "%-12s %8s %10s %10s %10s" % ("version", "MB", "enc secs", "enc MB/s", "dec secs")
+    previous_input = gen_input_file(previous_size_in_mb)
+    input_path = gen_input_file(size_in_mb)
+    try:
+        previous_img = run("previous", previous_size_in_mb, previous_input, previous_from_file_to_image)
+        current_img = run("vectorized", previous_size_in_mb, previous_input, ToImage.from_file_to_image)
+        if len(ToImage._image_layout(os.path.getsize(previous_input))[2]) == 1:  # exact (previous) dimensions
+            assert previous_img == current_img, "vectorized image differs from the previous one"
+        run("vectorized", size_in_mb, input_path, ToImage.from_file_to_image)
+        run("chunked", size_in_mb, input_path, lambda src, dst: ToImage.from_file_to_image(src, dst, chunked=True))
+    finally:
+        os.remove(previous_input)
+        os.remove(input_path)
+
+    print "\nPrime amount of pixels (previously a 1 x N image)"
+    prime_input = gen_input_file(size_in_mb, prime_pixels_extra_bytes(size_in_mb))
+    try:
+        run("line", size_in_mb, prime_input, line_from_file_to_image)
+        run("near square", size_in_mb, prime_input, ToImage.from_file_to_image)
+        run("chunked", size_in_mb, prime_input, lambda src, dst: ToImage.from_file_to_image(src, dst, chunked=True))
+    finally:
+        os.remove(prime_input)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ from sqlalchemy.sql.expression import select
 
 from fcb.database.helpers import get_session
 from fcb.database.schema import FilesContainer, CheckerState, Destination, FilesDestinations
+from fcb.processing.filesystem import ContainerCodec
 from fcb.processing.models.FileInfo import FileInfo
 from fcb.utils.log_helper import get_logger_for, get_logger_module
 
@@ -225,7 +226,7 @@ class Checker(object):
 
 
 class MsgInfo(object):
-    may_be_fcb_regex = re.compile('archive_.*\\.tar\\.bz2.*')
+    may_be_fcb_regex = re.compile(ContainerCodec.container_name_regex())
 
     def __init__(self, lines):
         expected_fields = 3
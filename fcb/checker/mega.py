@@ -1,7 +1,10 @@
+import re
+
 from sqlalchemy import update
 
 from fcb.database.helpers import get_session
 from fcb.database.schema import FilesContainer, Destination, FilesDestinations
+from fcb.processing.filesystem import ContainerCodec
 from fcb.sending.mega.helpers import MegaAccountHandler
 from fcb.utils.log_helper import get_logger_for
 
@@ -31,13 +34,14 @@ class _ExternalResourcesHandler(object):
     @staticmethod
     def get_unverified_list_from_mega(settings):
         dst_path = MegaAccountHandler.to_absoulte_dst_path(settings) + "/"
-        dst_path_pattern = dst_path + "archive_"  # FIXME dependent on cur impl
+        container_name_regex = re.compile(ContainerCodec.container_name_regex())
         cmd = MegaAccountHandler.build_command_argumetns(command_str="megals", settings=settings)
         popen = MegaAccountHandler.execute_command(cmd)
         with popen as proc:
             return [file_name[len(dst_path):].strip()
                     for file_name in proc.stdout
-                    if file_name.startswith(dst_path_pattern)]
+                    if file_name.startswith(dst_path)
+                    and container_name_regex.match(file_name[len(dst_path):]) is not None]
 
     def set_verified(self, container_id_set):
         with self._session_resource as session:
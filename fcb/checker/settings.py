@@ -1,5 +1,6 @@
 import xml.etree.ElementTree as Etree
 
+from fcb.utils.Settings import _Database
 from fcb.utils.log_helper import get_logger_for
 
 
@@ -28,6 +29,7 @@ class Configuration(object):
         self.log = get_logger_for(self)
         self.mail_confs = []
         self.mega_confs = []
+        self.database = _Database()
 
         self._parse(Etree.parse(file_path))
 
@@ -38,6 +40,8 @@ class Configuration(object):
                     self.mail_confs.append(_MailConf(child))
                 elif child.tag == "mega_sender":
                     self.mega_confs.append(_MegaConf(child))
+                elif child.tag == "database":
+                    self.database = _Database(child)
                 else:
                     self.log.warning("Tag '%s' not recognized. Will be ignored.", child.tag)
             except RuntimeError as e:
@@ -0,0 +1,137 @@
+"""
+Persistent cache of the sha1 of the (input) files, so files which didn't change since they were hashed aren't read
+again to get it
+
+A cached sha1 is used only while the file path, device, inode, size and modification time are the same ones it had
+when it was hashed.
+"""
+import os
+
+from fcb.database.schema import CachedDigest
+from fcb.utils.log_helper import get_logger_module
+
+_log = get_logger_module("digest_cache")
+
+# amount of new digests kept in memory before saving them
+_BULK_SIZE = 1000
+
+
+def _stat_key(stat):
+    """
+    :return: (device, inode, size, mtime_ns) of the os.stat (or scandir) result
+    """
+    # st_mtime_ns isn't used as python 2 os.stat doesn't have it (but scandir does), the float st_mtime is the same
+    return int(stat.st_dev), int(stat.st_ino), int(stat.st_size), int(stat.st_mtime * 1000 * 1000 * 1000)
+
+
+def _create_table(session):
+    CachedDigest.__table__.create(bind=session.connection(), checkfirst=True)
+
+
+def create_table(session_resource):
+    """
+    Creates the cache table if it doesn't exist (databases created by previous versions don't have it)
+    """
+    with session_resource as session:
+        _create_table(session)
+
+
+def _save_digests(session, digests):
+    if session.get_bind().dialect.name == "sqlite":
+        session.execute(CachedDigest.__table__.insert().prefix_with("OR REPLACE"), digests)
+        return
+    paths = [digest["path"] for digest in digests]
+    for start in xrange(0, len(paths), _BULK_SIZE):
+        session \
+            .query(CachedDigest) \
+            .filter(CachedDigest.path.in_(paths[start:start + _BULK_SIZE])) \
+            .delete(synchronize_session=False)
+    session.execute(CachedDigest.__table__.insert(), digests)
+
+
+class DigestCache(object):
+    """
+    Gets the sha1 of the files from the cache (if the file didn't change) and saves the new ones (in bulks)
+    """
+
+    def __init__(self, read_session_resource, db_writer, bulk_size=_BULK_SIZE):
+        """
+        :param read_session_resource: used to read the cache (see get_read_session)
+        :param db_writer: used to save the new digests (see get_db_writer)
+        """
+        self._session_resource = read_session_resource
+        self._db_writer = db_writer
+        self._bulk_size = bulk_size
+        self._pending = {}  # path -> values of the CachedDigest to save
+        db_writer.execute(_create_table)
+
+    def get_sha1(self, file_info):
+        """
+        :return: the cached sha1 of the file (None if it isn't cached or the file changed since it was cached)
+        """
+        path = file_info.upath
+        key = _stat_key(file_info.stat)
+        cached = self._pending.get(path)
+        if cached is not None:
+            cached = (cached["device"], cached["inode"], cached["size"], cached["mtime_ns"], cached["sha1"])
+        else:
+            with self._session_resource as session:
+                cached = session \
+                    .query(CachedDigest.device, CachedDigest.inode, CachedDigest.size, CachedDigest.mtime_ns,
+                           CachedDigest.sha1) \
+                    .filter(CachedDigest.path == path) \
+                    .first()
+        if cached is not None and tuple(cached[:4]) == key:
+            return cached[4]
+        return None
+
+    def add(self, file_info):
+        """
+        Caches the sha1 of the file (the file stat must be taken before its sha1, see FileInfo.stat)
+        """
+        device, inode, size, mtime_ns = _stat_key(file_info.stat)
+        self._pending[file_info.upath] = \
+            dict(path=file_info.upath, device=device, inode=inode, size=size, mtime_ns=mtime_ns, sha1=file_info.sha1)
+        if len(self._pending) >= self._bulk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Saves the digests added since the last flush
+        """
+        if not self._pending:
+            return
+        digests = self._pending.values()
+        self._db_writer.submit(lambda session: _save_digests(session, digests))
+        _log.debug("Queued %d digests to be saved", len(digests))
+        self._pending = {}
+
+
+def vacuum(session_resource, path_prefix=None):
+    """
+    Deletes the cached digests of the files which no longer exist or changed since they were cached
+    :param path_prefix: if given, only cached digests of paths starting with it are checked
+    :return: amount of deleted cached digests
+    """
+    create_table(session_resource)
+    with session_resource as session:
+        query = session.query(CachedDigest.path, CachedDigest.device, CachedDigest.inode, CachedDigest.size,
+                              CachedDigest.mtime_ns)
+        if path_prefix is not None:
+            query = query.filter(CachedDigest.path.startswith(path_prefix.decode("utf-8")))
+        stale_paths = []
+        for row in query.yield_per(_BULK_SIZE):
+            try:
+                if _stat_key(os.stat(row.path.encode("utf-8"))) == tuple(row[1:]):
+                    continue
+            except OSError:
+                pass  # doesn't exist (or can't be accessed) any more
+            stale_paths.append(row.path)
+
+        for start in xrange(0, len(stale_paths), _BULK_SIZE):
+            session \
+                .query(CachedDigest) \
+                .filter(CachedDigest.path.in_(stale_paths[start:start + _BULK_SIZE])) \
+                .delete(synchronize_session=False)
+    _log.info("Deleted %d stale cached digests", len(stale_paths))
+    return len(stale_paths)
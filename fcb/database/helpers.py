@@ -1,11 +1,82 @@
+import Queue
+import atexit
 import threading
-from sqlalchemy import create_engine
+from functools import partial
+
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import SingletonThreadPool
+
 from fcb.database import settings
 from fcb.database.schema import ProgramInformation
+from fcb.utils.Settings import InvalidSettings
+from fcb.utils.log_helper import get_logger_module
+
+_log = get_logger_module("database")
+
+_JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+_SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+_TEMP_STORES = ("DEFAULT", "FILE", "MEMORY")
+
+# maximum amount of write operations done in a single transaction
+_MAX_GROUPED_OPERATIONS = 1000
+
+_Session = sessionmaker()
+_ReadSession = sessionmaker()
+
+
+def _set_sqlite_pragmas(pragmas, dbapi_connection, _):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas:
+        cursor.execute("PRAGMA %s=%s" % (name, value))
+    cursor.close()
+
+
+def _create_engines(connect_string, sqlite_pragmas):
+    """
+    Creates the engines used to write and to read the database (sqlite_pragmas are set on each new SQLite connection)
+    """
+    engine = create_engine(connect_string)
+    if engine.dialect.name != "sqlite":
+        _log.debug("Using %s database, SQLite settings are ignored", engine.dialect.name)
+        _Session.configure(bind=engine)
+        _ReadSession.configure(bind=engine)
+        return
+
+    # readers use a connection of their own (one per thread, kept open)
+    read_engine = create_engine(connect_string, poolclass=SingletonThreadPool)
+    for an_engine in (engine, read_engine):
+        event.listen(an_engine, "connect", partial(_set_sqlite_pragmas, sqlite_pragmas))
+    _Session.configure(bind=engine)
+    _ReadSession.configure(bind=read_engine)
 
-_engine = create_engine(settings.Definitions.connect_string)
-_Session = sessionmaker(bind=_engine)
+
+def _check_value(name, value, valid_values):
+    value = str(value).upper()
+    if value not in valid_values:
+        raise InvalidSettings("Invalid database %s '%s' (valid values: %s)" % (name, value, ", ".join(valid_values)))
+    return value
+
+
+def configure_database(database_settings):
+    """
+    Uses the database of the settings (see fcb.utils.Settings._Database) instead of the default one
+    Must be called before the database is used
+    :raise InvalidSettings: if a SQLite setting has an invalid value
+    """
+    sqlite_pragmas = (
+        ("journal_mode", _check_value("journal_mode", database_settings.journal_mode, _JOURNAL_MODES)),
+        ("synchronous", _check_value("synchronous", database_settings.synchronous, _SYNCHRONOUS_LEVELS)),
+        ("cache_size", -(database_settings.cache_size.in_bytes // 1024)),  # negative means KiB (not pages)
+        ("mmap_size", database_settings.mmap_size.in_bytes),
+        ("temp_store", _check_value("temp_store", database_settings.temp_store, _TEMP_STORES)),
+        ("busy_timeout", int(database_settings.busy_timeout * 1000)))
+    _log.debug("Using database '%s'", database_settings.connect_string)
+    _create_engines(database_settings.connect_string, sqlite_pragmas)
+
+
+# with write-ahead logging readers don't block the writer (nor the writer blocks them)
+_create_engines(settings.Definitions.connect_string, (("journal_mode", "WAL"),))
 
 
 class _LockedSession(object):
@@ -14,6 +85,8 @@ class _LockedSession(object):
     Because SQLAlchemy sessions are not thread safe (nor multi-thread shareable seems), we use different sessions
       but share the locks (to ensure exclusive access to DB)
     When/If a different engine is to be used, this class may be changed to avoid locking in that case
+
+    Note: used by the tools, the backup pipeline reads with get_read_session and writes with get_db_writer
     """
     def __init__(self):
         self._lock = threading.RLock()
@@ -30,13 +103,159 @@ class _LockedSession(object):
         self._lock.release()
 
 
+class _ThreadReadSession(object):
+    """
+    Gives each thread a session of its own to read the database (no lock is shared with other threads nor the writer)
+    Nothing done with the session is committed
+    """
+    def __init__(self):
+        self._local = threading.local()
+
+    def __enter__(self):
+        depth = getattr(self._local, "depth", 0)
+        if depth == 0:
+            self._local.session = _ReadSession()
+        self._local.depth = depth + 1
+        return self._local.session
+
+    def __exit__(self, *_):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            self._local.session.close()  # ends the read transaction, the connection is kept for the thread
+            self._local.session = None
+
+
+class _DbWriter(object):
+    """
+    Does the database writes in a thread of its own
+
+    Write operations are callables which receive the session to use (they must not commit it). Queued operations are
+    done in order, grouped in transactions (if a transaction fails, its operations are retried one by one, the ones
+    which fail again are dropped and their failure is passed back, see submit and execute)
+    """
+    def __init__(self):
+        self._queue = Queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, operation, on_done=None):
+        """
+        Queues the write operation (returns without waiting for it to be done)
+        :param on_done: optional callable called by the writer thread once the operation is done, with None if it was
+                        committed or with the exception if it was dropped (it failed even when written alone)
+        """
+        self._start_if_required()
+        self._queue.put((operation, on_done))
+
+    def execute(self, operation):
+        """
+        Queues the write operation and waits for it to be committed
+        :return: the value returned by the operation
+        :raise Exception: the one of the operation (or of its commit) if it was dropped
+        """
+        done = threading.Event()
+        outcome = {}
+
+        def operation_with_result(session):
+            outcome["value"] = operation(session)  # the latest one if the operation is retried
+
+        def on_done(error):
+            outcome["error"] = error
+            done.set()
+
+        self.submit(operation_with_result, on_done)
+        done.wait()
+        if outcome["error"] is not None:
+            raise outcome["error"]
+        return outcome.get("value")
+
+    def flush(self):
+        """
+        Waits until all queued operations are done
+        """
+        if self._thread is not None:
+            self._queue.join()
+
+    def _start_if_required(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="DbWriter")
+                self._thread.daemon = True
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            operations = [self._queue.get()]
+            try:
+                while len(operations) < _MAX_GROUPED_OPERATIONS:
+                    operations.append(self._queue.get_nowait())
+            except Queue.Empty:
+                pass
+            errors = [None] * len(operations)
+            session = _Session()
+            try:
+                errors = self._write(session, [operation for operation, _ in operations])
+            finally:
+                session.close()
+                for (operation, on_done), error in zip(operations, errors):
+                    if on_done is not None:
+                        try:
+                            on_done(error)
+                        except Exception:
+                            _log.exception("Failed to notify the end of write operation %s", operation)
+                    self._queue.task_done()
+
+    def _write(self, session, operations):
+        """
+        :return: list with the exception of each dropped operation (None for the committed ones)
+        """
+        try:
+            self._do_in_transaction(session, operations)
+            return [None] * len(operations)
+        except Exception:
+            _log.exception("Failed to write %d operations at once, will write them one by one", len(operations))
+        errors = []
+        for operation in operations:
+            try:
+                self._do_in_transaction(session, [operation])
+                errors.append(None)
+            except Exception as e:
+                _log.exception("Failed to do write operation %s (dropped)", operation)
+                errors.append(e)
+        return errors
+
+    @staticmethod
+    def _do_in_transaction(session, operations):
+        try:
+            for operation in operations:
+                operation(session)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+
 _shared_session = _LockedSession()
+_read_session = _ThreadReadSession()
+_db_writer = _DbWriter()
 
 
 def get_session():
     return _shared_session
 
 
+def get_read_session():
+    """
+    :return: resource to get (with "with") a session to read the database
+    """
+    return _read_session
+
+
+def get_db_writer():
+    return _db_writer
+
+
 def get_db_version(session):
     """
     :param session: actually it is a sqlalchemy session
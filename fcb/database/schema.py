@@ -1,6 +1,6 @@
 import datetime
 
-from sqlalchemy import Column, DateTime, String, Integer, Float, ForeignKey, func
+from sqlalchemy import Column, DateTime, String, Integer, BigInteger, Float, ForeignKey, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.orm.exc import NoResultFound
@@ -10,6 +10,12 @@ from fcb.database import settings
 
 Base = declarative_base()
 
+# version of the schema defined here (version 4 adds the indexes and digest_cache table, version 5 the prefix
+# compressed uploaded paths, version 6 the 64 bits digest_cache columns, see fcb.database.upgrade)
+DB_VERSION = 6
+# versions of databases the programs can work with (older versions can be upgraded with fcb-db-upgrade)
+SUPPORTED_DB_VERSIONS = (3, 4, 5, DB_VERSION)
+
 
 class ProgramInformation(Base):
     """
@@ -25,18 +31,37 @@ class ProgramInformation(Base):
 class UploadedPaths(Base):
     """
     Information about paths known to be uploaded
+    Note: only used by databases previous to version 5 (see UploadedDirectory and UploadedName)
     """
     __tablename__ = 'uploaded_paths'
     path = Column(UnicodeText, primary_key=True)
 
 
+class UploadedDirectory(Base):
+    """
+    Directory of paths known to be uploaded (each directory is saved once, its files are UploadedName)
+    """
+    __tablename__ = 'uploaded_directories'
+    id = Column(Integer, primary_key=True)
+    path = Column(UnicodeText, unique=True)
+
+
+class UploadedName(Base):
+    """
+    Name of a path known to be uploaded (the path is the directory path joined with the name)
+    """
+    __tablename__ = 'uploaded_names'
+    directory_id = Column(Integer, ForeignKey(UploadedDirectory.id), primary_key=True)
+    name = Column(UnicodeText, primary_key=True)
+
+
 class UploadedFile(Base):
     """
     Information about files that have been uploaded
     """
     __tablename__ = 'uploaded_files'
     id = Column(Integer, primary_key=True)
-    sha1 = Column(String)
+    sha1 = Column(String, index=True)
     file_name = Column(UnicodeText)
     fragment_count = Column(Integer)
     upload_date = Column(DateTime, default=datetime.datetime.utcnow())
@@ -67,11 +92,12 @@ class FilesContainer(Base):
     """
     __tablename__ = 'files_containers'
     id = Column(Integer, primary_key=True)
-    sha1 = Column(String)  # SHA1 of the file container
-    file_name = Column(String)  # name of the container file
+    sha1 = Column(String, index=True)  # SHA1 of the file container
+    file_name = Column(String, index=True)  # name of the container file
     encryption_key = Column(String)  # key used to encrypt the container
     container_size = Column(Integer)  # container file size
-    upload_date = Column(DateTime, default=datetime.datetime.utcnow())  # date when the container file was uploaded
+    # date when the container file was uploaded
+    upload_date = Column(DateTime, default=datetime.datetime.utcnow(), index=True)
 
     files_destinations = relationship("FilesDestinations", backref="file_containers")
 
@@ -87,7 +113,7 @@ class FileFragment(Base):
     fragment_number = Column(Integer)  # ordinal of the fragment
     upload_date = Column(DateTime, default=datetime.datetime.utcnow())  # date when the container file was uploaded
 
-    file_id = Column(Integer, ForeignKey(UploadedFile.id))
+    file_id = Column(Integer, ForeignKey(UploadedFile.id), index=True)
     file = relationship(UploadedFile, backref="fragments")
 
 
@@ -105,7 +131,7 @@ class FilesDestinations(Base):
     successfully the destination.
     The type of information held depend on the destination type.
     '''
-    verification_info = Column(String, nullable=True)
+    verification_info = Column(String, nullable=True, index=True)
 
     destination = relationship(Destination, backref="files_destinations")
 
@@ -155,18 +181,37 @@ class CheckerState(Base):
     last_checked_time = Column(Float)
 
 
+class CachedDigest(Base):
+    """
+    sha1 of a file, valid while the file stat (device, inode, size and modification time) doesn't change
+    (see fcb.database.digest_cache)
+    """
+    __tablename__ = 'digest_cache'
+    path = Column(UnicodeText, primary_key=True)
+    device = Column(BigInteger)
+    inode = Column(BigInteger)
+    size = Column(BigInteger)
+    mtime_ns = Column(BigInteger)  # modification time in nanoseconds
+    sha1 = Column(String)
+
+
 def main():
+    import sys
     from sqlalchemy import create_engine
     from sqlalchemy.orm import sessionmaker
 
-    engine = create_engine(settings.Definitions.connect_string)
+    connect_string = settings.Definitions.connect_string
+    if len(sys.argv) > 1:  # uses the database of the configuration file
+        from fcb.utils.Settings import Settings
+        connect_string = Settings(sys.argv[1]).database.connect_string
+    engine = create_engine(connect_string)
     Base.metadata.create_all(engine)
 
     # save version information
     Session = sessionmaker(bind=engine)
 
     session = Session()
-    session.add(ProgramInformation(name="db_version", value="3"))
+    session.add(ProgramInformation(name="db_version", value=str(DB_VERSION)))
 
     session.commit()
 
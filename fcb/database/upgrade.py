@@ -0,0 +1,104 @@
+"""
+In place upgrade of databases created by previous versions to the current schema version
+
+From version 3 to 4: creates the digest_cache table and the indexes of the columns used to query the database
+From version 4 to 5: moves the uploaded paths to the prefix compressed tables (see fcb.database.uploaded_paths)
+From version 5 to 6: recreates the digest_cache table with 64 bits columns (the cached digests are lost, SQLite tables
+                     are kept as its integers already are 64 bits)
+"""
+import sys
+
+from sqlalchemy import inspect
+
+from fcb.database import uploaded_paths
+from fcb.database.helpers import get_db_version, get_session, configure_database
+from fcb.database.schema import Base, CachedDigest, ProgramInformation, UploadedPaths, DB_VERSION
+from fcb.utils.Settings import Settings
+from fcb.utils.log_helper import get_logger_module
+
+_log = get_logger_module("db_upgrade")
+
+
+def _upgrade_from_3(session):
+    bind = session.connection()
+    CachedDigest.__table__.create(bind=bind, checkfirst=True)
+    inspector = inspect(bind)
+    for table in Base.metadata.sorted_tables:
+        existing = set(index["name"] for index in inspector.get_indexes(table.name))
+        for index in table.indexes:
+            if index.name not in existing:
+                _log.info("Creating index '%s'", index.name)
+                index.create(bind=bind)
+
+
+def _upgrade_from_4(session):
+    uploaded_paths.create_tables(session)
+    paths = [path for path, in session.query(UploadedPaths.path)]
+    _log.info("Moving %d uploaded paths", len(paths))
+    if paths:
+        uploaded_paths.save_paths(session, paths)
+        session.query(UploadedPaths).delete(synchronize_session=False)
+
+
+def _upgrade_from_5(session):
+    bind = session.connection()
+    if bind.dialect.name == "sqlite":
+        return
+    _log.info("Recreating table '%s'", CachedDigest.__tablename__)
+    CachedDigest.__table__.drop(bind=bind, checkfirst=True)
+    CachedDigest.__table__.create(bind=bind)
+
+
+# version -> function which upgrades a database of that version to the next one
+_upgrades = {
+    3: _upgrade_from_3,
+    4: _upgrade_from_4,
+    5: _upgrade_from_5,
+}
+
+
+def upgrade(session):
+    """
+    Upgrades the database to the current schema version (the session is not committed)
+    :return: the version the database had
+    """
+    db_version = get_db_version(session)
+    version = db_version
+    while version != DB_VERSION:
+        if version not in _upgrades:
+            raise ValueError("Database version %d can't be upgraded to version %d" % (db_version, DB_VERSION))
+        _log.info("Upgrading database from version %d to %d", version, version + 1)
+        _upgrades[version](session)
+        version += 1
+        session \
+            .query(ProgramInformation) \
+            .filter(ProgramInformation.name == "db_version") \
+            .update({ProgramInformation.value: str(version)}, synchronize_session=False)
+    return db_version
+
+
+def main():
+    # noinspection PyUnresolvedReferences
+    import fcb.log_configuration
+
+    if len(sys.argv) > 2:
+        _log.error("Usage: %s [<config_file>] (upgrades the database of the configuration file, data.db of the current "
+                   "directory by default)", sys.argv[0])
+        exit(1)
+    if len(sys.argv) == 2:
+        configure_database(Settings(sys.argv[1]).database)
+
+    with get_session() as session:
+        try:
+            db_version = upgrade(session)
+        except ValueError as e:
+            _log.error("Failed execution: %s", e)
+            exit(1)
+    if db_version == DB_VERSION:
+        _log.info("Database already is version %d", DB_VERSION)
+    else:
+        _log.info("Database upgraded from version %d to %d", db_version, DB_VERSION)
+
+
+if __name__ == '__main__':
+    main()
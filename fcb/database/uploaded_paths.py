@@ -0,0 +1,96 @@
+"""
+Paths known to be uploaded (see PathFilter)
+
+Paths are saved prefix compressed: each directory is saved once (UploadedDirectory) and each path as the name it has
+in its directory (UploadedName). Databases previous to version 5 have the whole paths in UploadedPaths, they are still
+read (and moved to the new tables by fcb-db-upgrade).
+"""
+from sqlalchemy import and_, or_
+
+from fcb.database.schema import UploadedPaths, UploadedDirectory, UploadedName
+
+# maximum amount of values in an "IN" query (SQLite limits the amount of parameters of a statement to 999)
+_MAX_QUERY_PARAMETERS = 500
+
+
+def split_path(path):
+    """
+    :return: (directory, name) of the (unicode) path
+    """
+    separator = path.rfind(u"/")
+    if separator < 0:
+        return u"", path
+    return path[:separator] if separator > 0 else u"/", path[separator + 1:]
+
+
+def _subtree_filter(column, directory):
+    """
+    :return: filter of the column values which are the directory or paths under it (a range, so indexes are used)
+    """
+    prefix = directory if directory.endswith(u"/") else directory + u"/"
+    # "0" is the character following "/"
+    return or_(column == directory, and_(column >= prefix, column < prefix[:-1] + u"0"))
+
+
+def create_tables(session):
+    """
+    Creates the tables if they don't exist (databases created by previous versions don't have them)
+    """
+    for table in (UploadedDirectory.__table__, UploadedName.__table__):
+        table.create(bind=session.connection(), checkfirst=True)
+
+
+def load_paths(session, directory, recursive=True):
+    """
+    :param directory: (unicode) path of the directory
+    :param recursive: if True, loads the paths of its subdirectories too
+    :return: dict directory -> set of names of the paths known to be uploaded
+    """
+    directory = directory.rstrip(u"/") or directory[:1]  # keeps "/" (and "", the current directory)
+    paths = {}
+    query = session \
+        .query(UploadedDirectory.path, UploadedName.name) \
+        .join(UploadedName, UploadedName.directory_id == UploadedDirectory.id)
+    query = query.filter(_subtree_filter(UploadedDirectory.path, directory) if recursive
+                         else UploadedDirectory.path == directory)
+    for path, name in query:
+        paths.setdefault(path, set()).add(name)
+
+    legacy_filter = _subtree_filter(UploadedPaths.path, directory) if directory \
+        else UploadedPaths.path.notlike(u"%/%")
+    for path, in session.query(UploadedPaths.path).filter(legacy_filter):
+        path_directory, name = split_path(path)
+        if recursive or path_directory == directory:
+            paths.setdefault(path_directory, set()).add(name)
+    return paths
+
+
+def _get_directory_ids(session, directories):
+    ids = {}
+    for start in xrange(0, len(directories), _MAX_QUERY_PARAMETERS):
+        ids.update(session
+                   .query(UploadedDirectory.path, UploadedDirectory.id)
+                   .filter(UploadedDirectory.path.in_(directories[start:start + _MAX_QUERY_PARAMETERS])))
+    return ids
+
+
+def save_paths(session, paths):
+    """
+    Saves the (unicode) paths with a few bulk statements (paths already saved are ignored)
+    """
+    names_by_directory = {}
+    for path in paths:
+        directory, name = split_path(path)
+        names_by_directory.setdefault(directory, set()).add(name)
+
+    directory_ids = _get_directory_ids(session, names_by_directory.keys())
+    new_directories = [directory for directory in names_by_directory if directory not in directory_ids]
+    if new_directories:
+        session.execute(UploadedDirectory.__table__.insert(), [dict(path=directory) for directory in new_directories])
+        directory_ids.update(_get_directory_ids(session, new_directories))
+
+    insert = UploadedName.__table__.insert()
+    if session.get_bind().dialect.name == "sqlite":
+        insert = insert.prefix_with("OR IGNORE")
+    session.execute(insert, [dict(directory_id=directory_ids[directory], name=name)
+                             for directory, names in names_by_directory.iteritems() for name in names])
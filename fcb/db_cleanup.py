@@ -1,6 +1,7 @@
 import sys
 from fcb.checker.cleanup.helper import delete_unverified_uploads
 from fcb.checker.settings import Configuration
+from fcb.database.helpers import configure_database
 from fcb.utils.log_helper import get_logger_module
 
 
@@ -15,6 +16,7 @@ def main():
         exit(1)
 
     conf = Configuration(sys.argv[1])
+    configure_database(conf.database)
 
     destinations = [mail.user for mail in conf.mail_confs] + \
                    [("mega: " + mega.user) for mega in conf.mega_confs]  # FIXME dependent on cur impl
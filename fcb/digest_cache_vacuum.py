@@ -0,0 +1,32 @@
+import sys
+
+from fcb.database.digest_cache import vacuum
+from fcb.database.helpers import get_session, configure_database
+from fcb.utils.Settings import Settings
+from fcb.utils.log_helper import get_logger_module
+
+
+def main():
+    # noinspection PyUnresolvedReferences
+    import log_configuration
+
+    log = get_logger_module('digest_cache_vacuum')
+
+    args = sys.argv[1:]
+    config_file = None
+    if len(args) > 1 and args[0] == "-c":
+        config_file = args[1]
+        args = args[2:]
+    if len(args) > 1 or args[:1] == ["-c"]:
+        log.error("Usage: %s [-c <config_file>] [<path prefix>] (uses the database of the configuration file, data.db of"
+                  " the current directory by default)", sys.argv[0])
+        exit(1)
+    if config_file is not None:
+        configure_database(Settings(config_file).database)
+
+    deleted = vacuum(get_session(), path_prefix=args[0] if args else None)
+    log.info("Done (%d cached digests of missing or changed files deleted)", deleted)
+
+
+if __name__ == '__main__':
+    main()
@@ -6,13 +6,14 @@ import sys
 from circuits import Component, Debugger, BaseComponent
 from circuits.core.handlers import handler
 
-from fcb.database.helpers import get_session
-from fcb.database.helpers import get_db_version
-from fcb.database.schema import FilesDestinations
-from fcb.framework import events, workers
+from fcb.database.helpers import get_read_session, get_db_writer
+from fcb.database.helpers import get_db_version, configure_database
+from fcb.database.schema import FilesDestinations, DB_VERSION, SUPPORTED_DB_VERSIONS
+from fcb.framework import events, workers, dispatch
 from fcb.framework.Marker import MarkerTask, Marks
 from fcb.framework.events import FlushPendings, NewInputPath
 from fcb.framework.workflow.Pipeline import Pipeline
+from fcb.framework.workflow.TempSpace import TempSpaceController
 from fcb.framework.workflow.WorkRate import WorkRateController
 from fcb.processing.filesystem.Cleaner import Cleaner
 from fcb.processing.filters.FileSizeFilter import FileSizeFilter
@@ -20,7 +21,7 @@ from fcb.processing.filters.PathFilter import PathFilter
 from fcb.processing.models.Quota import Quota
 from fcb.processing.filters.QuotaFilter import QuotaFilter
 from fcb.processing.filters.AlreadyProcessedFilter import AlreadyProcessedFilter
-from fcb.processing.transformations.Cipher import Cipher
+from fcb.processing.transformations.Cipher import Cipher, CipherStreamTransformation
 from fcb.processing.filesystem.Compressor import Compressor
 from fcb.processing.filesystem.FileReader import FileReader
 import fcb.processing.filesystem.Settings as FilesystemSettings
@@ -60,27 +61,42 @@ class App(Component):
 
         fs_settings = FilesystemSettings.Settings(
             sender_settings_list=sender_settings,
-            stored_files_settings=settings.stored_files)
+            stored_files_settings=settings.stored_files,
+            performance_settings=settings.performance)
 
         global_quota = Quota(
             quota_limit=settings.limits.max_shared_upload_per_day.in_bytes,
             used_quota=FilesDestinations.get_bytes_uploaded_in_date(session))
 
         # The pipeline goes:
-        #    read files -> filter -> compress -> [cipher] -> send -> log -> finish
+        #    read files -> filter -> compress -> [cipher] -> send (to every destination at once) -> log -> finish
         rate_limiter = None
         if settings.limits.rate_limits is not None:
             rate_limiter = trickle.TrickleBwShaper(trickle.Settings(settings.limits.rate_limits))
 
+        workers.manager.configure(settings.performance.worker_pools)
+
+        temp_space_controller = \
+            TempSpaceController(max_temp_space=settings.performance.max_temp_space.in_bytes,
+                                min_free_temp_space=settings.performance.min_free_temp_space.in_bytes)
+        temp_space_controller.register(self)
         work_rate_controller = \
-            WorkRateController(max_pending_for_processing=settings.performance.max_pending_for_processing)
+            WorkRateController(max_pending_for_processing=settings.performance.max_pending_for_processing,
+                               stages_settings=settings.performance.flow_stages,
+                               temp_space_controller=temp_space_controller)
         work_rate_controller.register(self)
+        path_filter = None
+        if settings.performance.filter_by_path:
+            path_filter = PathFilter()
+            path_filter.register(self)
+
         files_reader = \
-            FileReader(path_filter_list=settings.exclude_paths.path_filter_list,
-                       work_rate_controller=work_rate_controller)
+            FileReader(exclude_paths=settings.exclude_paths,
+                       work_rate_controller=work_rate_controller,
+                       path_filter=path_filter.is_path_processed if path_filter is not None else None)
 
-        if settings.performance.filter_by_path:
-            PathFilter().register(self)
+        # when transformations are streamed, the container is encrypted while it is generated by the Compressor
+        should_stream_cipher = settings.stored_files.should_encrypt and settings.stored_files.stream_transformations
 
         self.pipeline \
             .add(files_reader, disable_on_shutdown=True) \
@@ -90,18 +106,24 @@ class App(Component):
                  disable_on_shutdown=True) \
             .add(AlreadyProcessedFilter() if settings.stored_files.should_check_already_sent else None,
                  disable_on_shutdown=True) \
-            .add(Compressor(fs_settings=fs_settings, global_quota=global_quota), disable_on_shutdown=True) \
-            .add(Cipher() if settings.stored_files.should_encrypt else None, disable_on_shutdown=True) \
-            .add(ToImage() if settings.to_image.enabled else None, disable_on_shutdown=True) \
+            .add(Compressor(fs_settings=fs_settings, global_quota=global_quota,
+                            stream_transformation=CipherStreamTransformation(
+                                mode=settings.stored_files.cipher_mode,
+                                workers=settings.performance.cipher_workers) if should_stream_cipher else None),
+                 disable_on_shutdown=True) \
+            .add(Cipher(mode=settings.stored_files.cipher_mode, workers=settings.performance.cipher_workers)
+                 if settings.stored_files.should_encrypt and not should_stream_cipher else None,
+                 disable_on_shutdown=True) \
+            .add(ToImage(chunked=settings.to_image.chunked) if settings.to_image.enabled else None,
+                 disable_on_shutdown=True) \
             .add(MarkerTask(mark=Marks.sending_stage), disable_on_shutdown=True) \
             .add(SlowSender(settings=settings.slow_sender) if settings.slow_sender is not None else None,
                  disable_on_shutdown=True) \
-            .add_in_list([MailSender(mail_conf=sender_conf) for sender_conf in settings.mail_accounts]
-                         if settings.mail_accounts else None) \
-            .add(ToDirectorySender(dir_path=settings.dir_dest.path) if settings.dir_dest is not None else None) \
-            .add(MegaSender(settings=settings.mega_settings, rate_limiter=rate_limiter)
-                 if settings.mega_settings is not None else None) \
-            .add(FakeSender() if settings.add_fake_sender else None) \
+            .add_fan_out([MailSender(mail_conf=sender_conf) for sender_conf in settings.mail_accounts] +
+                         [ToDirectorySender(dir_path=settings.dir_dest.path) if settings.dir_dest is not None else None,
+                          MegaSender(settings=settings.mega_settings, rate_limiter=rate_limiter)
+                          if settings.mega_settings is not None else None,
+                          FakeSender() if settings.add_fake_sender else None]) \
             .add(SentLog(sent_log=settings.sent_files_log)) \
             .add(Cleaner(delete_temp_files=settings.stored_files.delete_temp_files)) \
             .add(MarkerTask(mark=Marks.end_of_pipeline))
@@ -130,17 +152,21 @@ def main():
         exit(1)
 
     settings = Settings(sys.argv[1])
+    configure_database(settings.database)
 
-    with get_session() as session:
+    with get_read_session() as session:
         db_version = get_db_version(session)
-        if db_version != 3:
-            log.error("Invalid database version (%d). 3 expected" % db_version)
+        if db_version not in SUPPORTED_DB_VERSIONS:
+            log.error("Invalid database version (%d). One of %s expected" % (db_version, SUPPORTED_DB_VERSIONS))
             session.close()
             exit(1)
+        if db_version != DB_VERSION:
+            log.warning("Database version %d is supported but slower, upgrade it to version %d with fcb-db-upgrade",
+                        db_version, DB_VERSION)
 
         app = App(settings, session)
 
-        workers.manager.register_app(app)
+        dispatch.manager.register_app(app)
 
         in_files = sys.argv[2:]
         PipelineFlusher(remaining_inputs=len(in_files)).register(app)
@@ -160,6 +186,7 @@ def main():
         app += Debugger()
 
     app.run()
+    get_db_writer().flush()
     log.debug("finished processing")
 
 
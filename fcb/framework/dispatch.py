@@ -0,0 +1,115 @@
+"""
+Lightweight dispatching to the main loop (the thread handling the circuits events)
+
+Functions queued from any thread (e.g. the results of HeavyPipelineTask handed on by the worker pools threads) are
+called in batches by the main loop: a single event is fired for all the functions queued while it is pending.
+
+Bookkeeping events fired for every file (e.g. FileConsumed) are coalesced: their items are buffered and a single event
+with the list of items is fired for all the ones added while it is pending (see EventCoalescer).
+"""
+import threading
+from collections import deque
+
+from circuits import BaseComponent, Event, handler
+
+from fcb.utils.log_helper import get_logger_module
+
+_log = get_logger_module("dispatch")
+
+
+class _MainLoopCalls(Event):
+    pass
+
+
+class _MainLoopCaller(BaseComponent):
+    _dispatcher = None
+
+    def init(self, dispatcher):
+        self._dispatcher = dispatcher
+
+    @handler(_MainLoopCalls.__name__)
+    def _on_calls(self):
+        self._dispatcher.call_pending()
+
+
+class _Dispatcher(object):
+    _caller = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = deque()
+        self._is_scheduled = False
+
+    def register_app(self, app):
+        self._caller = _MainLoopCaller(dispatcher=self)
+        self._caller.register(app)
+
+    def call_soon(self, function, *args):
+        """
+        Queues the function to be called (with args) by the main loop (it is called right away if there is no app)
+        """
+        if self._caller is None:
+            function(*args)
+            return
+        with self._lock:
+            self._pending.append((function, args))
+            if self._is_scheduled:
+                return
+            self._is_scheduled = True
+        self._caller.fire(_MainLoopCalls())
+
+    def call_pending(self):
+        """
+        Calls the functions queued so far (the ones queued by them are called by the next event)
+        """
+        with self._lock:
+            pending = self._pending
+            self._pending = deque()
+            self._is_scheduled = False
+        for function, args in pending:
+            try:
+                function(*args)
+            except Exception:
+                _log.exception("Failed to call %s in main loop", function)
+
+
+manager = _Dispatcher()
+
+
+class EventCoalescer(object):
+    """
+    Fires events whose only argument is a list of items, one for all the items added while it is pending
+    """
+
+    def __init__(self, event_class):
+        """
+        :param event_class: class of the events fired (built with the list of items)
+        """
+        self._event_class = event_class
+        self._lock = threading.Lock()
+        self._items = []
+        self._component = None
+
+    def add(self, component, item):
+        """
+        Adds the item to the next event (fired by the component from the main loop)
+        """
+        with self._lock:
+            self._items.append(item)
+            if self._component is not None:
+                return
+            self._component = component
+        manager.call_soon(self.flush)
+
+    def flush(self):
+        """
+        Fires the event with the items added so far (if any). Events fired by the same thread after the flush are
+        handled after it
+        """
+        with self._lock:
+            items = self._items
+            component = self._component
+            self._items = []
+            self._component = None
+        if items:
+            component.fire(self._event_class(items))
@@ -1,9 +1,11 @@
 from circuits.core.events import Event
 
+from fcb.framework.dispatch import EventCoalescer
+
 
 class FileInfoAlreadyProcessed(Event):
     """
-    :argument FileInfo
+    :argument list of FileInfo (coalesced, see files_already_processed)
     """
 
 
@@ -20,6 +22,13 @@ class NewInputPath(Event):
     complete = True
 
 
+class ContainerFileStarted(Event):
+    """
+    Represents the start of the generation of a container file (NewContainerFile is fired once it is generated)
+    :argument Block
+    """
+
+
 class NewContainerFile(Event):
     """
     :argument Block
@@ -28,14 +37,14 @@ class NewContainerFile(Event):
 
 class FilteredFile(Event):
     """
-    :argument FileInfo/Block
+    :argument list of FileInfo (coalesced, see filtered_files)
     """
 
 
 class FileConsumed(Event):
     """
-    Represents a file info consumed (will be transformed or is buffered)
-    :argument FileInfo
+    Represents file infos consumed (will be transformed or are buffered)
+    :argument list of FileInfo (coalesced, see consumed_files)
     """
 
 
@@ -61,8 +70,21 @@ class TransmissionQuotaReached(SystemShouldStop):
     pass
 
 
+class SentContainerNotSaved(SystemShouldStop):
+    """
+    Represents the failure to save a sent container in database (going on would send more containers which may not be
+    restored)
+    """
+
+
 class Mark(Event):
     """
     :argument Mark
     :argument Data (processed in pipeline)
     """
+
+
+# bookkeeping events fired for every file are coalesced, add(component, file_info) to them instead of firing the events
+files_already_processed = EventCoalescer(FileInfoAlreadyProcessed)
+filtered_files = EventCoalescer(FilteredFile)
+consumed_files = EventCoalescer(FileConsumed)
@@ -1,101 +1,142 @@
-from circuits import Worker
+"""
+Pools of workers where the heavy work of the pipeline tasks is done (see HeavyPipelineTask)
 
+Pools are identified by name. The built-in ones always exist (with a single thread unless configured otherwise):
+    default: used by tasks without a more specific pool
+    hard_drive: used by tasks doing I/O to hard drive
+    upload: used by tasks uploading to Internet (destinations are assumed uncapped, so they share it)
+Other pools (e.g. "compression", "mail" or "mail:<account>") exist only if configured (see <performance><worker_pool>
+in the settings). Each task has a list of candidate pool names and uses the first one which exists.
 
-class _WorkerPool(object):
-    """
-    Represents an circuits.worker poll
-    """
-    _register_component = None
-
-    def register_workers(self, app):
-        raise NotImplementedError()
-
-    def get_worker(self):
-        raise NotImplementedError()
-
+Pools run the tasks in their own threads, which take them from a queue (no circuits event is fired for a task, its
+results are handed back to the main loop by the task, see dispatch).
+"""
+import Queue
+import threading
+from collections import deque
 
-class _HardDriveWorkerPool(_WorkerPool):
-    """
-    Workers to do I/O to hard drive
-
-    TODO: this can be differentiated by HD device destination
-    """
-    _worker = None
+from fcb.utils.Settings import InvalidSettings
+from fcb.utils.log_helper import get_logger_module
 
-    def __init__(self):
-        super(_HardDriveWorkerPool, self).__init__()
-        # TODO let the amount of threads be configurable
-        self._worker = Worker(channel=self.__class__.__name__, workers=1)
+_log = get_logger_module("workers")
 
-    def get_worker(self):
-        return self._worker
+THREAD_KIND = "thread"
 
-    def register_workers(self, app):
-        self._worker.register(app)
+DEFAULT_POOL = "default"
+HARD_DRIVE_POOL = "hard_drive"
+UPLOAD_POOL = "upload"
 
 
-class _UncappedInternetUploadWorkerPool(_WorkerPool):
-    """
-    Worker to upload things to Internet when the destination is uncapped
+class _WorkerPool(object):
     """
-    _worker = None
+    Represents a pool of threads
 
-    def __init__(self):
-        super(_UncappedInternetUploadWorkerPool, self).__init__()
-        # TODO let the amount of threads be configurable
-        self._worker = Worker(channel=self.__class__.__name__, workers=1)
-
-    def get_worker(self):
-        return self._worker
-
-    def register_workers(self, app):
-        self._worker.register(app)
-
-
-class _DefaultWorkerPool(_WorkerPool):
-    """
-    Worker to use when no more specific is defined
+    At most size + queue_size tasks are handed to the threads (queue_size 0 means no limit), the remaining wait in the
+    pool until one of them is done
     """
-    _worker = None
 
-    def __init__(self):
-        super(_DefaultWorkerPool, self).__init__()
-        # TODO let the amount of threads be configurable
-        self._worker = Worker(channel=self.__class__.__name__, workers=1)
-
-    def get_worker(self):
-        return self._worker
-
-    def register_workers(self, app):
-        self._worker.register(app)
+    def __init__(self, name, size=1, queue_size=0):
+        self.name = name
+        self.size = size
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._in_worker = 0
+        self._waiting = deque()
+        self._tasks = Queue.Queue()
+        self._threads = []
+
+    def submit(self, function, *args):
+        """
+        Calls function(*args) in a thread of the pool (or keeps it until there is room for it)
+        Every submitted task must call task_done once it finishes
+        """
+        with self._lock:
+            if not self._threads:  # started when used, so it can be configured before
+                self._start_threads()
+            if self.queue_size and self._in_worker >= self.size + self.queue_size:
+                self._waiting.append((function, args))
+                return
+            self._in_worker += 1
+        self._tasks.put((function, args))
+
+    def task_done(self):
+        with self._lock:
+            if not self._waiting:
+                self._in_worker -= 1
+                return
+            function, args = self._waiting.popleft()
+        self._tasks.put((function, args))
+
+    def _start_threads(self):
+        for number in xrange(self.size):
+            thread = threading.Thread(target=self._work, name="%s-%d" % (self.name, number))
+            thread.daemon = True  # pending tasks don't prevent the application from finishing
+            thread.start()
+            self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            function, args = self._tasks.get()
+            try:
+                function(*args)
+            except Exception:
+                _log.exception("Task of worker pool '%s' failed", self.name)
 
 
 class _PoolsManager(object):
-    _app = None
-    _registered_pools = []
+    _registered_pools = None
 
-    def register_app(self, app):
-        for pool in self._registered_pools:
-            pool.register_workers(app)
+    def __init__(self):
+        self._registered_pools = {}
 
     def add_pool(self, pool):
-        if self._app is not None:
-            pool.register_workers(self._app)
-        self._registered_pools.append(pool)
+        self._registered_pools[pool.name] = pool
+
+    def configure(self, pools_settings):
+        """
+        Creates (or resizes the built-in) pools as configured
+        :param pools_settings: list of performance.worker_pool settings
+        """
+        configured = set()
+        for pool_settings in pools_settings:
+            if pool_settings.name in configured:
+                raise InvalidSettings("Worker pool '%s' configured more than once" % pool_settings.name)
+            if pool_settings.kind != THREAD_KIND:
+                # data handled by the tasks (e.g. blocks) isn't picklable, CPU intensive work is done in processes by
+                # the tasks which can (see performance.compression_workers and cipher_workers)
+                raise InvalidSettings("Invalid kind '%s' for worker pool '%s' (the only valid kind is %s)" %
+                                      (pool_settings.kind, pool_settings.name, THREAD_KIND))
+            if pool_settings.size < 1 or pool_settings.queue_size < 0:
+                raise InvalidSettings("Invalid size or queue size for worker pool '%s'" % pool_settings.name)
+            configured.add(pool_settings.name)
+
+            pool = self._registered_pools.get(pool_settings.name)
+            if pool is None:
+                self.add_pool(_WorkerPool(pool_settings.name, pool_settings.size, pool_settings.queue_size))
+            else:
+                pool.size = pool_settings.size
+                pool.queue_size = pool_settings.queue_size
+            _log.debug("Worker pool '%s' configured with %d threads (queue size %d)",
+                       pool_settings.name, pool_settings.size, pool_settings.queue_size)
+
+    def get_pool(self, *names):
+        """
+        :return: the first existing pool of names (the default one if none exists)
+        """
+        for name in names:
+            if name in self._registered_pools:
+                return self._registered_pools[name]
+        return self._registered_pools[DEFAULT_POOL]
 
 
 manager = _PoolsManager()
 
-default_worker_pool = _DefaultWorkerPool()
+default_worker_pool = _WorkerPool(DEFAULT_POOL)
 manager.add_pool(default_worker_pool)
 
 # global resources
-hd_worker_pool = _HardDriveWorkerPool()
+hd_worker_pool = _WorkerPool(HARD_DRIVE_POOL)
 manager.add_pool(hd_worker_pool)
 
-_uncapped_internet_worker_pool = _UncappedInternetUploadWorkerPool()
-manager.add_pool(_uncapped_internet_worker_pool)
-
-# currently all services are assumed as uncapped (thus, they share a worker)
-mail_sender_worker_pool = _uncapped_internet_worker_pool
-mega_sender_worker_pool = _uncapped_internet_worker_pool
+upload_worker_pool = _WorkerPool(UPLOAD_POOL)
+manager.add_pool(upload_worker_pool)
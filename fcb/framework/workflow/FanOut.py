@@ -0,0 +1,62 @@
+import threading
+
+from fcb.framework.workflow.PipelineTask import PipelineTask
+
+
+class _FanOutJoin(object):
+    """
+    Next task of the tasks of a FanOut, lets it know when they are done with a piece of data
+    """
+
+    def __init__(self, fan_out):
+        self._fan_out = fan_out
+
+    def handle_data(self, data):
+        self._fan_out.task_done(data)
+
+
+class FanOut(PipelineTask):
+    """
+    Hands each piece of data to several independent tasks at the same time, and hands it on to the next task once all
+    of them are done with it (so the time it takes is the one of the slowest task, not the sum of them)
+
+    Tasks must hand on the same data they received (e.g. SenderTask). Tasks can define accepts(data) to tell if the
+    data is for them (if they don't accept it, they aren't waited for).
+    """
+    _tasks = None
+
+    def do_init(self, tasks):
+        self._tasks = tasks
+        self._pending = {}  # id(data) -> amount of tasks still working on data
+        self._lock = threading.Lock()
+        join = _FanOutJoin(self)
+        for task in tasks:
+            task.next_task(join)
+
+    @property
+    def tasks(self):
+        return self._tasks
+
+    # override from PipelineTask
+    def process_data(self, data):
+        tasks = [task for task in self._tasks
+                 if not task.is_disabled and (not hasattr(task, "accepts") or task.accepts(data))]
+        if not tasks:
+            self.log.debug("No task accepts data %s", data)
+            return data
+
+        with self._lock:
+            self._pending[id(data)] = len(tasks)
+        for task in tasks:
+            task.handle_data(data)
+        return None
+
+    def task_done(self, data):
+        with self._lock:
+            remaining = self._pending[id(data)] - 1
+            if remaining == 0:
+                del self._pending[id(data)]
+            else:
+                self._pending[id(data)] = remaining
+        if remaining == 0:
+            self.hand_on_to_next_task(data)
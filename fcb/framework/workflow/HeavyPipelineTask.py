@@ -1,58 +1,51 @@
-from circuits import Event, task, BaseComponent
-from circuits.core.handlers import handler
-
+from fcb.framework import workers, dispatch
 from fcb.framework.workflow.PipelineTask import PipelineTask
 
 
-class _ToNextHandler(Event):
-    pass
-
-
-class _ToNextPasser(BaseComponent):
-    _to_next = None
-
-    def init(self, to_next_function):
-        self.channel = self.__class__.__name__ + str(id(self))
-        self._to_next = to_next_function
-
-    @handler(_ToNextHandler.__name__)
-    def _handle_to_next(self, block):
-        self._to_next(block)
-
-
 class HeavyPipelineTask(PipelineTask):
-    _to_next_channel = None
+    _worker_pool = None
 
     """
-    Represents a PipelineTask that requires a circuits.task to process its data
+    Represents a PipelineTask that requires a worker pool thread to process its data
+
+    The data is handed on to the next task from the main loop (see dispatch)
     """
 
+    # names of the worker pools the task can use (the first configured one is used, see workers)
+    worker_pool_names = (workers.DEFAULT_POOL,)
+
     def do_init(self, *args, **kwargs):
-        to_next = _ToNextPasser(to_next_function=lambda block: PipelineTask.hand_on_to_next_task(self, block))
-        self._to_next_channel = to_next.channel
-        to_next.register(self)
+        pass
 
     # override from PipelineTask
     def process_data(self, block):
         self.log.debug("New block to process: %s", block)
-        self.fire(task(self._do_task, block), self.get_worker_channel())  # get inside the event handling framework
-
-    def _do_task(self, block):
-        new_data = self.do_heavy_work(block)
+        pool = self.get_worker_pool()
+        pool.submit(self._do_task, pool, block)
+
+    def _do_task(self, pool, block):
+        try:
+            new_data = self.do_heavy_work(block)
+        finally:
+            pool.task_done()
         if new_data is not None:
             self.hand_on_to_next_task(new_data)
 
     # override from PipelineTask
     def hand_on_to_next_task(self, block):
-        # self.log.debug("Will fire to next handler with block %s", block)
-        self.fire(_ToNextHandler(block), self._to_next_channel)
+        dispatch.manager.call_soon(PipelineTask.hand_on_to_next_task, self, block)
 
-    def get_worker_channel(self):
+    def set_worker_pool(self, pool):
         """
-        Should be redefined by sub-classes if a special channel is required to communicate with the Worker
-        :return: the circuits channel which should be used to generate the task to do the heavy work
+        Assigns the pool where the heavy work is done (instead of the one selected by worker_pool_names)
         """
-        return None
+        self._worker_pool = pool
+
+    def get_worker_pool(self):
+        if self._worker_pool is None:
+            self._worker_pool = workers.manager.get_pool(*self.worker_pool_names)
+            self.log.debug("Will use worker pool '%s'", self._worker_pool.name)
+        return self._worker_pool
 
     def do_heavy_work(self, data):
         """
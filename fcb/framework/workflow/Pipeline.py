@@ -6,6 +6,7 @@ from circuits.core.events import signal
 
 from fcb.framework import events
 from fcb.framework.Marker import Marks
+from fcb.framework.workflow.FanOut import FanOut
 from fcb.utils.log_helper import get_logger_module
 
 
@@ -14,6 +15,7 @@ class _GlobalWorkflowController(BaseComponent):
 
     _should_stop = False
     _send_remaining = 0
+    _exit_code = 0
 
     @handler(events.Mark.__name__)
     def on_mark(self, mark, *_):
@@ -28,6 +30,10 @@ class _GlobalWorkflowController(BaseComponent):
         self._should_stop = True
         self.check_end_condition()
 
+    @handler(events.SentContainerNotSaved.__name__)
+    def on_sent_container_not_saved(self, *_):
+        self._exit_code = 1  # the execution failed (the stop is requested by the Pipeline)
+
     def check_end_condition(self):
         self.log.debug("Send remaining %d", self._send_remaining)
         if self._send_remaining == 0:
@@ -35,7 +41,7 @@ class _GlobalWorkflowController(BaseComponent):
 
     def _stop_if_required(self):
         if self._should_stop:
-            raise SystemExit(0)
+            raise SystemExit(self._exit_code)
 
     def _mark_new_sending(self):
         self._send_remaining += 1
@@ -71,6 +77,23 @@ class Pipeline(Component):
         task.register(self)
         return self
 
+    def add_fan_out(self, tasks, disable_on_shutdown=False):
+        """
+        Adds the tasks so they process each piece of data at the same time (see FanOut)
+        """
+        tasks = [task for task in tasks if task is not None] if tasks else []
+        if not tasks:
+            return self
+
+        fan_out = FanOut(tasks=tasks)
+        self.add(task=fan_out, disable_on_shutdown=disable_on_shutdown)
+        for task in tasks:
+            self.log.debug("Pipeline add fan out task: {}".format(str(task)))
+            if disable_on_shutdown:
+                self._to_disable_on_shutdown.append(task)
+            task.register(self)
+        return self
+
     def add_in_list(self, tasks, disable_on_shutdown=False):
         if tasks is None:
             return self
@@ -90,6 +113,10 @@ class Pipeline(Component):
         self.fire(events.FlushPendings())  # make sure everything remaining has been sent
         self.request_stop()
 
+    @handler(events.SentContainerNotSaved.__name__)
+    def _on_sent_container_not_saved(self, *_):
+        self.request_stop()
+
     def request_stop(self):
         for task in self._to_disable_on_shutdown:
             task.disable()
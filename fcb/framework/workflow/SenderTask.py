@@ -10,12 +10,12 @@ class SenderTask(HeavyPipelineTask):
     def do_heavy_work(self, block):
         """
         Note: Expects Compressor Block like objects
-        """
 
+        The block is returned whether it was sent or not (any failure, expected or not, is recorded in
+        block.failed_destinations) so the results of every sender can be joined (see FanOut)
+        """
         destinations = self.destinations()
-        ''' FIXME currently we return block whether it was correctly processed or not because MailSenders are chained
-            and not doing that would mean other wouldn't be able to try.'''
-        if not set(destinations).issubset(block.destinations):
+        if not self.accepts(block):
             self.log.debug("Block not for any of the associated destinations: %s", destinations)
         else:
             try:
@@ -27,10 +27,18 @@ class SenderTask(HeavyPipelineTask):
                 if verif_data is not None:
                     for destination in destinations:
                         block.destinations_verif_data[destination] = verif_data
-            except SendingError:
+            except Exception as e:  # not only SendingError, a lost block would never be joined
                 self.log.exception("Failed to send block (%s) to destination (%s)", block, destinations)
+                for destination in destinations:
+                    block.failed_destinations[destination] = str(e) or e.__class__.__name__
         return block
 
+    def accepts(self, block):
+        """
+        :return: True if the block should be sent by this sender
+        """
+        return set(self.destinations()).issubset(block.destinations)
+
     def destinations(self):
         raise NotImplementedError()
 
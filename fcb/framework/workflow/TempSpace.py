@@ -0,0 +1,116 @@
+import os
+import tempfile
+import time
+
+from circuits import BaseComponent, handler
+
+from fcb.framework.Marker import Marks
+from fcb.framework.events import FlushPendings, Mark, NewContainerFile, ContainerFileStarted
+from fcb.utils.log_helper import get_logger_module
+
+
+class TempSpaceController(BaseComponent):
+    """
+    Keeps track of the temporary files of the blocks being processed (their containers and transformations of them) and
+    tells if there is room for more work: the bytes held by those files must be under max_temp_space and the free
+    space of the temporary directory over min_free_temp_space (0 means no limit)
+
+    Blocks are tracked from their ContainerFileStarted to their end of pipeline mark (after the Cleaner removed their
+    files). The measures are refreshed on the events of the tracked blocks and, at most every _REFRESH_SECONDS, when
+    the space is checked (files keep being written while blocks are transformed)
+    """
+    # seconds the measures are reused by has_space
+    _REFRESH_SECONDS = 0.5
+
+    log = None
+    _max_temp_space = 0
+    _min_free_temp_space = 0
+    _temp_dir = None
+    _blocks = None
+    _refreshed_at = 0
+    _is_exhausted = False
+
+    def init(self, max_temp_space, min_free_temp_space, temp_dir=None):
+        """
+        :param max_temp_space: maximum bytes held by the temporary files (0 means no limit)
+        :param min_free_temp_space: minimum free bytes of the temporary directory (0 means no limit)
+        :param temp_dir: directory where temporary files are written (tempfile.gettempdir() if None)
+        """
+        self.log = get_logger_module(self.__class__.__name__)
+        self._max_temp_space = max_temp_space
+        self._min_free_temp_space = min_free_temp_space
+        self._temp_dir = temp_dir if temp_dir is not None else tempfile.gettempdir()
+        self._blocks = {}  # id(block) -> block
+        # gauges
+        self.held_bytes = 0
+        self.blocks_in_flight = 0
+        self.peak_held_bytes = 0
+        self.free_bytes = None
+        self.times_exhausted = 0
+
+    @property
+    def is_limited(self):
+        return self._max_temp_space != 0 or self._min_free_temp_space != 0
+
+    def has_space(self):
+        """
+        :return: True if more work can be done without exceeding the limits
+        """
+        if not self.is_limited:
+            return True
+        self._refresh_if_required()
+        is_exhausted = (self._max_temp_space != 0 and self.held_bytes >= self._max_temp_space) \
+            or (self._min_free_temp_space != 0 and self.free_bytes <= self._min_free_temp_space)
+        if is_exhausted != self._is_exhausted:
+            self._is_exhausted = is_exhausted
+            if is_exhausted:
+                self.times_exhausted += 1
+                self.log.info("Temporary space exhausted, waiting for it to be freed (%s)", self.summary())
+            else:
+                self.log.info("Temporary space available again (%s)", self.summary())
+        return not is_exhausted
+
+    def summary(self):
+        return "%d bytes held by %d blocks (peak %d), %s bytes free in '%s', exhausted %d times" % (
+            self.held_bytes, self.blocks_in_flight, self.peak_held_bytes,
+            "unknown" if self.free_bytes is None else str(self.free_bytes), self._temp_dir, self.times_exhausted)
+
+    @handler(ContainerFileStarted.__name__, NewContainerFile.__name__)
+    def _on_container(self, block):
+        self._blocks[id(block)] = block
+        self.blocks_in_flight = len(self._blocks)
+        self._refresh()
+
+    @handler(Mark.__name__)
+    def _on_marker_event(self, mark, block):
+        if mark == Marks.end_of_pipeline:
+            self._blocks.pop(id(block), None)
+            self.blocks_in_flight = len(self._blocks)
+        self._refresh()
+
+    @handler(FlushPendings.__name__)
+    def _on_flush(self, *_):
+        if self.is_limited:
+            self.log.info("Temporary space stats: %s", self.summary())
+
+    def _refresh_if_required(self):
+        if time.time() - self._refreshed_at >= self._REFRESH_SECONDS:
+            self._refresh()
+
+    def _refresh(self):
+        self._refreshed_at = time.time()
+        held_bytes = 0
+        for block in self._blocks.itervalues():
+            paths = set(file_info.path for file_info in block.all_gen_files)
+            writing_file_path = block.writing_file_path
+            if writing_file_path is not None:
+                paths.add(writing_file_path)
+            for path in paths:
+                try:
+                    held_bytes += os.path.getsize(path)
+                except OSError:
+                    pass  # not written yet or already removed
+        self.held_bytes = held_bytes
+        self.peak_held_bytes = max(self.peak_held_bytes, held_bytes)
+        stat = os.statvfs(self._temp_dir)
+        self.free_bytes = stat.f_bavail * stat.f_frsize
@@ -1,52 +1,286 @@
-from circuits import BaseComponent, handler
+import time
+from collections import OrderedDict
+
+from circuits import BaseComponent, Event, handler
 
 from fcb.framework.Marker import Marks
-from fcb.framework.events import FilteredFile, PathConsumed, Mark, FileConsumed, NewContainerFile
+from fcb.framework.events import FilteredFile, PathConsumed, Mark, FileConsumed, NewContainerFile, FlushPendings
+from fcb.utils.Settings import InvalidSettings
 from fcb.utils.log_helper import get_logger_module
 
+# pipeline stages (see WorkRateController)
+READ_STAGE = "read"
+COMPRESS_STAGE = "compress"
+TRANSFORM_STAGE = "transform"
+SEND_STAGE = "send"
+STAGES = (READ_STAGE, COMPRESS_STAGE, TRANSFORM_STAGE, SEND_STAGE)
+
+# other reasons why slots are not given (see WorkRateController.waits)
+MAX_PENDING_REASON = "max_pending_for_processing"
+TEMP_SPACE_REASON = "temp_space"
+
+
+class CreditsAvailable(Event):
+    """
+    Fired when credits are returned to the WorkRateController and a slot was previously denied
+    """
+
+
+class _WaitersResumed(Event):
+    """
+    Fired once the waiters of CreditsAvailable are resumed (see WorkRateController._on_credits_notified)
+    """
+
+
+class FlowStage(object):
+    """
+    Credits (items and bytes) budget of a pipeline stage and what is currently in it
+    """
+
+    def __init__(self, name, max_items=0, max_bytes=0):
+        """
+        :param max_items: maximum amount of items in the stage (0 means no limit)
+        :param max_bytes: maximum amount of bytes in the stage (0 means no limit)
+        """
+        self.name = name
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.items = 0
+        self.bytes = 0
+        self.peak_items = 0
+        self.peak_bytes = 0
+
+    @property
+    def is_empty(self):
+        return self.items == 0
+
+    def is_full(self):
+        """
+        :return: True if the stage has no credits left
+        """
+        return (self.max_items != 0 and self.items >= self.max_items) or \
+               (self.max_bytes != 0 and self.bytes >= self.max_bytes)
+
+    def can_take(self, size):
+        """
+        :return: True if an item of the size fits in the budget (an empty stage takes any item)
+        """
+        if self.is_empty:
+            return True
+        return (self.max_items == 0 or self.items < self.max_items) and \
+               (self.max_bytes == 0 or self.bytes + size <= self.max_bytes)
+
+    def take(self, items, size):
+        self.items += items
+        self.bytes += size
+        self.peak_items = max(self.peak_items, self.items)
+        self.peak_bytes = max(self.peak_bytes, self.bytes)
+
+    def give_back(self, items, size):
+        self.items = max(0, self.items - items)
+        self.bytes = max(0, self.bytes - size)
+        if self.items == 0:
+            self.bytes = 0  # sizes of items may change while in the stage
+
+    def summary(self):
+        return "%s: %d items, %d bytes (peak %d items, %d bytes)" % (
+            self.name, self.items, self.bytes, self.peak_items, self.peak_bytes)
+
 
 class WorkRateController(BaseComponent):
-    _max_pending_for_processing = 0
-    _cur_available = 0
+    """
+    Gives slots to read files (see FileReader) while the pipeline stages have credits left
+
+    Each stage has a budget of items and bytes (performance.flow_stage) and the pipeline events move the credits from
+    one stage to the next one:
+        read: from the slot given to the file to its FileConsumed (or FilteredFile/PathConsumed)
+        compress: from its FileConsumed to the NewContainerFile of its container (bytes of the content)
+        transform: from the NewContainerFile of the container to its sending stage mark
+        send: from the sending stage mark of the container to its end of pipeline mark
+    The compress stage holds files until a container is full, so its budget only denies slots while containers are
+    being transformed or sent (otherwise it could wait forever for the files it needs to finish a container).
+    max_pending_for_processing limits the files being read plus the containers being transformed or sent.
+
+    A denied reader waits for CreditsAvailable while containers are being transformed or sent, otherwise it polls (see
+    wait_for_slot). The amount of times and the seconds slots were denied are kept by reason (stage name,
+    MAX_PENDING_REASON or TEMP_SPACE_REASON) in waits
+    """
     log = None
+    stages = None
+    waits = None
+    _max_pending_for_processing = 0
+    _temp_space_controller = None
+    _read_sizes = None
+    _sending_blocks = None
+    _denied_reason = None
+    _denied_since = 0
 
-    def init(self, max_pending_for_processing):
+    def init(self, max_pending_for_processing, stages_settings=(), temp_space_controller=None):
+        """
+        :param stages_settings: list of performance.flow_stage settings
+        :param temp_space_controller: optional TempSpaceController, no slot is given while it has no space
+        :raise InvalidSettings: if a stage is unknown or configured more than once
+        """
         self.log = get_logger_module(self.__class__.__name__)
         self._max_pending_for_processing = max_pending_for_processing
-        self._cur_available = self._max_pending_for_processing
+        self._temp_space_controller = temp_space_controller
+        self.stages = OrderedDict((name, FlowStage(name)) for name in STAGES)
+        configured = set()
+        for stage_settings in stages_settings:
+            if stage_settings.name not in self.stages:
+                raise InvalidSettings("Unknown flow stage '%s' (known stages: %s)" %
+                                      (stage_settings.name, ", ".join(STAGES)))
+            if stage_settings.name in configured:
+                raise InvalidSettings("Flow stage '%s' configured more than once" % stage_settings.name)
+            configured.add(stage_settings.name)
+            stage = self.stages[stage_settings.name]
+            stage.max_items = stage_settings.max_items
+            stage.max_bytes = stage_settings.max_bytes.in_bytes
+        self.waits = {}  # reason -> [times, seconds]
+        self._read_sizes = {}  # path -> list of sizes of the items read with that path
+        self._sending_blocks = {}  # id(block) -> stage name
 
-    def try_acquire_slot(self):
-        if self._max_pending_for_processing == 0:
-            return True
-        elif self._cur_available > 0:
-            self.slot_taken()
-            return True
-        return False
+    def try_acquire_slot(self, path=None, size=0):
+        """
+        :param path: path of the item to read (used to give its credits back, see free_slot)
+        :param size: size in bytes of the item to read
+        :return: True if the item can be read (its credits are taken), False otherwise
+        """
+        reason = self._get_deny_reason(size)
+        self._account_wait(reason)
+        if reason is not None:
+            return False
+        self._read_sizes.setdefault(path, []).append(size)
+        self.stages[READ_STAGE].take(1, size)
+        return True
 
-    def slot_taken(self):
-        self._cur_available -= 1
+    def free_slot(self, path=None):
+        """
+        Gives back the credits of an item whose slot was acquired but wasn't (or won't be) processed
+        """
+        self._free_read_slot(path)
+        self._notify_credits_returned()
 
-    def free_slot(self):
-        if self._max_pending_for_processing != 0:
-            self._cur_available += 1
+    def wait_for_slot(self, manager):
+        """
+        :param manager: component (handling the event) which waits for a slot
+        :return: what a generator handler has to yield to wait until a slot may be given
+        """
+        if self._denied_reason == TEMP_SPACE_REASON:
+            return None  # the space may be freed by other processes (no credits are given back for it), keep polling
+        if self.stages[TRANSFORM_STAGE].is_empty and self.stages[SEND_STAGE].is_empty:
+            # an open container only gives its credits back when it gets more files (or is flushed), keep polling
+            return None
+        return manager.wait(CreditsAvailable.__name__)
 
-    @handler(FilteredFile.__name__)
-    def _on_filtered_file(self, *_):
-        self.free_slot()
+    def summary(self):
+        return "; ".join(["%s, waited %d times for %.1f secs" % ((stage.summary(),) + self._get_wait(stage.name))
+                          for stage in self.stages.itervalues()] +
+                         ["%s: waited %d times for %.1f secs" % ((reason,) + self._get_wait(reason))
+                          for reason in (MAX_PENDING_REASON, TEMP_SPACE_REASON) if reason in self.waits])
 
-    @handler(Mark.__name__)
-    def _on_marker_event(self, mark, *_):
-        if mark == Marks.end_of_pipeline:
-            self.free_slot()
+    @handler(FilteredFile.__name__)
+    def _on_filtered_files(self, file_infos):
+        for file_info in file_infos:
+            self._free_read_slot(file_info.path)
+        self._notify_credits_returned()
 
     @handler(PathConsumed.__name__)
-    def _on_filtered_path(self, *_):
-        self.free_slot()
+    def _on_filtered_path(self, path):
+        self.free_slot(path)
 
     @handler(FileConsumed.__name__)
-    def _on_file_consumed(self, *_):
-        self.free_slot()
+    def _on_files_consumed(self, file_infos):
+        for file_info in file_infos:
+            # with many compressor jobs the file is consumed by each one (and saved in a container of each one)
+            self._free_read_slot(file_info.path)
+            self.stages[COMPRESS_STAGE].take(1, file_info.size)
+        self._notify_credits_returned()
 
     @handler(NewContainerFile.__name__)
-    def _on_new_container(self, *_):
-        self.slot_taken()
+    def _on_new_container(self, block):
+        finished_files = sum(1 for file_info in block.content_file_infos
+                             if not hasattr(file_info, 'fragment_info') or
+                             file_info.fragment_info.fragment_num == file_info.fragment_info.fragments_count)
+        self.stages[COMPRESS_STAGE].give_back(finished_files, block.content_size)
+        self._move_block(block, TRANSFORM_STAGE)
+
+    @handler(Mark.__name__)
+    def _on_marker_event(self, mark, block):
+        if mark == Marks.sending_stage:
+            self._move_block(block, SEND_STAGE)
+        elif mark == Marks.end_of_pipeline:
+            self._move_block(block, None)
+
+    @handler("%s_done" % CreditsAvailable.__name__)
+    def _on_credits_notified(self, *_):
+        # the waiters are resumed in the next tick but, without events queued, circuits main loop idles (up to its
+        # TIMEOUT) before it
+        self.fire(_WaitersResumed())
+
+    @handler(FlushPendings.__name__)
+    def _on_flush(self, *_):
+        self.log.info("Work rate stats: %s", self.summary())
+
+    # -------- low visibility methods
+    def _free_read_slot(self, path):
+        sizes = self._read_sizes.get(path)
+        if not sizes:
+            return
+        size = sizes.pop()
+        if not sizes:
+            del self._read_sizes[path]
+        self.stages[READ_STAGE].give_back(1, size)
+
+    def _move_block(self, block, to_stage):
+        from_stage = self._sending_blocks.pop(id(block), None)
+        if from_stage is not None:
+            self.stages[from_stage].give_back(1, block.content_size)
+        if to_stage is not None:
+            self._sending_blocks[id(block)] = to_stage
+            self.stages[to_stage].take(1, block.content_size)
+        self._notify_credits_returned()
+
+    def _get_deny_reason(self, size):
+        """
+        :return: why an item of the size can't be read now (None if it can)
+        """
+        if self._temp_space_controller is not None and not self._temp_space_controller.has_space():
+            return TEMP_SPACE_REASON
+        if not self.stages[READ_STAGE].can_take(size):
+            return READ_STAGE
+        is_sending = not self.stages[TRANSFORM_STAGE].is_empty or not self.stages[SEND_STAGE].is_empty
+        if is_sending and self.stages[COMPRESS_STAGE].is_full():
+            return COMPRESS_STAGE
+        for name in (TRANSFORM_STAGE, SEND_STAGE):
+            if self.stages[name].is_full():
+                return name
+        pending = sum(self.stages[name].items for name in (READ_STAGE, TRANSFORM_STAGE, SEND_STAGE))
+        if self._max_pending_for_processing != 0 and pending >= self._max_pending_for_processing:
+            return MAX_PENDING_REASON
+        return None
+
+    def _account_wait(self, reason):
+        """
+        Accounts the time slots were denied for the previous reason (if it changed)
+        """
+        if reason == self._denied_reason:
+            return
+        now = time.time()
+        if self._denied_reason is not None:
+            self.waits[self._denied_reason][1] += now - self._denied_since
+        if reason is not None:
+            self.waits.setdefault(reason, [0, 0.0])[0] += 1
+            self.log.debug("Slots denied by %s", reason)
+        self._denied_reason = reason
+        self._denied_since = now
+
+    def _get_wait(self, reason):
+        times, seconds = self.waits.get(reason, (0, 0.0))
+        if reason == self._denied_reason:
+            seconds += time.time() - self._denied_since
+        return times, seconds
+
+    def _notify_credits_returned(self):
+        if self._denied_reason is not None:
+            self.fire(CreditsAvailable())
@@ -0,0 +1,118 @@
+import bisect
+import threading
+
+
+class PackingBin(object):
+    """
+    Content of a container being planned
+    """
+
+    def __init__(self, content_size=0, files_count=0):
+        """
+        :param content_size: size of the content the container already has
+        :param files_count: amount of files the container already has
+        """
+        self.content_size = content_size
+        self.files_count = files_count
+        self.file_infos = []  # the ones added by the packer
+
+    def add(self, file_info):
+        self.content_size += file_info.size
+        self.files_count += 1
+        self.file_infos.append(file_info)
+
+
+class BlockPacker(object):
+    """
+    Packs files into containers with the best fit decreasing heuristic: files are taken from the biggest to the
+    smallest one and each one is added to the container with the least space left where it fits (a new container is
+    used if it doesn't fit in any)
+    """
+
+    def __init__(self, max_content_size, max_files):
+        """
+        :param max_content_size: maximum content size of a container (0 means no limit)
+        :param max_files: maximum amount of files of a container (0 means no limit)
+        """
+        self._max_content_size = max_content_size
+        self._max_files = max_files
+
+    def pack(self, file_infos, bins=()):
+        """
+        :param file_infos: files to pack (none can be bigger than max_content_size)
+        :param bins: PackingBin already used that may receive more files
+        :return: list of all the PackingBin (the given ones and the new ones), from the fullest to the emptiest one
+        """
+        all_bins = list(bins)
+        # (space left, bin number) of the bins that can receive more files, sorted to find the best fit with a bisect
+        candidates = sorted((self._space_left(a_bin), number) for number, a_bin in enumerate(all_bins)
+                            if not self._is_full(a_bin))
+        for file_info in sorted(file_infos, key=lambda an_info: an_info.size, reverse=True):
+            position = bisect.bisect_left(candidates, (file_info.size, -1))
+            if position < len(candidates):
+                _, number = candidates.pop(position)
+                a_bin = all_bins[number]
+            else:
+                number = len(all_bins)
+                a_bin = PackingBin()
+                all_bins.append(a_bin)
+            a_bin.add(file_info)
+            if not self._is_full(a_bin):
+                bisect.insort(candidates, (self._space_left(a_bin), number))
+        all_bins.sort(key=lambda a_bin: a_bin.content_size, reverse=True)
+        return all_bins
+
+    def _space_left(self, a_bin):
+        if self._max_content_size == 0:
+            return float("inf")
+        return self._max_content_size - a_bin.content_size
+
+    def _is_full(self, a_bin):
+        return (self._max_files != 0 and a_bin.files_count >= self._max_files) or self._space_left(a_bin) <= 0
+
+
+class PackingStats(object):
+    """
+    Keeps track of how full the containers are (content size compared to the maximum container content size) and of
+    the amount of fragments generated
+    """
+
+    def __init__(self, max_content_size):
+        self._lock = threading.Lock()
+        self._max_content_size = max_content_size
+        self.containers = 0
+        self.content_bytes = 0
+        self.min_fill_ratio = None
+        self.fragmented_files = 0
+        self.fragments = 0
+
+    def account_block(self, block):
+        with self._lock:
+            self.containers += 1
+            self.content_bytes += block.content_size
+            fill_ratio = self._fill_ratio(block.content_size, 1)
+            if self.min_fill_ratio is None or fill_ratio < self.min_fill_ratio:
+                self.min_fill_ratio = fill_ratio
+
+    def account_fragments(self, fragments_count):
+        with self._lock:
+            self.fragmented_files += 1
+            self.fragments += fragments_count
+
+    @property
+    def average_fill_ratio(self):
+        return self._fill_ratio(self.content_bytes, self.containers)
+
+    def summary(self):
+        if self._max_content_size == 0:
+            fill = "no maximum content size"
+        else:
+            fill = "average fill %.1f%% (minimum %.1f%%)" % (self.average_fill_ratio * 100,
+                                                              (self.min_fill_ratio or 0) * 100)
+        return "%d containers with %d content bytes, %s, %d files split in %d fragments" % (
+            self.containers, self.content_bytes, fill, self.fragmented_files, self.fragments)
+
+    def _fill_ratio(self, content_size, containers):
+        if self._max_content_size == 0 or containers == 0:
+            return 0.0
+        return float(content_size) / (self._max_content_size * containers)
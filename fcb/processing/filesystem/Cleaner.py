@@ -11,14 +11,12 @@ class Cleaner(PipelineTask):
 
     # override from PipelineTask
     def process_data(self, block):
-        if self._delete_temp_files:
-            # remove "result" files
+        if getattr(block, 'save_error', None) is not None:
+            self.log.warning("Won't remove the files of '%s' as it wasn't saved in database",
+                             block.processed_data_file_info.basename)
+        elif self._delete_temp_files:
+            # remove "result" files (fragments are read from their files, there are no copies of them to remove)
             for tmp_file in block.all_gen_files:
                 self.log.debug("REMOVING: %s", tmp_file.path)
                 os.remove(tmp_file.path)
-            # remove fragments
-            for content_file_info in block.content_file_infos:
-                if hasattr(content_file_info, 'fragment_info'):
-                    os.remove(content_file_info.path)
-                    self.log.debug("REMOVING: %s", content_file_info.path)
         return block
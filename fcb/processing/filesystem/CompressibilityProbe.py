@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+import zlib
+
+from fcb.utils.log_helper import get_logger_for
+
+
+class CompressibilityProbe(object):
+    """
+    Estimates if the content of a file is worth compressing by compressing (fast) some samples of it
+
+    Results are cached by (sha1, size) (only if the sha1 of the file was already calculated) and by extension (once
+    enough files with the same extension got the same result, the extension decides for the following ones)
+    """
+    sample_size = 64 * 1024
+    samples_per_file = 3
+    # files whose samples can't be compressed to less than this ratio are considered incompressible
+    max_compressed_ratio = 0.9
+    # amount of coincident results required for an extension to decide for its files
+    min_extension_samples = 4
+    # smaller files are always considered compressible (compressor overhead makes their samples meaningless)
+    min_probed_size = 4 * 1024
+
+    def __init__(self):
+        self.log = get_logger_for(self)
+        self._lock = threading.Lock()
+        self._by_digest = {}
+        self._by_extension = {}  # extension -> [compressible count, incompressible count]
+        self.probed_files = 0
+        self.probe_seconds = 0.0  # wall time
+
+    def is_compressible(self, file_info):
+        if file_info.size < self.min_probed_size:
+            return True
+
+        extension = os.path.splitext(file_info.basename)[1].lower()
+        digest_key = (file_info.known_sha1, file_info.size) if file_info.known_sha1 else None
+
+        with self._lock:
+            result = self._by_digest.get(digest_key) if digest_key else None
+            if result is None:
+                result = self._decided_by_extension(extension)
+        if result is not None:
+            return result
+
+        result = self._probe(file_info.path, file_info.size)
+        with self._lock:
+            if digest_key:
+                self._by_digest[digest_key] = result
+            counters = self._by_extension.setdefault(extension, [0, 0])
+            counters[0 if result else 1] += 1
+        self.log.debug("File '%s' probed as %s", file_info.path, "compressible" if result else "incompressible")
+        return result
+
+    def _decided_by_extension(self, extension):
+        compressible, incompressible = self._by_extension.get(extension, (0, 0))
+        if compressible == 0 and incompressible >= self.min_extension_samples:
+            return False
+        if incompressible == 0 and compressible >= self.min_extension_samples:
+            return True
+        return None
+
+    def _probe(self, path, size):
+        start = time.time()
+        sampled = 0
+        compressed = 0
+        try:
+            with open(path, "rb") as f:
+                for offset in self._sample_offsets(size):
+                    f.seek(offset)
+                    sample = f.read(self.sample_size)
+                    sampled += len(sample)
+                    compressed += len(zlib.compress(sample, 1))
+        except (IOError, OSError):
+            self.log.exception("Couldn't probe file '%s', will be considered compressible", path)
+            return True
+        finally:
+            with self._lock:
+                self.probed_files += 1
+                self.probe_seconds += time.time() - start
+        return sampled == 0 or compressed < sampled * self.max_compressed_ratio
+
+    def _sample_offsets(self, size):
+        if size <= self.sample_size * self.samples_per_file:
+            return [0] if size <= self.sample_size else xrange(0, size, self.sample_size)
+        step = (size - self.sample_size) // (self.samples_per_file - 1)
+        return [step * sample_num for sample_num in xrange(self.samples_per_file)]
+
+
+class CompressionStats(object):
+    """
+    Keeps track of the bytes compressed/stored and the time spent generating the compressed containers
+
+    Note: the time is wall time (it includes reading the content files and waiting for the compression_workers
+    processes, and it is affected by the other threads of the process)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compressed_content_bytes = 0
+        self.compressed_container_bytes = 0
+        self.compression_seconds = 0.0
+        self.stored_content_bytes = 0
+        self.stored_containers = 0
+
+    def account(self, block, seconds, was_stored):
+        with self._lock:
+            if was_stored:
+                self.stored_content_bytes += block.content_size
+                self.stored_containers += 1
+            else:
+                self.compressed_content_bytes += block.content_size
+                self.compressed_container_bytes += block.processed_data_file_info.size
+                self.compression_seconds += seconds
+
+    @property
+    def bytes_saved_by_compression(self):
+        return self.compressed_content_bytes - self.compressed_container_bytes
+
+    @property
+    def estimated_seconds_saved_by_storing(self):
+        """ Time that would have been spent compressing the stored bytes (at the measured compression rate) """
+        if self.compressed_content_bytes == 0:
+            return 0.0
+        return self.stored_content_bytes * self.compression_seconds / self.compressed_content_bytes
+
+    def summary(self, probe=None):
+        lines = [
+            "compressed %d bytes into %d (saved %d bytes) in %.2f secs (wall time)" % (
+                self.compressed_content_bytes, self.compressed_container_bytes, self.bytes_saved_by_compression,
+                self.compression_seconds),
+            "stored without compression %d bytes in %d containers (saved ~%.2f secs)" % (
+                self.stored_content_bytes, self.stored_containers, self.estimated_seconds_saved_by_storing)]
+        if probe is not None:
+            lines.append("probed %d files in %.2f secs (wall time)" % (probe.probed_files, probe.probe_seconds))
+        return ", ".join(lines)
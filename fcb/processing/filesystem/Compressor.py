@@ -1,30 +1,52 @@
 from copy import deepcopy
+import hashlib
 import tarfile
 import tempfile
 from datetime import datetime
-import os
 import threading
+import time
+from collections import deque
 
 from circuits import handler, Event
 
-from fcb.framework import events
-from fcb.framework.events import NewContainerFile, FileConsumed
-from fcb.framework.workers import hd_worker_pool
+from fcb.framework import events, workers
+from fcb.framework.events import NewContainerFile, ContainerFileStarted
 from fcb.framework.workflow.HeavyPipelineTask import HeavyPipelineTask
 from fcb.framework.workflow.PipelineTask import PipelineTask
-from fcb.processing.models.FileInfo import FileInfo
+from fcb.processing.models.FileInfo import FileInfo, FileFragmentInfo
 from fcb.processing.models.Quota import Quota
+from fcb.processing.filesystem import ContainerCodec
+from fcb.processing.filesystem.BlockPacker import BlockPacker, PackingBin, PackingStats
+from fcb.processing.filesystem.CompressibilityProbe import CompressibilityProbe, CompressionStats
+from fcb.utils import digest
 from fcb.utils.log_helper import get_logger_for, get_logger_module, deep_print
 
-_worker_pool = hd_worker_pool
-
 
 class Block(object):
-    def __init__(self, destinations):
+    def __init__(self, destinations, codec=None, compression_level=0, compression_workers=1,
+                 stream_transformation=None):
+        """
+        :param codec: ContainerCodec used to generate the container (ContainerCodec.DEFAULT_CODEC if None)
+        :param compression_level: level used by the codec (0 means the codec default)
+        :param compression_workers: amount of processes used to compress the container
+                                    (1 compresses in the calling thread, 0 means one process per cpu)
+        :param stream_transformation: transformation applied to the container while it is generated (only its
+                                      result is written to disk). It must provide:
+                                        - extension: added to the container name
+                                        - open_writer(block, fileobj): file like object where the container is
+                                          written and the transformed data goes to fileobj
+                                        - on_finished(block, writer, path): called once the transformed data is
+                                          in path (so it can update the block information)
+        """
         self.log = get_logger_for(self)
         self.destinations = destinations
+        self._codec = codec if codec is not None else ContainerCodec.get_codec(ContainerCodec.DEFAULT_CODEC)
+        self._compression_level = compression_level
+        self._compression_workers = compression_workers
+        self._stream_transformation = stream_transformation
         self.send_destinations = []
         self.destinations_verif_data = {}
+        self.failed_destinations = {}  # destination -> failure description
 
         self._content_size = 0
         self._content_file_infos = []
@@ -32,6 +54,7 @@ class Block(object):
         self._processed_data_file_info = None
         self._latest_file_info = None
         self.all_gen_files = []
+        self.writing_file_path = None  # path of the container file while it is being generated (see finish)
 
     @property
     def latest_file_info(self):
@@ -67,20 +90,104 @@ class Block(object):
         self.log.debug("Block content size: {}".format(self._content_size))
 
     def finish(self):
+        transformation_extension = "" if self._stream_transformation is None else self._stream_transformation.extension
         of = tempfile.NamedTemporaryFile(
-            suffix=".tar.bz2",
-            prefix="_".join(("archive", datetime.now().strftime('%Y-%m-%d_%H-%M-%S.%f'), "")),
+            suffix=self._codec.extension + transformation_extension,
+            prefix="".join((ContainerCodec.CONTAINER_NAME_PREFIX,
+                            datetime.now().strftime('%Y-%m-%d_%H-%M-%S.%f'),
+                            "_")),
             delete=False)
         output_filename = of.name
         of.close()
-        with tarfile.open(output_filename, "w:bz2") as tar:
-            for file_info in self._content_file_infos:
-                tar.add(file_info.path, arcname=file_info.basename)
-            tar.close()
-        self._processed_data_file_info = FileInfo(output_filename)
-        self.latest_file_info = self._processed_data_file_info
+        self.writing_file_path = output_filename
+        # every content file is read only once: its content is digested while it is being archived and the
+        # container is digested while it is being written (so later stages don't need to read them again)
+        with open(output_filename, "wb") as out_file:
+            transformed_out_file = None
+            if self._stream_transformation is not None:
+                transformed_out_file = self._stream_transformation.open_writer(self, out_file)
+            digesting_out_file = digest.DigestingWriter(
+                out_file if transformed_out_file is None else transformed_out_file)
+            compressed_out_file = self._codec.open_writer(fileobj=digesting_out_file,
+                                                          level=self._compression_level,
+                                                          workers=self._compression_workers)
+            with tarfile.open(fileobj=compressed_out_file, mode="w|") as tar:
+                self._add_content_to_tar(tar)
+            compressed_out_file.close()
+            if transformed_out_file is not None:
+                transformed_out_file.close()
+        # when transformed, the container itself is never written to disk (it's information is kept anyway)
+        container_filename = output_filename[:len(output_filename) - len(transformation_extension)]
+        self._processed_data_file_info = FileInfo(container_filename,
+                                                  sha1=digesting_out_file.hexdigest(),
+                                                  size=digesting_out_file.size)
+        if self._stream_transformation is None:
+            self.latest_file_info = self._processed_data_file_info
+        else:
+            self._stream_transformation.on_finished(self, transformed_out_file, output_filename)
+        self.writing_file_path = None
         self.log.debug("Created %s", output_filename)
 
+    def _add_content_to_tar(self, tar):
+        for file_info in self._content_file_infos:
+            self._add_to_tar(tar, file_info)
+
+    @staticmethod
+    def _add_to_tar(tar, file_info):
+        if isinstance(file_info, FileFragmentInfo):
+            # the fragment is read from the (fragmented) file itself
+            tarinfo = tar.gettarinfo(file_info.source_path, arcname=file_info.basename)
+            tarinfo.size = file_info.length
+            in_file = file_info.open()
+        else:
+            tarinfo = tar.gettarinfo(file_info.path, arcname=file_info.basename)
+            if not tarinfo.isreg():
+                tar.addfile(tarinfo)
+                return
+            in_file = open(file_info.path, "rb")
+        # fragments may also feed the digest of the whole file (see _WholeFileDigest)
+        whole_file_digest = getattr(file_info, 'whole_file_digest', None)
+        extra_digests = () if whole_file_digest is None else (whole_file_digest,)
+        with in_file:
+            digesting_in_file = digest.DigestingReader(in_file, extra_digests)
+            tar.addfile(tarinfo, digesting_in_file)
+        file_info.size = tarinfo.size
+        file_info.sha1 = digesting_in_file.hexdigest()
+
+
+class _WholeFileDigest(object):
+    """
+    Digests a fragmented file with the data of its fragments while they are archived (so the file isn't read only to
+    get its sha1). Fragments must be archived in order, the ones not archived yet when the sha1 is required are read
+    (see finish)
+    """
+
+    def __init__(self, file_info):
+        self._file_info = file_info
+        self._digest = hashlib.sha1()
+        self._digested_size = 0
+        self._is_finished = False
+
+    def update(self, buf):
+        if not self._is_finished:
+            self._digest.update(buf)
+            self._digested_size += len(buf)
+
+    def finish(self):
+        """
+        Sets the sha1 of the file (reading the end of it if its last fragments weren't archived yet)
+        """
+        remaining = self._file_info.size - self._digested_size
+        if remaining > 0:
+            with digest.open_range(self._file_info.path, self._digested_size, remaining) as in_file:
+                while True:
+                    buf = in_file.read(digest.DEFAULT_BUFFER_SIZE)
+                    if not buf:
+                        break
+                    self._digest.update(buf)
+        self._is_finished = True
+        self._file_info.sha1 = self._digest.hexdigest()
+
 
 class FragmentInfo(object):
     def __init__(self, file_info, fragment_num, fragments_count):
@@ -107,6 +214,14 @@ class _BlockFragmenter(object):
     def does_fit_in_todays_share(self, file_info):
         return self._global_quota.fits(file_info) and self._specific_quota.fits(file_info)
 
+    def reserve(self, file_info):
+        """
+        Charges the size of the file to the quotas until the blocks with its content are accounted (see account_block),
+        so the files waiting for their blocks are considered by does_fit_in_todays_share
+        """
+        self._global_quota.account_used(file_info)
+        self._specific_quota.account_used(file_info)
+
     def can_add_new_content(self, block, file_info):
         """
         new content from file_info can be added into block iff
@@ -131,6 +246,9 @@ class _BlockFragmenter(object):
         return Spec(block.content_size, self._max_container_content_size_in_bytes)
 
     def account_block(self, block):
+        for file_info in block.content_file_infos:  # releases the reservations (see reserve)
+            self._global_quota.account_released(file_info)
+            self._specific_quota.account_released(file_info)
         self._global_quota.account_used(block.processed_data_file_info)
         self._specific_quota.account_used(block.processed_data_file_info)
         self.log.debug("Total (pending to be) uploaded today (global: %s, specific: %s)",
@@ -156,6 +274,14 @@ class _BlockFragmenter(object):
     def bytes_uploaded_today(self):
         return self._specific_quota.used
 
+    @property
+    def max_container_content_size_in_bytes(self):
+        return self._max_container_content_size_in_bytes
+
+    @property
+    def max_files_per_container(self):
+        return self._max_files_per_container
+
     @property
     def max_upload_per_day_in_bytes(self):
         # the limit will be the min of non zero global and specific quotas
@@ -188,47 +314,106 @@ class _NewDestinations(Event):
 
 
 class _CompressorJob(HeavyPipelineTask):
-    _tmp_file_parts_basepath = None
+    """
+    Fills blocks with the files received and generates their containers
+
+    When a compressibility probe is given, files detected as incompressible are put in blocks of their own (the
+    "stored" lane) whose containers are not compressed
+
+    Blocks are filled in the order files are received unless a packing window is given, in that case files are
+    buffered (up to packing window files per lane) and packed into blocks with a BlockPacker. When packing, only files
+    bigger than a container are fragmented
+
+    Files are processed in the order they are received even if the worker pool has many threads (e.g. a flush
+    request must be processed after the files received before it)
+    """
+    worker_pool_names = ("compression", workers.HARD_DRIVE_POOL)
+    _COMPRESSED_LANE = "compressed"
+    _STORED_LANE = "stored"
+
+    _codec = None
+    _compression_level = None
+    _compression_workers = None
+    _stream_transformation = None
+    _compressibility_probe = None
+    _compression_stats = None
     _destinations = None
-    _current_block = None
+    _current_blocks = None
     _block_fragmenter = None
+    _packing_window = 0
+    _packing_windows = None
+    _block_packer = None
+    _packing_stats = None
     log = None
     name = None
     _lock = threading.RLock()
 
     def do_init(self,
                 sender_spec,
-                tmp_file_parts_basepath,
                 should_split_small_files,
-                global_quota):
+                global_quota,
+                compression_workers=1,
+                compressibility_probe=None,
+                stream_transformation=None,
+                packing_window=0):
+        """
+        :param packing_window: amount of files (per lane) buffered to pack them into blocks (0 fills blocks in the
+                               order files are received)
+        """
         super(_CompressorJob, self).do_init()
-        self._tmp_file_parts_basepath = tmp_file_parts_basepath
+        self._stream_transformation = stream_transformation
+        self._codec = ContainerCodec.get_codec(sender_spec.restrictions.container_codec,
+                                               sender_spec.restrictions.container_compression_level)
+        self._compression_level = sender_spec.restrictions.container_compression_level
+        self._compression_workers = compression_workers
+        self._compressibility_probe = compressibility_probe
+        self._compression_stats = CompressionStats()
         self._destinations = sender_spec.destinations
-        self._current_block = None
+        self._current_blocks = {}
         self._block_fragmenter = _BlockFragmenter(sender_spec=sender_spec,
                                                   should_split_small_files=should_split_small_files,
                                                   global_quota=global_quota)
+        self._packing_window = packing_window
+        self._packing_windows = {}  # lane -> files waiting to be packed
+        if packing_window > 0:
+            self._block_packer = BlockPacker(self._block_fragmenter.max_container_content_size_in_bytes,
+                                             self._block_fragmenter.max_files_per_container)
+        self._packing_stats = PackingStats(self._block_fragmenter.max_container_content_size_in_bytes)
         self.name = "".join((self.__class__.__name__, '(to ', str(self._destinations), ')'))
         self.log = get_logger_module(self.name)
+        self._pending_files = deque()
 
     def add_destinations(self, destinations):
         self._destinations.extend(destinations)
 
+    @property
+    def compression_stats(self):
+        return self._compression_stats
+
     # override from HeavyPipelineTask
-    def do_heavy_work(self, file_info):
-        self.log.debug("File to process: %s", file_info)
-        self._do_compress(file_info)
+    def process_data(self, file_info):
+        self._pending_files.append(file_info)
+        HeavyPipelineTask.process_data(self, file_info)
 
     # override from HeavyPipelineTask
-    def get_worker_channel(self):
-        return _worker_pool.get_worker()
+    def do_heavy_work(self, _):
+        # tasks may run in any order, each one processes the oldest pending file instead of the one it was created for
+        with self._lock:
+            file_info = self._pending_files.popleft()
+            self.log.debug("File to process: %s", file_info)
+            self._do_compress(file_info)
 
     def _do_compress(self, file_info):
         with self._lock:
             if file_info is None:  # FIXME ugly handling
                 self.log.debug("Received flush request")
-                if self._current_block:
-                    self._finish_current_block()
+                for lane in set(self._packing_windows.keys()) | set(self._current_blocks.keys()):
+                    if self._block_packer is not None:
+                        self._pack_window(lane, is_final=True)
+                    else:
+                        self._finish_current_block(lane)
+                self.log.info("Compression stats: %s", self._compression_stats.summary(self._compressibility_probe))
+                self.log.info("Packing stats: %s", self._packing_stats.summary())
                 return
 
             self.log.debug("Processing file: %s", file_info.path)
@@ -239,37 +424,61 @@ class _CompressorJob(HeavyPipelineTask):
                                " to the current sent amount (%d) would exceed the maximum for the day (%d)",
                                file_info.path, file_info.size, self._block_fragmenter.bytes_uploaded_today,
                                self._block_fragmenter.max_upload_per_day_in_bytes)
+                events.filtered_files.add(self, file_info)
                 return  # ignore file
+            self._block_fragmenter.reserve(file_info)
+
+            lane = self._get_lane(file_info)
+            if self._block_packer is not None:
+                self._plan_file(lane, file_info)
+                return
 
             file_parts = [file_info]
-            self._add_block_if_none()
+            self._add_block_if_none(lane)
 
-            if not self._block_fragmenter.can_add_new_content(self._current_block, file_info):
+            if not self._block_fragmenter.can_add_new_content(self._current_blocks[lane], file_info):
                 self.log.debug("Need to finish current block because file '%s' can't be added to it", file_info.path)
-                self._finish_current_block(True)
-            elif not self._block_fragmenter.does_content_fit(file_info, self._current_block):
+                self._finish_current_block(lane, True)
+            elif not self._block_fragmenter.does_content_fit(file_info, self._current_blocks[lane]):
                 self.log.debug("File '%s' doesn't fit in the block, will need to fragment it", file_info.path)
                 # split the file so the first part fits in the current block and the remaining in new blocks
-                fragments_spec = self._block_fragmenter.get_fragments_spec(self._current_block)
-                file_parts = self._create_fragments(file_info, fragments_spec.first,
-                                                    fragments_spec.remaining, self._tmp_file_parts_basepath)
+                fragments_spec = self._block_fragmenter.get_fragments_spec(self._current_blocks[lane])
+                file_parts = self._create_fragments(file_info, fragments_spec.first, fragments_spec.remaining)
                 self.log.debug("File '%s' fragmented in %d parts to fit in blocks" % (file_info.path, len(file_parts)))
 
             fragments_count = len(file_parts)
             fragment_num = 0
-
-            self.fire(FileConsumed(file_info))  # the file will be saved in the block
+            whole_file_digest = None
+            held_blocks = None
+            if fragments_count > 1:
+                self._packing_stats.account_fragments(fragments_count)
+                if file_info.known_sha1 is None:
+                    # the sha1 of the whole file is saved with its fragments, so their blocks are held until it is
+                    # known (usually it already is, see AlreadyProcessedFilter)
+                    whole_file_digest = _WholeFileDigest(file_info)
+                    held_blocks = []
+
+            events.consumed_files.add(self, file_info)  # the file will be saved in the block
 
             for part_file_info in file_parts:
-                self._add_block_if_none()
+                self._add_block_if_none(lane)
+                block = self._current_blocks[lane]
                 if fragments_count > 1:  # is fragmented
                     fragment_num += 1
                     part_file_info.fragment_info = FragmentInfo(file_info, fragment_num, fragments_count)
-                    self._current_block.fragmented_files.append(part_file_info.fragment_info)
-                self._current_block.add(part_file_info)
-                if not self._block_fragmenter.has_space_left(self._current_block):
+                    block.fragmented_files.append(part_file_info.fragment_info)
+                    if whole_file_digest is not None:
+                        part_file_info.whole_file_digest = whole_file_digest
+                block.add(part_file_info)
+                if not self._block_fragmenter.has_space_left(block):
                     self.log.debug("No more space left in current block, will finish it")
-                    self._finish_current_block()
+                    self._finish_current_block(lane, held_blocks=held_blocks)
+
+            if whole_file_digest is not None:
+                # only the last fragment may not be archived yet (its block is still open)
+                whole_file_digest.finish()
+                for block in held_blocks:
+                    self.hand_on_to_next_task(block)
 
     def flush(self):
         """
@@ -282,37 +491,116 @@ class _CompressorJob(HeavyPipelineTask):
         '''
         self.process_data(None)
 
+    def _get_lane(self, file_info):
+        if self._compressibility_probe is None or self._codec.name == ContainerCodec.STORE_CODEC:
+            return self._COMPRESSED_LANE
+        return self._COMPRESSED_LANE if self._compressibility_probe.is_compressible(file_info) else self._STORED_LANE
+
     @staticmethod
-    def _create_fragments(file_info, first_chunk_size, other_chunks_size, parts_basedir):
+    def _create_fragments(file_info, first_chunk_size, other_chunks_size):
+        """
+        :return: list of FileFragmentInfo of the file (their content is read from the file when they are archived,
+                 no copy of them is written)
+        """
         result = []
-        with open(file_info.path, "rb") as f:
-            chunk_number = 1
-            chunk = f.read(first_chunk_size)
-            path_basename = file_info.basename
-            while chunk:
-                out_filename = "".join((os.path.join(parts_basedir, path_basename), "_part_%03d" % chunk_number))
-                with open(out_filename, "wb") as outf:
-                    outf.write(chunk)
-                    outf.close()
-                    result.append(FileInfo(out_filename))
-                chunk_number += 1
-                chunk = f.read(other_chunks_size)
-            f.close()
+        size = file_info.size
+        offset = 0
+        chunk_size = first_chunk_size
+        while offset < size:
+            length = min(chunk_size, size - offset)
+            result.append(FileFragmentInfo(file_info, len(result) + 1, offset, length))
+            offset += length
+            chunk_size = other_chunks_size
         return result
 
-    def _finish_current_block(self, should_add_new_block=False):
-        self._current_block.finish()
-        self._block_fragmenter.account_block(self._current_block)
-        self.fire(NewContainerFile(self._current_block))
-        self.hand_on_to_next_task(self._current_block)
-        self._current_block = None
+    def _plan_file(self, lane, file_info):
+        """
+        Adds the file to the packing window of the lane (files bigger than a container are fragmented, the fragments
+        which fill a container are not packed)
+        """
+        events.consumed_files.add(self, file_info)  # the file will be saved in a block
+        window = self._packing_windows.setdefault(lane, [])
+        max_content_size = self._block_fragmenter.max_container_content_size_in_bytes
+        if max_content_size == 0 or file_info.size <= max_content_size:
+            window.append(file_info)
+        else:
+            # the sha1 of the whole file is saved with its fragments (usually already known, see
+            # AlreadyProcessedFilter). Packed fragments may be archived in any order, so the file is read to get it
+            if file_info.known_sha1 is None:
+                file_info.sha1 = digest.gen_sha1(file_info.path)
+            file_parts = self._create_fragments(file_info, max_content_size, max_content_size)
+            self.log.debug("File '%s' fragmented in %d parts to fit in blocks" % (file_info.path, len(file_parts)))
+            self._packing_stats.account_fragments(len(file_parts))
+            for fragment_num, part_file_info in enumerate(file_parts, 1):
+                part_file_info.fragment_info = FragmentInfo(file_info, fragment_num, len(file_parts))
+                if part_file_info.size < max_content_size:
+                    window.append(part_file_info)
+                else:
+                    block = self._new_block(lane)
+                    self._add_to_block(block, part_file_info)
+                    self._finish_block(lane, block)
+        if len(window) >= self._packing_window:
+            self._pack_window(lane)
+
+    def _pack_window(self, lane, is_final=False):
+        """
+        Packs the files of the packing window of the lane (and the current block of the lane) and finishes the
+        resulting blocks, but the emptiest one (which is kept as current block to receive more files) unless is_final
+        """
+        window = self._packing_windows.pop(lane, [])
+        current_block = self._current_blocks.pop(lane, None)
+        current_bin = None
+        if current_block is not None:
+            current_bin = PackingBin(current_block.content_size, len(current_block.content_file_infos))
+        bins = self._block_packer.pack(window, [] if current_bin is None else [current_bin])
+        self.log.debug("Packed %d files in %d blocks", len(window), len(bins))
+        kept_bin = None if is_final or not bins else bins[-1]
+        for a_bin in bins:
+            block = current_block if a_bin is current_bin else self._new_block(lane)
+            for file_info in a_bin.file_infos:
+                self._add_to_block(block, file_info)
+            if a_bin is kept_bin:
+                self._current_blocks[lane] = block
+            else:
+                self._finish_block(lane, block)
+
+    @staticmethod
+    def _add_to_block(block, file_info):
+        if hasattr(file_info, 'fragment_info'):
+            block.fragmented_files.append(file_info.fragment_info)
+        block.add(file_info)
+
+    def _finish_current_block(self, lane, should_add_new_block=False, held_blocks=None):
+        self._finish_block(lane, self._current_blocks.pop(lane), held_blocks)
         if should_add_new_block:
-            Block(self._destinations)
+            self._add_block_if_none(lane)
 
-    def _add_block_if_none(self):
-        if not self._current_block:
-            self.log.debug("New block")
-            self._current_block = Block(self._destinations)
+    def _finish_block(self, lane, block, held_blocks=None):
+        """
+        :param held_blocks: list where the block is added instead of handing it on (if given)
+        """
+        self.fire(ContainerFileStarted(block))
+        start = time.time()
+        block.finish()
+        self._compression_stats.account(block, time.time() - start, was_stored=(lane == self._STORED_LANE))
+        self._packing_stats.account_block(block)
+        self._block_fragmenter.account_block(block)
+        events.consumed_files.flush()  # so the files are known as consumed before their container is
+        self.fire(NewContainerFile(block))
+        if held_blocks is None:
+            self.hand_on_to_next_task(block)
+        else:
+            held_blocks.append(block)
+
+    def _new_block(self, lane):
+        codec = ContainerCodec.get_codec(ContainerCodec.STORE_CODEC) if lane == self._STORED_LANE else self._codec
+        return Block(self._destinations, codec, self._compression_level, self._compression_workers,
+                     self._stream_transformation)
+
+    def _add_block_if_none(self, lane):
+        if lane not in self._current_blocks:
+            self.log.debug("New block (%s)", lane)
+            self._current_blocks[lane] = self._new_block(lane)
 
 
 # ------------------------------------------------------
@@ -321,8 +609,12 @@ class _CompressorJob(HeavyPipelineTask):
 class Compressor(PipelineTask):
     restriction_to_job = {}  # keeps a map sender_spec.restrictions -> _CompressorJob
 
-    def do_init(self, fs_settings, global_quota):
+    def do_init(self, fs_settings, global_quota, stream_transformation=None):
+        """
+        :param stream_transformation: see Block
+        """
         fs_settings = deepcopy(fs_settings)  # because we store some of the info, we need a deep copy
+        compressibility_probe = None  # shared by all the jobs (so they share the results cache)
         '''
         If the same restrictions are applied for many destinations, we use the same job to avoid processing
         files twice
@@ -332,12 +624,17 @@ class Compressor(PipelineTask):
             if restrictions in self.restriction_to_job:
                 self.restriction_to_job[restrictions].add_destinations(sender_spec.destinations)
             else:
+                if restrictions.detect_incompressible and compressibility_probe is None:
+                    compressibility_probe = CompressibilityProbe()
                 compressor = _CompressorJob(
                     next_task=self.get_next_task(),
                     sender_spec=sender_spec,
-                    tmp_file_parts_basepath=fs_settings.tmp_file_parts_basepath,
                     should_split_small_files=fs_settings.should_split_small_files,
-                    global_quota=global_quota)
+                    global_quota=global_quota,
+                    compression_workers=fs_settings.compression_workers,
+                    compressibility_probe=compressibility_probe if restrictions.detect_incompressible else None,
+                    stream_transformation=stream_transformation,
+                    packing_window=fs_settings.packing_window)
                 self.restriction_to_job[restrictions] = compressor
                 compressor.register(self)
 
@@ -0,0 +1,276 @@
+"""
+Registry of the codecs that can be used to compress containers
+
+Every codec generates a tar (stream) compressed with a specific algorithm. Codecs depending on optional libraries
+are only available when those libraries are installed (but their extensions are always known, so containers
+generated by them can be recognized).
+"""
+import bz2
+import gzip
+import re
+import zlib
+from collections import OrderedDict
+from functools import partial
+
+from fcb.utils import parallel_compression
+from fcb.utils.Settings import InvalidSettings
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+CONTAINER_NAME_PREFIX = "archive_"
+
+
+# --- writers ------------------------------
+
+
+class _PassThroughWriter(object):
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+
+    def write(self, data):
+        self._fileobj.write(data)
+
+    def close(self):
+        pass
+
+
+class _StreamCompressorWriter(object):
+    """
+    Adapts a compressor object (with compress and flush methods) to a write only file like object
+    The underlying fileobj is not closed by close()
+    """
+
+    def __init__(self, fileobj, compressor, header=""):
+        self._fileobj = fileobj
+        self._compressor = compressor
+        if header:
+            self._fileobj.write(header)
+
+    def write(self, data):
+        compressed = self._compressor.compress(data)
+        if compressed:
+            self._fileobj.write(compressed)
+
+    def close(self):
+        self._fileobj.write(self._compressor.flush())
+
+
+# --- chunk compression functions (must be picklable to be used by parallel_compression) ---
+
+
+def _gzip_compress(level, data):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip member
+    return compressor.compress(data) + compressor.flush()
+
+
+def _xz_compress(level, data):
+    return lzma.compress(data, preset=level)
+
+
+def _zstd_compress(level, data):
+    return zstandard.ZstdCompressor(level=level).compress(data)
+
+
+def _lz4_compress(level, data):
+    return lz4_frame.compress(data, compression_level=level)
+
+
+# --- codecs ------------------------------
+
+
+class _Codec(object):
+    name = None
+    extension = None
+    default_level = None
+    # range of the compression levels supported by the codec (besides 0, the codec default)
+    min_level = 0
+    max_level = 0
+
+    def is_available(self):
+        return True
+
+    def check_level(self, level):
+        """
+        :raise InvalidSettings: if level isn't supported by the codec
+        """
+        if level != 0 and self.max_level == 0:
+            raise InvalidSettings("Container codec '%s' has no compression levels (level must be 0)" % self.name)
+        if level != 0 and not self.min_level <= level <= self.max_level:
+            raise InvalidSettings("Invalid compression level %d for container codec '%s' (valid levels: 0 for the "
+                                  "codec default or between %d and %d)" %
+                                  (level, self.name, self.min_level, self.max_level))
+
+    def open_writer(self, fileobj, level=0, workers=1):
+        """
+        :param fileobj: where the compressed data will be written (will not be closed by the writer)
+        :param level: compression level (0 means the codec default, see check_level)
+        :param workers: amount of processes to compress in (1 means compressing in the calling thread)
+        :return: write only file like object where the uncompressed tar stream should be written. Must be closed
+                 to complete the compressed data.
+        """
+        level = level if level != 0 else self.default_level
+        compress_function = self._chunk_compress_function(level)
+        if workers != 1 and compress_function is not None:
+            return parallel_compression.ParallelCompressionWriter(
+                fileobj=fileobj, compress_function=compress_function, workers=workers)
+        return self._open_sequential_writer(fileobj, level)
+
+    def _open_sequential_writer(self, fileobj, level):
+        raise NotImplementedError()
+
+    def _chunk_compress_function(self, level):
+        """
+        :return: a picklable function which compresses a chunk into an independent stream (whose concatenation is
+                 valid compressed data) or None if the codec can't be compressed in parallel
+        """
+        return None
+
+
+class _StoreCodec(_Codec):
+    name = "store"
+    extension = ".tar"
+    default_level = 0
+
+    def _open_sequential_writer(self, fileobj, level):
+        return _PassThroughWriter(fileobj)
+
+
+class _GzipCodec(_Codec):
+    name = "gzip"
+    extension = ".tar.gz"
+    default_level = 9
+    min_level = 1
+    max_level = 9
+
+    def _open_sequential_writer(self, fileobj, level):
+        return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level)
+
+    def _chunk_compress_function(self, level):
+        return partial(_gzip_compress, level)
+
+
+class _Bz2Codec(_Codec):
+    name = "bz2"
+    extension = ".tar.bz2"
+    default_level = 9
+    min_level = 1
+    max_level = 9
+
+    def _open_sequential_writer(self, fileobj, level):
+        return _StreamCompressorWriter(fileobj, bz2.BZ2Compressor(level))
+
+    def _chunk_compress_function(self, level):
+        return parallel_compression.bz2_compress_function(level)
+
+
+class _XzCodec(_Codec):
+    name = "xz"
+    extension = ".tar.xz"
+    default_level = 6
+    min_level = 1
+    max_level = 9
+
+    def is_available(self):
+        return lzma is not None
+
+    def _open_sequential_writer(self, fileobj, level):
+        return _StreamCompressorWriter(fileobj, lzma.LZMACompressor(preset=level))
+
+    def _chunk_compress_function(self, level):
+        return partial(_xz_compress, level)
+
+
+class _ZstdCodec(_Codec):
+    name = "zstd"
+    extension = ".tar.zst"
+    default_level = 3
+    min_level = 1
+    max_level = 22
+
+    def is_available(self):
+        return zstandard is not None
+
+    def _open_sequential_writer(self, fileobj, level):
+        return _StreamCompressorWriter(fileobj, zstandard.ZstdCompressor(level=level).compressobj())
+
+    def _chunk_compress_function(self, level):
+        return partial(_zstd_compress, level)
+
+
+class _Lz4Codec(_Codec):
+    name = "lz4"
+    extension = ".tar.lz4"
+    default_level = 0
+    min_level = 1
+    max_level = 16
+
+    def is_available(self):
+        return lz4_frame is not None
+
+    def _open_sequential_writer(self, fileobj, level):
+        compressor = lz4_frame.LZ4FrameCompressor(compression_level=level)
+        return _StreamCompressorWriter(fileobj, compressor, header=compressor.begin())
+
+    def _chunk_compress_function(self, level):
+        return partial(_lz4_compress, level)
+
+
+_codecs = OrderedDict((codec.name, codec) for codec in (
+    _StoreCodec(), _GzipCodec(), _Bz2Codec(), _XzCodec(), _ZstdCodec(), _Lz4Codec()))
+
+DEFAULT_CODEC = _Bz2Codec.name
+STORE_CODEC = _StoreCodec.name
+
+
+def get_codec(name, level=0):
+    """
+    :param level: compression level to be used with the codec (0 means the codec default)
+    :return: the codec registered with the name
+    :raise InvalidSettings: if there is no such codec, it can't be used (required library is not installed) or it
+                            doesn't support the level
+    """
+    codec = _codecs.get(name)
+    if codec is None:
+        raise InvalidSettings("Unknown container codec '%s' (known codecs: %s)" % (name, ", ".join(_codecs.keys())))
+    if not codec.is_available():
+        raise InvalidSettings("Container codec '%s' requires a library which is not installed" % name)
+    codec.check_level(level)
+    return codec
+
+
+def available_codec_names():
+    return [name for name, codec in _codecs.items() if codec.is_available()]
+
+
+def known_extensions():
+    """
+    :return: extensions of the containers of every codec (available or not)
+    """
+    return [codec.extension for codec in _codecs.values()]
+
+
+def container_name_regex():
+    """
+    :return: regex (string) which matches names starting with a container name (generated by any codec)
+    """
+    return "".join((
+        re.escape(CONTAINER_NAME_PREFIX),
+        ".*(?:",
+        "|".join(re.escape(extension) for extension in known_extensions()),
+        ")"))
@@ -1,43 +1,135 @@
 import os
-import re
+import stat
 
 from circuits import handler
 
 from fcb.framework import events
 from fcb.framework.events import PathConsumed
 from fcb.framework.workflow.PipelineTask import PipelineTask
+from fcb.processing.filesystem.PathMatcher import PathMatcher
 from fcb.processing.models.FileInfo import FileInfo
 
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# amount of directory entries walked before letting the event loop handle other events
+_WALK_BATCH_SIZE = 1000
+
+
+class _ListdirEntry(object):
+    """
+    Minimal os.DirEntry replacement for when scandir is not available
+    """
+
+    def __init__(self, directory, name):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+    def is_dir(self):
+        return self._is_mode(stat.S_ISDIR)
+
+    def is_file(self):
+        return self._is_mode(stat.S_ISREG)
+
+    def _is_mode(self, mode_check):
+        try:
+            return mode_check(self.stat().st_mode)
+        except OSError:
+            return False
+
+
+def _scan_directory(path):
+    """
+    :return: iterable of the entries (os.DirEntry like) of the directory
+    """
+    if scandir is not None:
+        return scandir(path)
+    return (_ListdirEntry(path, name) for name in os.listdir(path))
+
+
+def _get_file_size(path):
+    """
+    :return: size of the file (0 if it isn't a file)
+    """
+    try:
+        return os.path.getsize(path) if os.path.isfile(path) else 0
+    except OSError:
+        return 0
+
 
 class FileReader(PipelineTask):
-    _path_filter_list = None
+    """
+    Hands on a FileInfo for each file of the input paths
+
+    Directories are walked (with scandir if available) in the handler of their NewInputPath, their files are handed on
+    as long as the WorkRateController has slots available (the walk is suspended until it gives credits back)
+    """
+    _exclude_matcher = None
     _work_rate_controller = None
+    _path_filter = None
 
-    def do_init(self, path_filter_list, work_rate_controller):
-        self.log.debug("Registering path filters: %s", str(path_filter_list))
-        self._path_filter_list = [re.compile(path_filter) for path_filter in path_filter_list]
+    def do_init(self, exclude_paths, work_rate_controller, path_filter=None):
+        """
+        :param exclude_paths: exclude_paths settings (excluded directories aren't walked)
+        :param path_filter: optional callable which returns True for the (walked) file paths that must be ignored
+                            (e.g. PathFilter.is_path_processed)
+        """
+        self._exclude_matcher = PathMatcher(file_names=exclude_paths.file_names,
+                                            dir_names=exclude_paths.dir_names,
+                                            regexes=exclude_paths.regexes)
+        self.log.debug("Registering path filters: %s", self._exclude_matcher)
         self._work_rate_controller = work_rate_controller
+        self._path_filter = path_filter
 
     @handler(events.NewInputPath.__name__)
     def new_inputh_path(self, path):
-        while not self._work_rate_controller.try_acquire_slot():
-            yield None  # suspend processing
-        self.handle_data(path)
+        size = _get_file_size(path)
+        while not self._work_rate_controller.try_acquire_slot(path, size):
+            yield self._work_rate_controller.wait_for_slot(self)  # suspend processing
+        if self.is_disabled:
+            self._work_rate_controller.free_slot(path)
+            return
+        if self._matches_any_filter(path) or not os.path.isdir(path):
+            self.handle_data(path)
+            return
+
+        self.log.debug("Path '%s' is a directory", path)
+        self.fire(PathConsumed(path))  # a directory is not processed
+        walked = 0
+        for file_info in self._walk(path):
+            walked += 1
+            if walked % _WALK_BATCH_SIZE == 0:
+                yield None  # let other events be handled
+            if file_info is None:
+                continue
+            while not self._work_rate_controller.try_acquire_slot(file_info.path, file_info.size):
+                yield self._work_rate_controller.wait_for_slot(self)  # suspend processing
+            if self.is_disabled:
+                self._work_rate_controller.free_slot(file_info.path)
+                return
+            try:
+                self.hand_on_to_next_task(file_info)
+            except Exception:  # as with NewInputPath events, an error processing a file doesn't stop the rest
+                self.log.exception("Failed to process file '%s'", file_info.path)
+                self._work_rate_controller.free_slot(file_info.path)
 
     # override from PipelineTask
     def process_data(self, path):
         result = None
         self.log.debug("Verifying path '%s'", path)
         if not self._matches_any_filter(path):
-            if os.path.isdir(path):
-                self.log.debug("Path '%s' is a directory", path)
-                self.fire(PathConsumed(path))  # a directory is not processed
-                for directory_entry in os.listdir(path):
-                    try:
-                        self.fire(events.NewInputPath(os.path.join(path, directory_entry)))
-                    except ValueError:
-                        pass  # don't care about entries that are not files nor directories
-            elif os.path.isfile(path):
+            if os.path.isfile(path):
                 result = FileInfo(path)
             else:
                 self.log.error("The path '%s' is not a file or directory (will ignore it)", path)
@@ -47,9 +139,42 @@ class FileReader(PipelineTask):
             self.fire(PathConsumed(path))
         return result
 
+    def _walk(self, root_path):
+        """
+        Walks the directory (depth first)
+        :return: generator of FileInfo of the files to process (None for every other walked entry)
+        """
+        pending_dirs = [root_path]
+        while pending_dirs:
+            try:
+                entries = list(_scan_directory(pending_dirs.pop()))
+            except OSError as e:
+                self.log.error("Couldn't read directory (will ignore it): %s", e)
+                continue
+            for entry in entries:
+                if self._matches_any_filter(entry.path):
+                    yield None
+                elif entry.is_dir():
+                    pending_dirs.append(entry.path)
+                    yield None
+                elif not entry.is_file():
+                    self.log.error("The path '%s' is not a file or directory (will ignore it)", entry.path)
+                    yield None
+                elif self._path_filter is not None and self._path_filter(entry.path):
+                    yield None
+                else:
+                    try:
+                        entry_stat = entry.stat()
+                    except OSError as e:
+                        self.log.error("Couldn't read file (will ignore it): %s", e)
+                        yield None
+                        continue
+                    self.log.debug("Path '%s' read", entry.path)
+                    yield FileInfo(entry.path, size=entry_stat.st_size, stat=entry_stat)
+
     def _matches_any_filter(self, path):
-        for filter_rule in self._path_filter_list:
-            if filter_rule.match(path) is not None:
-                self.log.debug("Path '%s' matches filter '%s'", path, filter_rule.pattern)
-                return True
+        filter_rule = self._exclude_matcher.match(path)
+        if filter_rule is not None:
+            self.log.debug("Path '%s' matches filter '%s'", path, filter_rule)
+            return True
         return False
@@ -0,0 +1,91 @@
+"""
+Matching of paths against the exclude_paths rules
+
+Instead of trying every rule regex on each path, rules are combined:
+    file_name rules: set of names looked up by the path basename
+    dir_name rules (and file names with many components): trie of components, looked up from the path end
+    regex rules: single alternation regex (regexes with groups or flags are kept apart, they can't be combined)
+"""
+import re
+
+_TERMINAL = None  # key of the trie nodes where a name ends
+
+
+def _trie_insert(trie, name):
+    node = trie
+    for component in reversed(name.split("/")):
+        node = node.setdefault(component, {})
+    node[_TERMINAL] = name
+
+
+def _trie_match(trie, path):
+    """
+    :return: the name in trie which matches the last components of path (None if none does)
+    """
+    node = trie
+    for component in reversed(path.split("/")):
+        node = node.get(component)
+        if node is None:
+            return None
+        if _TERMINAL in node:
+            return node[_TERMINAL]
+    return None
+
+
+class PathMatcher(object):
+    """
+    Tells if a path matches any of the rules (same result as using re.match with each rule regex)
+    """
+
+    def __init__(self, file_names=(), dir_names=(), regexes=()):
+        """
+        :param file_names: (exact) names of files in any directory
+        :param dir_names: (exact) names of directories in any directory (path may end with '/')
+        :param regexes: regexes which are re.match'ed against the full path
+        """
+        self._file_names = set()
+        self._file_names_trie = {}
+        self._dir_names_trie = {}
+        for file_name in file_names:
+            if "/" in file_name:
+                _trie_insert(self._file_names_trie, file_name)
+            else:
+                self._file_names.add(file_name)
+        for dir_name in dir_names:
+            _trie_insert(self._dir_names_trie, dir_name)
+
+        self._regexes = []
+        combinable = []
+        for regex in regexes:
+            compiled = re.compile(regex)
+            if compiled.groups or compiled.flags:
+                self._regexes.append(compiled)
+            else:
+                combinable.append(regex)
+        if combinable:
+            self._regexes.insert(0, re.compile("|".join("(?:%s)" % regex for regex in combinable)))
+
+    def __str__(self):
+        return "file names: %s, dir names: %s, regexes: %s" % (
+            sorted(self._file_names), self._dir_names_trie.keys(), [regex.pattern for regex in self._regexes])
+
+    def match(self, path):
+        """
+        :return: a description of the rule matched by path, None if it doesn't match any
+        """
+        basename = path[path.rfind("/") + 1:]
+        if basename in self._file_names:
+            return "file_name " + basename
+        name = _trie_match(self._file_names_trie, path) if self._file_names_trie else None
+        if name is not None:
+            return "file_name " + name
+        if self._dir_names_trie:
+            name = _trie_match(self._dir_names_trie, path[:-1] if path.endswith("/") else path)
+            if name is None and path.endswith("/"):
+                name = _trie_match(self._dir_names_trie, path)
+            if name is not None:
+                return "dir_name " + name
+        for regex in self._regexes:
+            if regex.match(path) is not None:
+                return "regex " + regex.pattern
+        return None
@@ -1,7 +1,8 @@
 from copy import deepcopy
 
-from fcb.database.helpers import get_session
+from fcb.database.helpers import get_read_session
 from fcb.database.schema import FilesDestinations
+from fcb.processing.filesystem import ContainerCodec
 from fcb.utils.log_helper import get_logger_for
 
 
@@ -10,12 +11,20 @@ class _SenderRestriction(object):
         self.max_upload_per_day_in_bytes = sender_settings.limits.max_upload_per_day.in_bytes
         self.max_container_content_size_in_bytes = sender_settings.limits.max_container_content_size.in_bytes
         self.max_files_per_container = sender_settings.limits.max_files_per_container
+        self.container_codec = sender_settings.limits.container_codec
+        self.container_compression_level = sender_settings.limits.container_compression_level
+        self.detect_incompressible = sender_settings.limits.detect_incompressible
+        # fail when the settings are loaded instead of when the first container is compressed
+        ContainerCodec.get_codec(self.container_codec, self.container_compression_level)
 
     def __eq__(self, other):
         return other \
                and self.max_upload_per_day_in_bytes == other.max_upload_per_day_in_bytes \
                and self.max_container_content_size_in_bytes == other.max_container_content_size_in_bytes \
-               and self.max_files_per_container == other.max_files_per_container
+               and self.max_files_per_container == other.max_files_per_container \
+               and self.container_codec == other.container_codec \
+               and self.container_compression_level == other.container_compression_level \
+               and self.detect_incompressible == other.detect_incompressible
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -23,7 +32,10 @@ class _SenderRestriction(object):
     def __hash__(self):
         return hash((self.max_upload_per_day_in_bytes,
                      self.max_container_content_size_in_bytes,
-                     self.max_files_per_container))
+                     self.max_files_per_container,
+                     self.container_codec,
+                     self.container_compression_level,
+                     self.detect_incompressible))
 
 
 class _SenderSpec(object):
@@ -35,7 +47,7 @@ class _SenderSpec(object):
         log = get_logger_for(self)
         self.restrictions = _SenderRestriction(sender_settings)
         self.destinations = deepcopy(sender_settings.destinations)
-        with get_session() as session:
+        with get_read_session() as session:
             self.bytes_uploaded_today = \
                 FilesDestinations.get_bytes_uploaded_in_date(session, self.destinations)
         log.info("According to the logs, it were already uploaded today %d bytes for destinations %s",
@@ -44,9 +56,10 @@ class _SenderSpec(object):
 
 
 class Settings(object):
-    def __init__(self, sender_settings_list, stored_files_settings):
-        self.tmp_file_parts_basepath = stored_files_settings.tmp_file_parts_basepath
+    def __init__(self, sender_settings_list, stored_files_settings, performance_settings):
         self.should_split_small_files = stored_files_settings.should_split_small_files
+        self.packing_window = stored_files_settings.packing_window
+        self.compression_workers = performance_settings.compression_workers
         self.sender_specs = []
 
         for sender_settings in sender_settings_list:
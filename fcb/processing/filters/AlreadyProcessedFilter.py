@@ -2,44 +2,96 @@ from circuits import handler
 from dateutil import tz
 from sqlalchemy.orm.exc import NoResultFound
 
-from fcb.database.helpers import get_session
+from fcb.database.digest_cache import DigestCache
+from fcb.database.helpers import get_read_session, get_db_writer
 from fcb.database.schema import UploadedFile
 from fcb.framework import events
 from fcb.framework.workflow.PipelineTask import PipelineTask
+from fcb.processing.models.Sha1Index import Sha1Index
 
 
 class AlreadyProcessedFilter(PipelineTask):
+    """
+    Filters files whose content (sha1) was already uploaded
+
+    The sha1 of files which didn't change since a previous execution is taken from the DigestCache (so they aren't
+    read again)
+
+    The sha1 of the uploaded files are loaded in memory (and updated as new files are sent), so the database is only
+    queried for files that were uploaded in fragments (to check if all of them were uploaded)
+    """
     _session_resource = None
+    _digest_cache = None
+    _uploaded_files_index = None
+    _fragmented_files_index = None
 
     def do_init(self):
-        self._session_resource = get_session()
+        self._session_resource = get_read_session()
+        self._digest_cache = DigestCache(self._session_resource, get_db_writer())
+        with self._session_resource as session:
+            uploaded_files = session.query(UploadedFile.sha1, UploadedFile.fragment_count).all()
+        self._uploaded_files_index = \
+            Sha1Index(sha1 for sha1, fragment_count in uploaded_files if not fragment_count)
+        self._fragmented_files_index = \
+            Sha1Index(sha1 for sha1, fragment_count in uploaded_files if fragment_count)
+        self.log.debug("Loaded %d uploaded (and %d fragmented) files sha1",
+                       len(self._uploaded_files_index), len(self._fragmented_files_index))
 
     # override from PipelineTask
     def process_data(self, file_info):
         """expects FileInfo"""
+        self._load_sha1(file_info)
         if self._is_already_processed(file_info):
             self.log.debug("Content file already processed '%s'", str(file_info))
-            self.fire(events.FilteredFile(file_info))
-            self.fire(events.FileInfoAlreadyProcessed(file_info))
+            events.filtered_files.add(self, file_info)
+            events.files_already_processed.add(self, file_info)
         else:
             return file_info
         return None
 
+    @handler(events.FileProcessed.__name__)
+    def on_block_processed(self, block):
+        for file_info in block.content_file_infos:
+            if hasattr(file_info, 'fragment_info'):  # check if it is a fragment
+                self._fragmented_files_index.add(file_info.fragment_info.file_info.sha1)
+            else:
+                self._uploaded_files_index.add(file_info.sha1)
+
+    @handler(events.FlushPendings.__name__)
+    def on_flush_pendings(self):
+        self._digest_cache.flush()
+
     @handler("Stopped")
     def on_stopped(self):
-        if self._session_resource:
-            with self._session_resource as session:
-                session.commit()
-                session.close()
+        if self._digest_cache:
+            self._digest_cache.flush()
 
     # -------- low visibility methods
+    def _load_sha1(self, file_info):
+        if file_info.known_sha1 is not None:
+            return
+        sha1 = self._digest_cache.get_sha1(file_info)
+        if sha1 is not None:
+            self.log.debug("Using cached sha1 of '%s'", file_info.path)
+            file_info.sha1 = sha1
+        else:
+            self._digest_cache.add(file_info)  # reads the file to get its sha1
+
     def _is_already_processed(self, file_info):
+        if file_info.sha1 in self._uploaded_files_index:
+            self.log.info("File '%s' was already uploaded (sha1 '%s')", file_info.path, str(file_info.sha1))
+            return True
+        if file_info.sha1 not in self._fragmented_files_index:
+            self.log.debug("No file found for file info: {}".format(file_info))
+            return False
+
         try:
             with self._session_resource as session:
                 uploaded_file = session \
                     .query(UploadedFile) \
                     .filter(UploadedFile.sha1 == file_info.sha1) \
                     .order_by(UploadedFile.upload_date.desc()).one()
+                uploaded_fragments = len(uploaded_file.fragments) if uploaded_file.fragment_count > 0 else 0
                 session.expunge_all()
 
             self.log.debug("Found uploaded file by hash: {}".format(uploaded_file))
@@ -48,11 +100,11 @@ class AlreadyProcessedFilter(PipelineTask):
 
             if uploaded_file.fragment_count > 0:
                 # check if all fragments have been uploaded
-                if len(uploaded_file.fragments) < uploaded_file.fragment_count:
+                if uploaded_fragments < uploaded_file.fragment_count:
                     self.log.info(
                         "File '%s' was already started to be uploaded on '%s' but only %d of %d fragments arrived"
                         " to its end, the file will need to be re-uploaded",
-                        file_info.path, date_string, len(uploaded_file.fragments), uploaded_file.fragment_count)
+                        file_info.path, date_string, uploaded_fragments, uploaded_file.fragment_count)
                     return False
             self.log.info("File '%s' was already uploaded on '%s' with the name '%s' (sha1 '%s')",
                           file_info.path, date_string, uploaded_file.file_name.encode("utf-8"), str(file_info.sha1))
@@ -1,22 +1,41 @@
+import os
+
 from circuits import BaseComponent, handler
-from sqlalchemy.orm.exc import NoResultFound
-from fcb.database.helpers import get_session
-from fcb.database.schema import UploadedPaths
+
+from fcb.database import uploaded_paths
+from fcb.database.helpers import get_read_session, get_db_writer
 from fcb.framework import events
 from fcb.utils.log_helper import get_logger_for
 
+# amount of new paths kept in memory before saving them
+_BULK_SIZE = 1000
+
 
 class PathFilter(BaseComponent):
     """
     Filters input paths by checking if it is registered as already processed
     Warning: this will filter files with the same name and path
+
+    The paths known to be processed under each input path are loaded (with a single query) when the input path arrives,
+    so checking a path doesn't query the database. New paths are saved in bulks
     """
     log = None
     _session_resource = None
+    _db_writer = None
+    _known_paths = None
+    _loaded_trees = None
+    _loaded_directories = None
+    _pending_paths = None
 
     def init(self):
         self.log = get_logger_for(self)
-        self._session_resource = get_session()
+        self._session_resource = get_read_session()
+        self._db_writer = get_db_writer()
+        self._known_paths = {}  # directory -> set of names (unicode)
+        self._loaded_trees = set()  # directories whose known paths (including subdirectories ones) were loaded
+        self._loaded_directories = set()  # directories whose known paths (not subdirectories ones) were loaded
+        self._pending_paths = []
+        self._db_writer.execute(uploaded_paths.create_tables)
 
     @handler(events.FileProcessed.__name__)
     def on_block_processed(self, block):
@@ -24,31 +43,90 @@ class PathFilter(BaseComponent):
         for file_info in block.content_file_infos:
             if hasattr(file_info, 'fragment_info'):  # check if it is a fragment
                 if file_info.fragment_info.fragment_num == file_info.fragment_info.fragments_count:
-                    # is last fragment
-                    paths.append(file_info.upath)
+                    # is last fragment (the path of the whole file is the processed one)
+                    paths.append(file_info.fragment_info.file_info.upath)
             else:
                 paths.append(file_info.upath)  # not a fragmented file
         self._add_paths(paths)
 
     @handler(events.FileInfoAlreadyProcessed.__name__)
-    def on_file_info_processed(self, file_info):
-        self._add_paths([file_info.upath])
+    def on_file_infos_processed(self, file_infos):
+        self._add_paths([file_info.upath for file_info in file_infos])
 
     @handler(events.NewInputPath.__name__, priority=10)
     def on_input_path(self, event, path):
-        path = path.decode("utf-8")
-        try:
-            with self._session_resource as session:
-                session \
-                    .query(UploadedPaths) \
-                    .filter(UploadedPaths.path == path) \
-                    .one()
-            self.log.debug("Path already processed: %s", path)
+        if os.path.isdir(path):
+            self._load_tree(path.decode("utf-8"))
+        if self.is_path_processed(path):
             event.stop()
-        except NoResultFound:
-            pass
 
+    @handler(events.FlushPendings.__name__)
+    def on_flush_pendings(self):
+        self._save_pending_paths()
+
+    @handler("Stopped")
+    def on_stopped(self):
+        self._save_pending_paths()
+
+    def is_path_processed(self, path):
+        """
+        :return: True if the path is registered as already processed
+        (also used by the FileReader to filter the files of the directories it walks)
+        """
+        directory, name = uploaded_paths.split_path(path.decode("utf-8"))
+        self._load_directory(directory)
+        if name in self._known_paths.get(directory, ()):
+            self.log.debug("Path already processed: %s", path)
+            return True
+        return False
+
+    # -------- low visibility methods
     def _add_paths(self, paths):
+        for path in paths:
+            directory, name = uploaded_paths.split_path(path)
+            self._load_directory(directory)
+            names = self._known_paths.setdefault(directory, set())
+            if name not in names:
+                names.add(name)
+                self._pending_paths.append(path)
+        if len(self._pending_paths) >= _BULK_SIZE:
+            self._save_pending_paths()
+
+    def _save_pending_paths(self):
+        if not self._pending_paths:
+            return
+        paths = self._pending_paths
+        self._pending_paths = []
+        self._db_writer.submit(lambda session: uploaded_paths.save_paths(session, paths))
+
+    def _is_in_loaded_tree(self, directory):
+        while True:
+            if directory in self._loaded_trees:
+                return True
+            separator = directory.rfind(u"/")
+            if separator <= 0:
+                return separator == 0 and u"/" in self._loaded_trees
+            directory = directory[:separator]
+
+    def _load_tree(self, directory):
+        directory = directory.rstrip(u"/") or u"/"
+        if self._is_in_loaded_tree(directory):
+            return
         with self._session_resource as session:
-            for path in paths:
-                session.merge(UploadedPaths(path=path))
+            known_paths = uploaded_paths.load_paths(session, directory)
+        self._merge_known_paths(known_paths)
+        self._loaded_trees.add(directory)
+        self.log.debug("Loaded %d known paths under '%s'", sum(len(names) for names in known_paths.itervalues()),
+                       directory)
+
+    def _load_directory(self, directory):
+        if directory in self._loaded_directories or self._is_in_loaded_tree(directory):
+            return
+        with self._session_resource as session:
+            known_paths = uploaded_paths.load_paths(session, directory, recursive=False)
+        self._merge_known_paths(known_paths)
+        self._loaded_directories.add(directory)
+
+    def _merge_known_paths(self, known_paths):
+        for directory, names in known_paths.iteritems():
+            self._known_paths.setdefault(directory, set()).update(names)
@@ -3,11 +3,17 @@ import os
 from fcb.utils import digest
 
 
-class FileInfo:
-    def __init__(self, path):
+class FileInfo(object):
+    def __init__(self, path, sha1=None, size=None, stat=None):
+        """
+        :param sha1: sha1 of the file content if already known (avoids reading the file again to get it)
+        :param size: size in bytes of the file if already known
+        :param stat: os.stat result of the file if already known
+        """
         self._path = path
-        self._sha1 = None
-        self._size = None
+        self._sha1 = sha1
+        self._size = size
+        self._stat = stat
 
     @property
     def path(self):
@@ -20,19 +26,65 @@ class FileInfo:
     @property
     def sha1(self):
         if not self._sha1:
-            self._sha1 = digest.gen_sha1(self._path)
+            self._sha1 = self._gen_sha1()
         return self._sha1
 
+    @property
+    def known_sha1(self):
+        """ sha1 of the file if it was already calculated, None otherwise (never reads the file) """
+        return self._sha1
+
+    @sha1.setter
+    def sha1(self, value):
+        self._sha1 = value
+
+    @property
+    def stat(self):
+        """ os.stat result of the file (as it was the first time it was required) """
+        if self._stat is None:
+            self._stat = os.stat(self._path)
+        return self._stat
+
     @property
     def size(self):
         """ size in bytes """
         if not self._size:
-            self._size = os.path.getsize(self._path)
+            self._size = self.stat.st_size if self._stat is not None else os.path.getsize(self._path)
         return self._size
 
+    @size.setter
+    def size(self, value):
+        self._size = value
+
     @property
     def basename(self):
         return os.path.basename(self._path)
 
     def __str__(self):
         return "{} (sha1 '{}')".format(self._path, str(self._sha1))
+
+    def _gen_sha1(self):
+        return digest.gen_sha1(self._path)
+
+
+class FileFragmentInfo(FileInfo):
+    """
+    Fragment of a file: length bytes of the file from offset (read from the file itself, no copy of it is written)
+
+    Its path is the one of the file with the fragment number appended (as if the fragment were a file of its own)
+    """
+
+    def __init__(self, file_info, fragment_num, offset, length):
+        FileInfo.__init__(self, "".join((file_info.path, "_part_%03d" % fragment_num)), size=length)
+        self.source_path = file_info.path
+        self.offset = offset
+        self.length = length
+
+    def open(self):
+        """
+        :return: file like object to read the content of the fragment
+        """
+        return digest.open_range(self.source_path, self.offset, self.length)
+
+    def _gen_sha1(self):
+        return digest.gen_sha1_of_range(self.source_path, self.offset, self.length)
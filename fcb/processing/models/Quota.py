@@ -51,6 +51,14 @@ class Quota(object):
         self._unsafe_account_used(file_info)
         self._lock.release()
 
+    def account_released(self, file_info):
+        """
+        Gives back the bytes of the file accounted as used (e.g. reserved for a file which wasn't sent yet)
+        """
+        self._lock.acquire()
+        self._used = max(0, self._used - file_info.size)
+        self._lock.release()
+
     def fits(self, file_info):
         self._lock.acquire()
         result = self._unsafe_fits(file_info)
@@ -0,0 +1,56 @@
+import binascii
+
+import numpy
+
+
+class Sha1Index(object):
+    """
+    Compact set of sha1 (hex digests)
+
+    Digests are kept (as 20 bytes) in a sorted numpy array which is searched with a binary search, the ones added
+    later are kept in a set until there are enough of them to merge them into the array
+    Note: not thread safe
+    """
+    _MERGE_SIZE = 10000
+
+    def __init__(self, hex_sha1s=()):
+        self._sorted = self._to_array(hex_sha1s)
+        self._recent = set()
+
+    def add(self, hex_sha1):
+        digest = self._to_digest(hex_sha1)
+        if digest is None or self._in_sorted(digest):
+            return
+        self._recent.add(digest)
+        if len(self._recent) >= self._MERGE_SIZE:
+            self._sorted = numpy.union1d(self._sorted, numpy.array(list(self._recent), dtype="S20"))
+            self._recent.clear()
+
+    def __contains__(self, hex_sha1):
+        digest = self._to_digest(hex_sha1)
+        return digest is not None and (digest in self._recent or self._in_sorted(digest))
+
+    def __len__(self):
+        return len(self._sorted) + len(self._recent)
+
+    def _in_sorted(self, digest):
+        position = numpy.searchsorted(self._sorted, digest)
+        # note numpy strips the trailing null bytes of the values of the array
+        return position < len(self._sorted) and self._sorted[position] == digest.rstrip(b"\0")
+
+    @classmethod
+    def _to_array(cls, hex_sha1s):
+        digests = [digest for digest in (cls._to_digest(hex_sha1) for hex_sha1 in hex_sha1s) if digest is not None]
+        return numpy.unique(numpy.array(digests, dtype="S20"))
+
+    @staticmethod
+    def _to_digest(hex_sha1):
+        """
+        :return: the 20 bytes of the sha1 (None if it isn't a valid hex sha1)
+        """
+        if not hex_sha1 or len(hex_sha1) != 40:
+            return None
+        try:
+            return binascii.unhexlify(hex_sha1)
+        except TypeError:
+            return None
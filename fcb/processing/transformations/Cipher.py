@@ -1,20 +1,117 @@
 """
 Based on code available in http://eli.thegreenplace.net/2010/06/25/aes-encryption-of-files-in-python-with-pycrypto/
+
+Two formats (modes) are supported:
+    cbc: <data size (8 bytes, little endian)><iv (16 bytes)><AES-CBC encrypted data padded with spaces>
+    ctr_hmac: <magic (8 bytes)><nonce (8 bytes)><AES-CTR encrypted data><HMAC-SHA512 of everything before it>
+        The counter of each block is <nonce><block number (8 bytes, big endian)>, so segments of the data can be
+        encrypted independently (in parallel). Encryption and authentication keys are derived from the key.
+        The last byte of the magic makes it an impossible data size for the cbc format, so both can be told apart.
+
+If pycryptodomex is installed it is used instead of pycrypto (it uses AES-NI instructions when available).
 """
+import hashlib
+import hmac
+import io
 import os
 import string
 import random
 import struct
+from functools import partial
+
 from Crypto.Cipher import AES
+from Crypto.Util import Counter
 
-from fcb.framework.workers import hd_worker_pool
+try:
+    from Cryptodome.Cipher import AES as _AesNi
+except ImportError:
+    _AesNi = None
+
+from fcb.framework import workers
 from fcb.framework.workflow.HeavyPipelineTask import HeavyPipelineTask
 from fcb.processing.models.FileInfo import FileInfo
+from fcb.utils import digest, parallel_compression
+from fcb.utils.Settings import InvalidSettings
+
+
+MODE_CBC = "cbc"
+MODE_CTR_HMAC = "ctr_hmac"
+
+_CTR_MAGIC = "fcbctr\x01\xff"  # includes the format version
+_CTR_NONCE_SIZE = 8
+_CTR_MAC_HASH = hashlib.sha512  # faster than sha256 in 64 bits cpus
+_CTR_MAC_SIZE = _CTR_MAC_HASH().digest_size
+# amount of data encrypted by each worker when encrypting in parallel (must be a multiple of AES.block_size)
+_CTR_SEGMENT_SIZE = 4 * 1024 * 1024
+
+_IO_BUFFER_SIZE = 4 * 1024 * 1024
+
+_random = random.SystemRandom()
+
+
+def _check_mode(mode):
+    if mode not in (MODE_CBC, MODE_CTR_HMAC):
+        raise InvalidSettings("Unknown cipher mode '%s' (known modes: %s, %s)" % (mode, MODE_CBC, MODE_CTR_HMAC))
+
+
+def _derive_ctr_keys(key):
+    """
+    :return: (encryption key, authentication key)
+    """
+    return (hmac.new(key, "fcb ctr_hmac encryption", hashlib.sha256).digest(),
+            hmac.new(key, "fcb ctr_hmac authentication", hashlib.sha256).digest())
+
+
+def _new_cbc_cipher(key, iv):
+    if _AesNi is not None:
+        return _AesNi.new(key, _AesNi.MODE_CBC, iv)
+    return AES.new(key, AES.MODE_CBC, iv)
+
+
+def _new_ctr_cipher(key, nonce, offset=0):
+    if _AesNi is not None:
+        return _AesNi.new(key, _AesNi.MODE_CTR, nonce=nonce, initial_value=offset // AES.block_size)
+    return AES.new(key, AES.MODE_CTR,
+                   counter=Counter.new(64, prefix=nonce, initial_value=offset // AES.block_size))
+
+
+def _buffer_view(buf, size):
+    """
+    :return: view (no copy) of the first size bytes of buf (bytearray) which can be passed to the AES library in use
+    """
+    return memoryview(buf)[:size] if _AesNi is not None else buffer(buf, 0, size)
 
-_worker_pool = hd_worker_pool
+
+def _to_str(data):
+    return data.tobytes() if isinstance(data, memoryview) else str(data)
+
+
+def _ctr_crypt(key, nonce, offset, data):
+    """ encrypts (or decrypts) a segment of data which starts at offset (must be a multiple of AES.block_size) """
+    return _new_ctr_cipher(key, nonce, offset).encrypt(data)
+
+
+def _open_encrypting_writer(mode, fileobj, key, data_size=None, workers=1):
+    if mode == MODE_CTR_HMAC:
+        return _CtrHmacEncryptingWriter(fileobj=fileobj, key=key, workers=workers)
+    return _CbcEncryptingWriter(fileobj=fileobj, key=key, data_size=data_size)
 
 
 class Cipher(HeavyPipelineTask):
+    worker_pool_names = ("cipher", workers.HARD_DRIVE_POOL)
+    _mode = MODE_CBC
+    _workers = 1
+
+    def do_init(self, mode=MODE_CBC, workers=1):
+        """
+        :param mode: format of the encrypted files (MODE_CBC or MODE_CTR_HMAC)
+        :param workers: amount of processes to encrypt in (only used by MODE_CTR_HMAC, 0 means one per cpu)
+        """
+        HeavyPipelineTask.do_init(self)
+        _check_mode(mode)
+        self._mode = mode
+        self._workers = workers
+
     @classmethod
     def get_extension(cls):
         return ".enc"
@@ -33,25 +130,22 @@ class Cipher(HeavyPipelineTask):
         dst_file_path = block.processed_data_file_info.path + self.get_extension()
         self.log.debug("Encrypting file '%s' with key '%s' to file '%s'",
                        in_file_path, cipher_key, dst_file_path)
-        self.encrypt_file(key=cipher_key,
-                          in_filename=in_file_path,
-                          out_filename=dst_file_path)
         block.cipher_key = cipher_key
-        block.ciphered_file_info = FileInfo(dst_file_path)
+        block.ciphered_file_info = self.encrypt_file(key=cipher_key,
+                                                     in_filename=in_file_path,
+                                                     out_filename=dst_file_path,
+                                                     mode=self._mode,
+                                                     workers=self._workers)
         block.latest_file_info = block.ciphered_file_info
         return block
 
-    # override from HeavyPipelineTask
-    def get_worker_channel(self):
-        return _worker_pool.get_worker()
-
     @classmethod
     def gen_key(cls, size):
-        return ''.join(random.choice("".join((string.letters, string.digits, string.punctuation))) for _ in range(size))
+        return ''.join(_random.choice("".join((string.letters, string.digits, string.punctuation))) for _ in range(size))
 
     @classmethod
-    def encrypt_file(cls, key, in_filename, out_filename=None, chunksize=64 * 1024):
-        """ Encrypts a file using AES (CBC mode) with the
+    def encrypt_file(cls, key, in_filename, out_filename=None, chunksize=_IO_BUFFER_SIZE, mode=MODE_CBC, workers=1):
+        """ Encrypts a file using AES (CBC or CTR+HMAC mode) with the
             given key.
     
             key:
@@ -69,45 +163,71 @@ class Cipher(HeavyPipelineTask):
                 Sets the size of the chunk which the function
                 uses to read and encrypt the file. Larger chunk
                 sizes can be faster for some files and machines.
-                chunksize must be divisible by 16.
+
+            mode:
+                MODE_CBC or MODE_CTR_HMAC (see module documentation)
+
+            workers:
+                Amount of processes to encrypt in (only used by
+                MODE_CTR_HMAC, 0 means one per cpu)
+
+            return:
+                FileInfo of the encrypted file (with its sha1 already
+                calculated while it was written)
         """
         if not out_filename:
             out_filename = in_filename + '.enc'
 
-        iv = ''.join(chr(random.randint(0, 0xFF)) for _ in range(16))
-        encryptor = AES.new(key, AES.MODE_CBC, iv)
+        _check_mode(mode)
+        key = str(key)
         filesize = os.path.getsize(in_filename)
 
-        with open(in_filename, 'rb') as infile:
+        with io.open(in_filename, 'rb') as infile:
             with open(out_filename, 'wb') as outfile:
-                outfile.write(struct.pack('<Q', filesize))
-                outfile.write(iv)
+                encrypting_outfile = _open_encrypting_writer(mode, outfile, key, data_size=filesize, workers=workers)
 
+                # the same buffer is reused for every chunk (and passed to the encryptor without copying it)
+                buf = bytearray(chunksize)
                 while True:
-                    chunk = infile.read(chunksize)
-                    if len(chunk) == 0:
+                    read = infile.readinto(buf)
+                    if not read:
                         break
-                    elif len(chunk) % 16 != 0:
-                        chunk += ' ' * (16 - len(chunk) % 16)
+                    encrypting_outfile.write(_buffer_view(buf, read))
+                encrypting_outfile.close()
 
-                    outfile.write(encryptor.encrypt(chunk))
+        return encrypting_outfile.file_info(out_filename)
+
+    @classmethod
+    def gen_iv(cls):
+        return os.urandom(AES.block_size)
 
     @classmethod
-    def decrypt_file(cls, key, in_filename, out_filename=None, chunksize=24 * 1024):
-        """ Decrypts a file using AES (CBC mode) with the
-            given key. Parameters are similar to encrypt_file,
-            with one difference: out_filename, if not supplied
-            will be in_filename without its last extension
-            (i.e. if in_filename is 'aaa.zip.enc' then
-            out_filename will be 'aaa.zip')
+    def decrypt_file(cls, key, in_filename, out_filename=None, chunksize=_IO_BUFFER_SIZE):
+        """ Decrypts a file using AES with the given key. The
+            mode is detected from the file header. Parameters
+            are similar to encrypt_file, with one difference:
+            out_filename, if not supplied will be in_filename
+            without its last extension (i.e. if in_filename is
+            'aaa.zip.enc' then out_filename will be 'aaa.zip')
+
+            chunksize must be divisible by 16.
+
+            raise IOError: if the file can't be authenticated
+            (MODE_CTR_HMAC only)
         """
         if not out_filename:
             out_filename = os.path.splitext(in_filename)[0]
+        key = str(key)
+
+        with io.open(in_filename, 'rb') as infile:
+            header = infile.read(struct.calcsize('Q'))
+            if header == _CTR_MAGIC:
+                cls._decrypt_ctr_hmac(key, infile, out_filename, os.path.getsize(in_filename), chunksize)
+                return
 
-        with open(in_filename, 'rb') as infile:
-            origsize = struct.unpack('<Q', infile.read(struct.calcsize('Q')))[0]
+            origsize = struct.unpack('<Q', header)[0]
             iv = infile.read(16)
-            decryptor = AES.new(key, AES.MODE_CBC, iv)
+            decryptor = _new_cbc_cipher(key, iv)
 
             with open(out_filename, 'wb') as outfile:
                 while True:
@@ -117,3 +237,157 @@ class Cipher(HeavyPipelineTask):
                     outfile.write(decryptor.decrypt(chunk))
 
                 outfile.truncate(origsize)
+
+    @classmethod
+    def _decrypt_ctr_hmac(cls, key, infile, out_filename, filesize, chunksize):
+        decryption_key, authentication_key = _derive_ctr_keys(key)
+        nonce = infile.read(_CTR_NONCE_SIZE)
+        mac = hmac.new(authentication_key, _CTR_MAGIC + nonce, _CTR_MAC_HASH)
+        decryptor = _new_ctr_cipher(decryption_key, nonce)
+        remaining = filesize - len(_CTR_MAGIC) - _CTR_NONCE_SIZE - _CTR_MAC_SIZE
+        if len(nonce) != _CTR_NONCE_SIZE or remaining < 0:
+            raise IOError("Encrypted file '%s' is truncated" % infile.name)
+
+        buf = bytearray(chunksize)
+        with open(out_filename, 'wb') as outfile:
+            while remaining > 0:
+                read = infile.readinto(memoryview(buf)[:min(remaining, len(buf))])
+                if not read:
+                    break
+                chunk = _buffer_view(buf, read)
+                mac.update(chunk)
+                outfile.write(decryptor.decrypt(chunk))
+                remaining -= read
+
+        if remaining != 0 or not hmac.compare_digest(mac.digest(), infile.read(_CTR_MAC_SIZE)):
+            os.remove(out_filename)
+            raise IOError("Encrypted file '%s' couldn't be authenticated (wrong key or corrupted file)" % infile.name)
+
+
+class _CbcEncryptingWriter(object):
+    """
+    Write only file like object which encrypts the data written to it into fileobj (with the same format generated
+    by Cipher.encrypt_file)
+
+    If data_size is not known in advance, fileobj must be seekable because the header (which holds the size of the
+    data) is written when closing
+    The underlying fileobj is not closed by close()
+    """
+
+    def __init__(self, fileobj, key, data_size=None):
+        self._raw_fileobj = fileobj
+        self._fileobj = digest.DigestingWriter(fileobj)
+        self._data_size = data_size
+        self._written = 0
+        self._pending = ''  # data which couldn't be encrypted yet (not enough for an AES block)
+        iv = Cipher.gen_iv()
+        self._encryptor = _new_cbc_cipher(key, iv)
+        self._fileobj.write(struct.pack('<Q', data_size if data_size is not None else 0))
+        self._fileobj.write(iv)
+
+    def write(self, data):
+        self._written += len(data)
+        data = self._pending + _to_str(data) if self._pending else data
+        to_encrypt = len(data) - len(data) % AES.block_size
+        if to_encrypt:
+            self._fileobj.write(self._encryptor.encrypt(data if to_encrypt == len(data) else data[:to_encrypt]))
+        self._pending = _to_str(data[to_encrypt:])
+
+    def close(self):
+        if self._pending:
+            self._fileobj.write(self._encryptor.encrypt(
+                self._pending + ' ' * (AES.block_size - len(self._pending))))
+            self._pending = ''
+        if self._data_size is None:
+            self._raw_fileobj.seek(0)
+            self._raw_fileobj.write(struct.pack('<Q', self._written))
+            self._raw_fileobj.seek(0, os.SEEK_END)
+
+    def file_info(self, path):
+        """
+        :return: FileInfo of the encrypted file (written in path)
+        """
+        if self._data_size is None:
+            # the header is written at the end, so the file couldn't be digested while being written
+            return FileInfo(path)
+        return FileInfo(path, sha1=self._fileobj.hexdigest(), size=self._fileobj.size)
+
+
+class _AuthenticatingWriter(object):
+    """ Writes into fileobj updating mac with the data written """
+
+    def __init__(self, fileobj, mac):
+        self._fileobj = fileobj
+        self._mac = mac
+
+    def write(self, data):
+        self._mac.update(data)
+        self._fileobj.write(data)
+
+
+class _CtrHmacEncryptingWriter(object):
+    """
+    Write only file like object which encrypts the data written to it into fileobj (MODE_CTR_HMAC format)
+
+    Data is encrypted in the calling thread (workers=1) or by segments in a process pool (see parallel_compression)
+    The underlying fileobj is not closed by close()
+    """
+
+    def __init__(self, fileobj, key, workers=1):
+        self._fileobj = digest.DigestingWriter(fileobj)
+        encryption_key, authentication_key = _derive_ctr_keys(key)
+        nonce = os.urandom(_CTR_NONCE_SIZE)
+        self._fileobj.write(_CTR_MAGIC + nonce)
+        self._mac = hmac.new(authentication_key, _CTR_MAGIC + nonce, _CTR_MAC_HASH)
+        self._authenticating_fileobj = _AuthenticatingWriter(self._fileobj, self._mac)
+        if workers == 1:
+            self._encryptor = _new_ctr_cipher(encryption_key, nonce)
+            self._parallel_writer = None
+        else:
+            self._parallel_writer = parallel_compression.ParallelChunkWriter(
+                fileobj=self._authenticating_fileobj, chunk_function=partial(_ctr_crypt, encryption_key, nonce),
+                workers=workers, chunk_size=_CTR_SEGMENT_SIZE)
+
+    def write(self, data):
+        if self._parallel_writer is not None:
+            self._parallel_writer.write(_to_str(data))
+        else:
+            self._authenticating_fileobj.write(self._encryptor.encrypt(data))
+
+    def close(self):
+        if self._parallel_writer is not None:
+            self._parallel_writer.close()
+        self._fileobj.write(self._mac.digest())
+
+    def file_info(self, path):
+        """
+        :return: FileInfo of the encrypted file (written in path)
+        """
+        return FileInfo(path, sha1=self._fileobj.hexdigest(), size=self._fileobj.size)
+
+
+class CipherStreamTransformation(object):
+    """
+    Encrypts the containers while they are being generated (see Compressor.Block) so the not encrypted container
+    is never written to disk
+    Sets in the block the same information a Cipher task would.
+    """
+    extension = Cipher.get_extension()
+
+    def __init__(self, mode=MODE_CBC, workers=1):
+        """
+        :param mode: see Cipher.do_init
+        :param workers: see Cipher.do_init
+        """
+        _check_mode(mode)
+        self._mode = mode
+        self._workers = workers
+
+    def open_writer(self, block, fileobj):
+        block.cipher_key = Cipher.gen_key(32)
+        return _open_encrypting_writer(self._mode, fileobj, block.cipher_key, workers=self._workers)
+
+    # noinspection PyMethodMayBeStatic
+    def on_finished(self, block, writer, path):
+        block.ciphered_file_info = writer.file_info(path)
+        block.latest_file_info = block.ciphered_file_info
@@ -1,76 +1,409 @@
+import io
+import struct
+import zlib
+
 from PIL import Image
 import numpy
 import math
 
-from fcb.framework.workers import hd_worker_pool
+from fcb.framework import workers
 from fcb.framework.workflow.HeavyPipelineTask import HeavyPipelineTask
 from fcb.processing.models.FileInfo import FileInfo
+from fcb.utils import digest
 from fcb.utils.log_helper import get_logger_module
 
 _log = get_logger_module("ToImage")
 
+_PNG_SIGNATURE = "\x89PNG\r\n\x1a\n"
+_PNG_COLOR_TYPE_RGB = 2
+_PNG_FILTER_NONE = 0
+_PNG_FILTER_SUB = 1
+_PNG_FILTER_UP = 2
+# maximum size of the IDAT chunks written (same as the one used by PIL)
+_PNG_MAX_IDAT_SIZE = 64 * 1024
+# containers are already compressed (and most likely encrypted), so higher levels don't reduce the image size
+_CHUNKED_ZLIB_LEVEL = 1
+# amount of image bytes handled at once by the chunked encoder/decoder
+_CHUNK_SIZE = 4 * 1024 * 1024
+# images whose exact dimensions are more elongated than this are padded to be (near) square
+_MAX_ASPECT_RATIO = 4
+# trailer of padded images: amount of bytes to remove (padding + trailer), magic and version. The version (last
+#   byte of the image) can't be confused with the padding length of the exact images (between 1 and 3)
+_TRAILER_FORMAT = ">Q4sB"
+_TRAILER_MAGIC = "fcbi"
+_TRAILER_VERSION = 4
+_TRAILER_SIZE = struct.calcsize(_TRAILER_FORMAT)
+
+_small_primes = numpy.array([2, 3, 5, 7], dtype=numpy.int64)
+
+
+def _primes_up_to(limit):
+    """
+    :return: numpy array with (at least) every prime lower or equal to limit (table is cached and grown on demand)
+    """
+    global _small_primes
+    if _small_primes[-1] < limit:
+        size = max(limit, 2 * _small_primes[-1]) + 1
+        sieve = numpy.ones(size, dtype=numpy.bool_)
+        sieve[:2] = False
+        for candidate in xrange(2, int(math.sqrt(size)) + 1):
+            if sieve[candidate]:
+                sieve[candidate * candidate::candidate] = False
+        _small_primes = numpy.flatnonzero(sieve).astype(numpy.int64)
+    return _small_primes
+
+
+def _prime_factors(number):
+    """
+    :return: list with the prime factors of number (with repetitions)
+    """
+    factors = []
+    primes = _primes_up_to(int(math.sqrt(number)))
+    for prime in primes[number % primes == 0]:
+        prime = int(prime)
+        while number % prime == 0:
+            factors.append(prime)
+            number //= prime
+    if number > 1:
+        factors.append(number)
+    return factors
+
+
+def _divisors(number):
+    divisors = set([1])
+    for factor in _prime_factors(number):
+        divisors.update([divisor * factor for divisor in divisors])
+    return divisors
 
-# TODO image and array manipulation functions need to be optimized (a lot)
 
 def _determine_dimensions(num_of_pixels):
     """
     Given a number of pixels, determines the largest width and height that define a
       rectangle with such an area
     """
-    for x in xrange(int(math.sqrt(num_of_pixels)) + 1, 1, -1):
-        if num_of_pixels % x == 0:
-            return num_of_pixels // x, x
-    return 1, num_of_pixels  # if no better dimensions could be found, use a "line"
+    max_columns = int(math.sqrt(num_of_pixels)) + 1
+    columns = max([divisor for divisor in _divisors(num_of_pixels) if 1 < divisor <= max_columns] or [None])
+    if columns is None:
+        return 1, num_of_pixels  # if no better dimensions could be found, use a "line"
+    return num_of_pixels // columns, columns
+
+
+def _image_layout(data_len):
+    """
+    :return: (rows, columns, trailer) of the image which holds data_len bytes. The image holds the data followed by
+             zeros and the trailer (at the end of the image).
+    Images with exact dimensions have between 1 and 3 bytes of padding (the last one holds the amount of padding
+      bytes, that is, the trailer is a single byte).
+    When the exact dimensions have an unacceptable aspect ratio (e.g. the "line" of prime amounts of pixels), the
+      image is near square instead: up to a row of padding plus a trailer with the length of padding to remove.
+    """
+    pad_req = 3 - (data_len % 3)
+    num_of_pixels = (data_len + pad_req) // 3
+    rows, columns = _determine_dimensions(num_of_pixels)
+    if max(rows, columns) <= _MAX_ASPECT_RATIO * min(rows, columns):
+        return rows, columns, chr(pad_req)
+
+    num_of_pixels = (data_len + _TRAILER_SIZE + 2) // 3
+    columns = int(math.ceil(math.sqrt(num_of_pixels)))
+    rows = (num_of_pixels + columns - 1) // columns
+    to_remove = rows * columns * 3 - data_len
+    return rows, columns, struct.pack(_TRAILER_FORMAT, to_remove, _TRAILER_MAGIC, _TRAILER_VERSION)
+
+
+def _padding_length(tail):
+    """
+    :param tail: numpy array (uint8) with the last bytes of the image (at least a row or the whole image)
+    :return: amount of bytes at the end of the image which aren't data
+    """
+    if 1 <= tail[-1] <= 3:
+        return int(tail[-1])
+    if tail[-1] == _TRAILER_VERSION and len(tail) >= _TRAILER_SIZE:
+        to_remove, magic, _ = struct.unpack(_TRAILER_FORMAT, tail[-_TRAILER_SIZE:].tostring())
+        if magic == _TRAILER_MAGIC:
+            return to_remove
+    raise IOError("Image has an unknown trailer (it wasn't generated by this application)")
+
+
+def _read_into(fileobj, buf):
+    """ Fills buf (a writable buffer) with the data read from fileobj, returns the amount of bytes read """
+    view = memoryview(buf)
+    read = 0
+    while read < len(view):
+        just_read = fileobj.readinto(view[read:])
+        if not just_read:
+            break
+        read += just_read
+    return read
 
 
 def _to_image_array(file_path):
     """
     Converts the file in file_path to a numpy array (matrix) representing an RGB image
-    The dimensions of the image are calculated using __determine_dimensions.
-    Padding is added provide enough bytes to generate the image (between 1 and 3 bytes can be added).
+    The dimensions of the image are calculated using _image_layout.
+    The file is read directly into the (padded) image buffer, so no other copy of its content is made.
     """
     _log.debug("File '%s' to image", file_path)
-    data = numpy.fromfile(file_path, numpy.uint8)
-    orig_len = len(data)
-    pad_req = (3 - (orig_len % 3))
-    pad_req += 3 if pad_req == 0 else 0
-    final_len = orig_len + pad_req
-    num_of_pixels = final_len // 3
-    w, h = _determine_dimensions(num_of_pixels)
-    reshaped = numpy.zeros((w, h, 3), dtype=numpy.uint8)
-    for i in xrange(final_len):
-        sidx = i // 3
-        y = sidx % h
-        x = sidx // h
-        s = i % 3
-        reshaped[x, y, s] = data[i] if i < orig_len else 0
-    reshaped[-1, -1, 2] = pad_req
-
-    return reshaped
-
-
-def from_file_to_image(file_path, img_path):
-    data = _to_image_array(file_path)
-    img = Image.fromarray(data, 'RGB')
-    img.save(img_path)
+    with io.open(file_path, 'rb') as src_file:
+        orig_len = src_file.seek(0, io.SEEK_END)
+        src_file.seek(0)
+        rows, columns, trailer = _image_layout(orig_len)
+        data = numpy.zeros(rows * columns * 3, dtype=numpy.uint8)
+        if _read_into(src_file, data[:orig_len]) != orig_len:
+            raise IOError("File '%s' changed while it was converted to image" % file_path)
+    data[-len(trailer):] = numpy.frombuffer(trailer, dtype=numpy.uint8)
+    return data.reshape((rows, columns, 3))
+
+
+def _png_chunk(chunk_type, data):
+    return "".join((struct.pack(">I", len(data)), chunk_type, data,
+                    struct.pack(">I", zlib.crc32(chunk_type + data) & 0xffffffff)))
+
+
+class _PngStreamWriter(object):
+    """
+    Writes an RGB PNG image (8 bits per channel, no filtering) whose rows are provided in chunks
+    """
+
+    def __init__(self, fileobj, rows, columns):
+        self._fileobj = fileobj
+        self._compressor = zlib.compressobj(_CHUNKED_ZLIB_LEVEL)
+        self._pending = []
+        self._pending_size = 0
+        fileobj.write(_PNG_SIGNATURE)
+        fileobj.write(_png_chunk("IHDR", struct.pack(">IIBBBBB", columns, rows, 8, _PNG_COLOR_TYPE_RGB, 0, 0, 0)))
+
+    def write_rows(self, rows_data):
+        """
+        :param rows_data: numpy array (uint8) with shape (rows, columns * 3)
+        """
+        filtered = numpy.empty((rows_data.shape[0], rows_data.shape[1] + 1), dtype=numpy.uint8)
+        filtered[:, 0] = _PNG_FILTER_NONE
+        filtered[:, 1:] = rows_data
+        self._add_compressed(self._compressor.compress(filtered.tostring()))
+
+    def close(self):
+        self._add_compressed(self._compressor.flush())
+        self._write_idat(force=True)
+        self._fileobj.write(_png_chunk("IEND", ""))
+
+    def _add_compressed(self, data):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+            self._write_idat()
+
+    def _write_idat(self, force=False):
+        if self._pending_size < _PNG_MAX_IDAT_SIZE and not (force and self._pending_size):
+            return
+        data = "".join(self._pending)
+        offset = 0
+        while len(data) - offset >= _PNG_MAX_IDAT_SIZE:
+            self._fileobj.write(_png_chunk("IDAT", data[offset:offset + _PNG_MAX_IDAT_SIZE]))
+            offset += _PNG_MAX_IDAT_SIZE
+        if force and offset < len(data):
+            self._fileobj.write(_png_chunk("IDAT", data[offset:]))
+            offset = len(data)
+        self._pending = [data[offset:]] if offset < len(data) else []
+        self._pending_size = len(data) - offset
+
+
+def _write_image_chunked(src_file, orig_len, img_file):
+    """
+    Writes the image of the content of src_file reading it by chunks of rows (so memory usage is bounded)
+    The pixels of the image are the same ones _to_image_array generates.
+    """
+    rows, columns, trailer = _image_layout(orig_len)
+    row_size = columns * 3
+    rows_per_chunk = max(1, _CHUNK_SIZE // row_size)
+    writer = _PngStreamWriter(img_file, rows, columns)
+    buf = numpy.empty(rows_per_chunk * row_size, dtype=numpy.uint8)
+    trailer = numpy.frombuffer(trailer, dtype=numpy.uint8)
+    trailer_start = rows * row_size - len(trailer)
+    remaining = orig_len
+    for first_row in xrange(0, rows, rows_per_chunk):
+        chunk_rows = min(rows_per_chunk, rows - first_row)
+        chunk = buf[:chunk_rows * row_size]
+        to_read = min(remaining, len(chunk))
+        if _read_into(src_file, chunk[:to_read]) != to_read:
+            raise IOError("File changed while it was converted to image")
+        remaining -= to_read
+        chunk[to_read:] = 0
+        chunk_start = first_row * row_size
+        chunk_end = chunk_start + len(chunk)
+        if chunk_end > trailer_start:  # the trailer may span more than one chunk (tiny rows)
+            start = max(chunk_start, trailer_start)
+            chunk[start - chunk_start:] = trailer[start - trailer_start:chunk_end - trailer_start]
+        writer.write_rows(chunk.reshape((chunk_rows, row_size)))
+    writer.close()
+
+
+def from_file_to_image(file_path, img_path, chunked=False):
+    """
+    :param chunked: if the image should be generated by chunks of rows (bounded memory usage). Chunked images
+                    have the same pixels but aren't byte-identical to the ones generated by PIL.
+    :return: FileInfo of the generated image (with its sha1 already calculated while it was written)
+    """
+    with open(img_path, 'wb') as img_file:
+        digesting_img_file = digest.DigestingWriter(img_file)
+        if chunked:
+            _log.debug("File '%s' to image (chunked)", file_path)
+            with io.open(file_path, 'rb') as src_file:
+                orig_len = src_file.seek(0, io.SEEK_END)
+                src_file.seek(0)
+                _write_image_chunked(src_file, orig_len, digesting_img_file)
+        else:
+            img = Image.fromarray(_to_image_array(file_path), 'RGB')
+            img.save(digesting_img_file, format='PNG')
+    return FileInfo(img_path, sha1=digesting_img_file.hexdigest(), size=digesting_img_file.size)
+
+
+class _UnsupportedPng(Exception):
+    pass
+
+
+def _read_png_chunks(img_file):
+    if img_file.read(len(_PNG_SIGNATURE)) != _PNG_SIGNATURE:
+        raise _UnsupportedPng("not a png file")
+    while True:
+        header = img_file.read(8)
+        if len(header) < 8:
+            raise IOError("Truncated png file")
+        length, chunk_type = struct.unpack(">I4s", header)
+        data = img_file.read(length)
+        img_file.read(4)  # crc (the content is validated by the decompression and the padding)
+        if len(data) < length:
+            raise IOError("Truncated png file")
+        yield chunk_type, data
+        if chunk_type == "IEND":
+            return
+
+
+def _unfilter_rows(filtered, prev_row, row_size):
+    """
+    Reverts the filtering of the rows (rows with filter byte at the beginning)
+    :return: the unfiltered rows (numpy array with shape (rows, row_size))
+    """
+    filtered = filtered.reshape((-1, row_size + 1))
+    filter_types = filtered[:, 0]
+    rows = filtered[:, 1:]
+    if not filter_types.any():  # fast path (images generated in chunked mode)
+        return rows
+    rows = rows.copy()
+    for row_num, filter_type in enumerate(filter_types):
+        row = rows[row_num]
+        if filter_type == _PNG_FILTER_SUB:
+            # each channel is the cumulative sum (mod 256) of the channel along the row
+            row[:] = numpy.cumsum(row.reshape((-1, 3)), axis=0, dtype=numpy.uint8).reshape(-1)
+        elif filter_type == _PNG_FILTER_UP:
+            row += prev_row
+        elif filter_type != _PNG_FILTER_NONE:
+            raise _UnsupportedPng("filter type %d is not supported" % filter_type)
+        prev_row = row
+    return rows
+
+
+def _read_png_header(img_file):
+    """
+    :return: (columns, rows, chunks) where chunks is an iterator of the (type, data) chunks after the header
+    :raise _UnsupportedPng: if the image isn't an 8 bits RGB non interlaced png
+    """
+    chunks = _read_png_chunks(img_file)
+    chunk_type, ihdr = next(chunks)
+    if chunk_type != "IHDR":
+        raise _UnsupportedPng("png without header")
+    columns, rows, bit_depth, color_type, _, _, interlace = struct.unpack(">IIBBBBB", ihdr)
+    if bit_depth != 8 or color_type != _PNG_COLOR_TYPE_RGB or interlace != 0:
+        raise _UnsupportedPng("not an 8 bits RGB non interlaced png")
+    return columns, rows, chunks
+
+
+def _filtered_rows(chunks, row_size):
+    """
+    Decompresses the image data by chunks
+    :return: iterator of numpy arrays (uint8) with complete filtered rows (each one with its filter byte first)
+    """
+    decompressor = zlib.decompressobj()
+    pending = []
+    pending_size = 0
+    for chunk_type, data in chunks:
+        if chunk_type == "IDAT":
+            data = decompressor.decompress(data)
+            pending.append(data)
+            pending_size += len(data)
+        if pending_size < _CHUNK_SIZE and chunk_type != "IEND":
+            continue
+        data = "".join(pending)
+        complete_rows = len(data) // (row_size + 1)
+        pending = [data[complete_rows * (row_size + 1):]]
+        pending_size = len(pending[0])
+        if complete_rows > 0:
+            yield numpy.frombuffer(data, dtype=numpy.uint8, count=complete_rows * (row_size + 1))
+
+
+def _check_filters(img_path):
+    """
+    Reads the filter types of the rows of the image (without unfiltering them)
+    :raise _UnsupportedPng: if the image uses a feature not supported by this decoder, e.g. the Average and Paeth
+                            filters of the adaptive filtering used by PIL (unfiltering them row by row in python
+                            would be much slower than decoding the image with PIL)
+    """
+    with open(img_path, 'rb') as img_file:
+        columns, _, chunks = _read_png_header(img_file)
+        row_size = columns * 3
+        for filtered in _filtered_rows(chunks, row_size):
+            filter_types = filtered.reshape((-1, row_size + 1))[:, 0]
+            if (filter_types > _PNG_FILTER_UP).any():
+                raise _UnsupportedPng("filter type %d is not supported" % filter_types.max())
+
+
+def _image_to_file_chunked(img_path, file_path):
+    """
+    Decodes the image by chunks of rows (so memory usage is bounded)
+    Nothing is written to file_path unless the image is supported (it is checked first, see _check_filters)
+    :raise _UnsupportedPng: if the image uses a feature not supported by this decoder
+    """
+    _check_filters(img_path)
+    with open(img_path, 'rb') as img_file, open(file_path, 'wb') as out_file:
+        columns, _, chunks = _read_png_header(img_file)
+        row_size = columns * 3
+        prev_row = numpy.zeros(row_size, dtype=numpy.uint8)
+        # the last bytes are only written once the padding can be removed (it may span up to two rows)
+        held = numpy.zeros(0, dtype=numpy.uint8)
+        held_size = 2 * row_size + _TRAILER_SIZE + 3
+        for filtered in _filtered_rows(chunks, row_size):
+            unfiltered = _unfilter_rows(filtered, prev_row, row_size)
+            prev_row = unfiltered[-1].copy()
+            # (also makes the rows contiguous, tofile is really slow for non contiguous arrays)
+            data = numpy.concatenate((held, unfiltered.reshape(-1)))
+            data[:-held_size].tofile(out_file)
+            held = data[-held_size:].copy()
+        if len(held) == 0:
+            raise IOError("Image '%s' has no data" % img_path)
+        held[:len(held) - _padding_length(held)].tofile(out_file)
 
 
 def from_image_to_file(img_path, file_path):
     """
-    Expects images created by from_from_file_to_image
+    Expects images created by from_file_to_image
     """
+    try:
+        _image_to_file_chunked(img_path, file_path)
+        return
+    except _UnsupportedPng as e:
+        _log.debug("Image '%s' will be decoded by PIL (%s)", img_path, e)
     img = Image.open(img_path)
-    data = numpy.array(img)
-    data = numpy.reshape(data, len(img.getdata()) * 3)
-    to_remove = data[len(data) - 1]
-    data = numpy.delete(data, xrange(len(data) - to_remove, len(data)))
-    data.tofile(file_path)
+    data = numpy.asarray(img).reshape(-1)
+    data[:len(data) - _padding_length(data)].tofile(file_path)
 
 
-_worker_pool = hd_worker_pool
+class ToImage(HeavyPipelineTask):
+    worker_pool_names = ("to_image", workers.HARD_DRIVE_POOL)
+    _chunked = False
 
+    def do_init(self, chunked=False):
+        HeavyPipelineTask.do_init(self)
+        self._chunked = chunked
 
-class ToImage(HeavyPipelineTask):
     @classmethod
     def get_extension(cls):
         return ".png"
@@ -87,11 +420,6 @@ class ToImage(HeavyPipelineTask):
         src_file_path = block.latest_file_info.path
         img_path = src_file_path + self.get_extension()
         self.log.debug("Converting file '%s' to image '%s'", src_file_path, img_path)
-        from_file_to_image(src_file_path, img_path)
-        block.image_converted_file_info = FileInfo(img_path)
+        block.image_converted_file_info = from_file_to_image(src_file_path, img_path, chunked=self._chunked)
         block.latest_file_info = block.image_converted_file_info
         return block
-
-    # override from HeavyPipelineTask
-    def get_worker_channel(self):
-        return _worker_pool.get_worker()
@@ -1,25 +1,39 @@
-from sqlalchemy.orm.exc import NoResultFound
+from collections import OrderedDict
+from functools import partial
 
-from fcb.database.helpers import get_session
+from fcb.database.helpers import get_db_writer
 from fcb.database.schema import FilesContainer, FilesDestinations, Destination, UploadedFile, FileFragment, \
     FilesInContainers
-from fcb.framework import events
+from fcb.framework import events, dispatch
 from fcb.framework.workflow.PipelineTask import PipelineTask
 
+# maximum amount of values in an "IN" query (SQLite limits the amount of parameters of a statement to 999)
+_MAX_QUERY_PARAMETERS = 500
+
 
 class SentLog(PipelineTask):
-    _session_resource = None
+    """
+    Saves the sent containers (in database and in the sent log file)
+
+    Sent containers are handed on once they are saved in database. If a container can't be saved, the pipeline is
+    stopped and the container is handed on with the error as save_error (so its files are kept, see Cleaner)
+    """
+    _db_writer = None
     _sent_log_file = None
+    _destination_ids = None
 
     def do_init(self, sent_log):
-        self._session_resource = None
+        self._db_writer = get_db_writer()
+        self._destination_ids = {}  # Destination.destination -> Destination.id (only used by the db writer thread)
         self._sent_log_file = open(sent_log, 'a') if sent_log else None
 
     # override from PipelineTask
     def process_data(self, block):
         """expects Block from Compressor"""
+        if getattr(block, 'failed_destinations', None):
+            self.log.warning("Failed to send file '%s' to: %s",
+                             block.processed_data_file_info.basename, str(block.failed_destinations))
         if hasattr(block, 'send_destinations') and block.send_destinations:
-            self.fire(events.FileProcessed(block))
             self._log_in_db(block)
             if self._sent_log_file:
                 self._log_in_sent_log(block)
@@ -27,100 +41,143 @@ class SentLog(PipelineTask):
                           str(block.send_destinations),
                           block.processed_data_file_info.basename,
                           str([file_info.path for file_info in block.content_file_infos]))
-        else:
-            self.log.info("File %s wasn't sent", block.processed_data_file_info.basename)
+            return None  # handed on once saved (see _on_block_saved)
+        self.log.info("File %s wasn't sent", block.processed_data_file_info.basename)
         return block
 
     # override from PipelineTask
     def on_stopped(self):
         if self._sent_log_file:
             self._sent_log_file.close()
-        if self._session_resource:
-            with self._session_resource as session:
-                session.commit()
-                session.close()
+        self._db_writer.flush()
 
     # --- low visibility methods ------------------------------
+    def _get_destination_ids(self, session, destinations, new_destination_ids):
+        """
+        :param session: session of the db writer
+        :param new_destination_ids: dict where the ids not cached yet are added (cached once committed, see _log_in_db)
+        :return: list with the Destination.id of each destination (destinations are added if required)
+        """
+        for destination in destinations:
+            if destination not in self._destination_ids and destination not in new_destination_ids:
+                destination_instance = Destination.get_or_add(session, destination)
+                session.flush()  # get its id
+                new_destination_ids[destination] = destination_instance.id
+        return [self._destination_ids.get(destination) or new_destination_ids[destination]
+                for destination in destinations]
+
     @staticmethod
-    def _get_uploaded_file(session, file_info, fragment_count=0):
+    def _get_uploaded_file_ids(session, sha1s):
         """
-        :param session: locked session (with self._session_resource as >> session <<)
-        :param file_info: contains file information to save or query
-        :param fragment_count: amount of fragments associated to the file
-        :return: an UploadedFile associated to the file_info
+        :param session: session of the db writer
+        :return: dict sha1 -> UploadedFile.id of the sha1s already in database
         """
-        try:
-            return session.query(UploadedFile).filter(UploadedFile.sha1 == file_info.sha1).one()
-        except NoResultFound:
-            new_instance = UploadedFile(
-                sha1=file_info.sha1,
-                file_name=file_info.upath,
-                fragment_count=fragment_count
-            )
-            session.add(new_instance)
-            return new_instance
+        ids = {}
+        sha1s = list(sha1s)
+        for start in xrange(0, len(sha1s), _MAX_QUERY_PARAMETERS):
+            for uploaded_file_id, sha1 in session \
+                    .query(UploadedFile.id, UploadedFile.sha1) \
+                    .filter(UploadedFile.sha1.in_(sha1s[start:start + _MAX_QUERY_PARAMETERS])) \
+                    .order_by(UploadedFile.id):
+                ids[sha1] = uploaded_file_id  # the latest one if there are many
+        return ids
 
     def _log_in_db(self, block):
-        if not self._session_resource:
-            self._session_resource = get_session()
-        with self._session_resource as session:
-            session.autoflush = False  # to avoid IntegrityError raised during testing
-
-            sent_file_info = block.latest_file_info
-
-            # a new container has been saved
-            file_container = FilesContainer(
-                sha1=sent_file_info.sha1,
-                file_name=sent_file_info.basename,
-                encryption_key=block.cipher_key if hasattr(block, 'cipher_key') else '',
-                container_size=sent_file_info.size
-            )
-            session.add(file_container)
-            ''' FIXME we need the container id because file_destination is not getting it
-                (not working example of SQLAlchemy) '''
-            session.flush()  # get container id
-
-            # associate destinations to the container
-            for destination in block.send_destinations if hasattr(block, 'send_destinations') else []:
-                file_destination = FilesDestinations()
-                file_destination.destination = Destination.get_or_add(session, destination)
-                # FIXME according to the example in SQLAlchemy, this shouldn't be needed
-                file_destination.file_containers_id = file_container.id
-                if hasattr(block, 'destinations_verif_data') and destination in block.destinations_verif_data:
-                    file_destination.verification_info = block.destinations_verif_data[destination]
-                file_container.files_destinations.append(file_destination)
-
-            # save/update each file in the container
-            for file_info in block.content_file_infos:
+        """
+        Queues the block to be saved by the db writer (so the pipeline doesn't wait for the database)
+        """
+        new_destination_ids = {}
+
+        def on_done(error):
+            if error is None:  # the ids of a rolled back transaction may not exist
+                self._destination_ids.update(new_destination_ids)
+            dispatch.manager.call_soon(self._on_block_saved, block, error)
+
+        self._db_writer.submit(partial(self._save_block, block, new_destination_ids), on_done=on_done)
+
+    def _on_block_saved(self, block, error):
+        """
+        Hands on the block once the db writer is done with it (called in the main loop)
+        """
+        if error is None:
+            self.fire(events.FileProcessed(block))
+        else:
+            self.log.error("Failed to save sent file '%s' in database (%s), stopping. Its files are kept, its encryption "
+                           "key is only in the sent files log (if any)", block.processed_data_file_info.basename, error)
+            block.save_error = error
+            self.fire(events.SentContainerNotSaved())
+        self.hand_on_to_next_task(block)
+
+    def _save_block(self, block, new_destination_ids, session):
+        """
+        Saves the container, its destinations and content files with a few bulk statements
+        (done in the db writer thread)
+        :param new_destination_ids: dict where the ids of destinations not cached yet are added
+        """
+        new_destination_ids.clear()  # in case the operation is retried
+        sent_file_info = block.latest_file_info
+        send_destinations = block.send_destinations if hasattr(block, 'send_destinations') else []
+        verification_data = block.destinations_verif_data if hasattr(block, 'destinations_verif_data') else {}
+
+        # a new container has been saved
+        file_container_id = session.execute(FilesContainer.__table__.insert().values(
+            sha1=sent_file_info.sha1,
+            file_name=sent_file_info.basename,
+            encryption_key=block.cipher_key if hasattr(block, 'cipher_key') else '',
+            container_size=sent_file_info.size
+        )).inserted_primary_key[0]
+
+        # associate destinations to the container
+        destination_ids = self._get_destination_ids(session, send_destinations, new_destination_ids)
+        if destination_ids:
+            session.execute(FilesDestinations.__table__.insert(), [
+                dict(file_containers_id=file_container_id,
+                     destinations_id=destination_id,
+                     verification_info=verification_data.get(destination))
+                for destination, destination_id in zip(send_destinations, destination_ids)])
+
+        # save each (whole) file not already saved
+        whole_file_infos = OrderedDict()  # sha1 -> (file info, fragment count)
+        for file_info in block.content_file_infos:
+            if hasattr(file_info, 'fragment_info'):  # check if it is a fragment
+                whole_file_info = file_info.fragment_info.file_info
+                whole_file_infos.setdefault(whole_file_info.sha1,
+                                            (whole_file_info, file_info.fragment_info.fragments_count))
+            else:  # not fragmented file
+                whole_file_infos.setdefault(file_info.sha1, (file_info, 0))
+        uploaded_file_ids = self._get_uploaded_file_ids(session, whole_file_infos.keys())
+        new_uploaded_files = [
+            dict(sha1=sha1, file_name=file_info.upath, fragment_count=fragment_count)
+            for sha1, (file_info, fragment_count) in whole_file_infos.iteritems()
+            if sha1 not in uploaded_file_ids]
+        if new_uploaded_files:
+            session.execute(UploadedFile.__table__.insert(), new_uploaded_files)
+            uploaded_file_ids.update(self._get_uploaded_file_ids(
+                session, (uploaded_file["sha1"] for uploaded_file in new_uploaded_files)))
+
+        # save the fragments and the files in the container
+        file_fragments = []
+        files_in_container = OrderedDict()
+        for file_info in block.content_file_infos:
+            if hasattr(file_info, 'fragment_info'):  # check if it is a fragment
+                uploaded_file_id = uploaded_file_ids[file_info.fragment_info.file_info.sha1]
+                uploaded_file_fragment_number = file_info.fragment_info.fragment_num
+                file_fragments.append(dict(
+                    fragment_sha1=file_info.sha1,
+                    fragment_name=file_info.upath,
+                    fragment_number=file_info.fragment_info.fragment_num,
+                    file_id=uploaded_file_id))
+            else:
+                uploaded_file_id = uploaded_file_ids[file_info.sha1]
                 uploaded_file_fragment_number = 0
-                if hasattr(file_info, 'fragment_info'):  # check if it is a fragment
-                    uploaded_file_fragment_number = file_info.fragment_info.fragment_num
-                    uploaded_file = \
-                        self._get_uploaded_file(
-                            session=session,
-                            file_info=file_info.fragment_info.file_info,
-                            fragment_count=file_info.fragment_info.fragments_count)
-
-                    # save a new fragment for the file
-                    file_fragment = FileFragment(
-                        fragment_sha1=file_info.sha1,
-                        fragment_name=file_info.upath,
-                        fragment_number=file_info.fragment_info.fragment_num
-                    )
-                    uploaded_file.fragments.append(file_fragment)
-                else:  # not fragmented file
-                    uploaded_file = self._get_uploaded_file(session=session, file_info=file_info)
-
-                session.flush()  # if uploaded_file has no id, we need one
-
-                file_in_container_assoc = FilesInContainers(
-                    uploaded_file_fragment_number=uploaded_file_fragment_number,
-                    uploaded_files_id=uploaded_file.id
-                )
-                file_in_container_assoc.container_file = file_container
-                file_container.fragments.append(file_in_container_assoc)
-
-            session.commit()
+            files_in_container[(uploaded_file_id, uploaded_file_fragment_number)] = dict(
+                file_containers_id=file_container_id,
+                uploaded_files_id=uploaded_file_id,
+                uploaded_file_fragment_number=uploaded_file_fragment_number)
+        if file_fragments:
+            session.execute(FileFragment.__table__.insert(), file_fragments)
+        if files_in_container:
+            session.execute(FilesInContainers.__table__.insert(), files_in_container.values())
 
     def _log_in_sent_log(self, block):
         """ Logs:
@@ -1,16 +1,15 @@
 import os
 import shutil
 
-from fcb.framework.workers import hd_worker_pool
+from fcb.framework import workers
 from fcb.framework.workflow.SenderTask import SenderTask
 
-_worker_pool = hd_worker_pool
-
 
 class ToDirectorySender(SenderTask):
     """
     Implements a sender that saves the processed files into a filesystem directory
     """
+    worker_pool_names = ("directory", workers.HARD_DRIVE_POOL)
     _dir_path = None
 
     def do_init(self, dir_path):
@@ -23,10 +22,6 @@ class ToDirectorySender(SenderTask):
         self.log.debug("Copying file '%s'", block.latest_file_info.path)
         shutil.copy(block.latest_file_info.path, self._dir_path)
 
-    # override from HeavyPipelineTask
-    def get_worker_channel(self):
-        return _worker_pool.get_worker()
-
     # override from SenderTask
     def destinations(self):
         return [self._dir_path]
@@ -8,11 +8,9 @@ from email.MIMEMultipart import MIMEMultipart
 from email.MIMEBase import MIMEBase
 from email.MIMEText import MIMEText
 from email.Utils import COMMASPACE, formatdate
-from fcb.framework.workers import mail_sender_worker_pool
+from fcb.framework import workers
 from fcb.framework.workflow.SenderTask import SenderTask, SendingError
 
-_worker_pool = mail_sender_worker_pool
-
 
 class MailSender(SenderTask):
     _mail_conf = None
@@ -21,6 +19,11 @@ class MailSender(SenderTask):
         super(MailSender, self).do_init()
         self._mail_conf = deepcopy(mail_conf)
 
+    # override from HeavyPipelineTask
+    @property
+    def worker_pool_names(self):
+        return "mail:" + self._mail_conf.src.mail, "mail", workers.UPLOAD_POOL
+
     # override from SenderTask
     def do_send(self, block):
         sending_succedded = self._send_mail(subject=block.latest_file_info.basename,
@@ -29,10 +32,6 @@ class MailSender(SenderTask):
         if not sending_succedded:
             raise SendingError()
 
-    # override from HeavyPipelineTask
-    def get_worker_channel(self):
-        return _worker_pool.get_worker()
-
     # override from SenderTask
     def destinations(self):
         return self._mail_conf.dst_mails
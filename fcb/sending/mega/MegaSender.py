@@ -1,13 +1,12 @@
 from subprocess32 import CalledProcessError
 
-from fcb.framework.workers import mega_sender_worker_pool
+from fcb.framework import workers
 from fcb.framework.workflow.SenderTask import SenderTask, SendingError
 from fcb.sending.mega.helpers import MegaAccountHandler
 
-_worker_pool = mega_sender_worker_pool
-
 
 class MegaSender(SenderTask):
+    worker_pool_names = ("mega", workers.UPLOAD_POOL)
     _base_comand = None
     _destination_name = None
     _limited_cmd = None
@@ -36,10 +35,6 @@ class MegaSender(SenderTask):
             self.log.error("Upload of '%s' failed: %s", to_upload, e)
             raise SendingError(e)
 
-    # override from HeavyPipelineTask
-    def get_worker_channel(self):
-        return _worker_pool.get_worker()
-
     # override from SenderTask
     def destinations(self):
         return [self._destination_name]
@@ -1,10 +1,11 @@
 import sys
 
-from fcb.database.helpers import get_session
+from fcb.database.helpers import get_session, configure_database
 from fcb.database.schema import FilesContainer
 from fcb.processing.transformations.Cipher import Cipher
 from fcb.processing.transformations import ToImage
-from fcb.utils.digest import gen_sha1
+from fcb.utils.Settings import Settings
+from fcb.utils.digest import gen_digests_of_files
 from fcb.utils.log_helper import get_logger_module
 
 
@@ -39,15 +40,15 @@ def untransform(in_filename, cipher_key_getter):
         decrypt(to_process_filename, dst_filename, cipher_key_getter)
 
 
-def _get_key_from_db(session, file_path):
-    sha1 = gen_sha1(file_path)
+def _get_key_from_db(session, sha1):
     return session.query(FilesContainer.encryption_key).filter(FilesContainer.sha1 == sha1).scalar()
 
 
 def untransform_from_db(files):
+    # the containers (the keys are registered by their sha1) are hashed concurrently while they are untransformed
     with get_session() as session:
-        for file_path in files:
-            cipher_key_getter = lambda: _get_key_from_db(session, file_path)
+        for file_path, (sha1,) in gen_digests_of_files(files):
+            cipher_key_getter = lambda: _get_key_from_db(session, sha1)
             untransform(in_filename=file_path, cipher_key_getter=cipher_key_getter)
         session.close()
 
@@ -55,7 +56,9 @@ def untransform_from_db(files):
 def print_usage_and_exit():
     print "Usage:"
     print "\t%s <transformed file> <cipher key>" % sys.argv[0]
-    print "\t%s -b <transformed file> [<transformed file> ...]" % sys.argv[0]
+    print "\t%s -b [-c <config_file>] <transformed file> [<transformed file> ...]" % sys.argv[0]
+    print "\t(batch mode gets the keys from the database of the configuration file, data.db of the current directory" \
+          " by default)"
     exit(1)
 
 
@@ -65,7 +68,13 @@ def main():
 
     if sys.argv[1] == "-b":
         log.debug("Batch mode detected")
-        untransform_from_db(sys.argv[2:])
+        files = sys.argv[2:]
+        if files[0] == "-c":
+            if len(files) < 3:
+                print_usage_and_exit()
+            configure_database(Settings(files[1]).database)
+            files = files[2:]
+        untransform_from_db(files)
     else:
         log.debug("Single file mode detected")
         untransform(in_filename=sys.argv[1], cipher_key_getter=lambda: sys.argv[3])
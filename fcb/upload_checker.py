@@ -3,8 +3,9 @@ import sys
 
 from fcb.checker import mail, mega
 from fcb.checker.settings import Configuration
-from fcb.database.helpers import get_session
+from fcb.database.helpers import get_session, configure_database
 from fcb.database.helpers import get_db_version
+from fcb.database.schema import SUPPORTED_DB_VERSIONS
 from fcb.utils.log_helper import get_logger_module
 
 log = get_logger_module('mail_checker')
@@ -19,11 +20,12 @@ def main():
         exit(1)
 
     conf = Configuration(sys.argv[1])
+    configure_database(conf.database)
 
     with get_session() as session:
         db_version = get_db_version(session)
-        if db_version != 3:
-            log.error("Invalid database version (%d). 3 expected", db_version)
+        if db_version not in SUPPORTED_DB_VERSIONS:
+            log.error("Invalid database version (%d). One of %s expected", db_version, SUPPORTED_DB_VERSIONS)
             session.close()
             exit(1)
 
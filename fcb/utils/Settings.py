@@ -1,7 +1,6 @@
 from copy import deepcopy
 import os
 import re
-import tempfile
 import xml.etree.ElementTree as Etree
 
 from fcb.utils.log_helper import get_logger_for, deep_print
@@ -82,12 +81,41 @@ class _PlainNode(object):
         _parse_fields_in_root(self, root)
 
 
+class _WorkerPool(_PlainNode):
+    name = None
+    kind = "thread"
+    size = 1
+    queue_size = 0
+
+    def __init__(self, root=None):
+        self.load(root)
+        _check_required_fields(self, ["name"])
+
+
+class _FlowStage(_PlainNode):
+    name = None
+    max_items = 0
+    max_bytes = _Size("0")
+
+    def __init__(self, root=None):
+        self.load(root)
+        _check_required_fields(self, ["name"])
+
+
 class _Performance(_PlainNode):
     max_pending_for_processing = 10
     filter_by_path = False
+    compression_workers = 1
+    cipher_workers = 1
+    max_temp_space = _Size("0")
+    min_free_temp_space = _Size("0")
+    worker_pools = []
+    flow_stages = []
 
     def __init__(self, root=None):
         self.load(root)
+        self.worker_pools = [] if root is None else [_WorkerPool(node) for node in root.iter("worker_pool")]
+        self.flow_stages = [] if root is None else [_FlowStage(node) for node in root.iter("flow_stage")]
 
 
 class _RateLimits(_PlainNode):
@@ -118,6 +146,9 @@ class _Limits(_PlainNode):
     max_upload_per_day = _Size("0")
     max_container_content_size = _Size("1G")
     max_files_per_container = 0
+    container_codec = "bz2"  # see processing.filesystem.ContainerCodec
+    container_compression_level = 0  # 0 means the codec default
+    detect_incompressible = False
 
     def __init__(self, root=None):
         self.load(root)
@@ -127,8 +158,10 @@ class _StoredFiles(_PlainNode):
     should_encrypt = True
     should_check_already_sent = True
     delete_temp_files = True
-    tmp_file_parts_basepath = tempfile.gettempdir()
     should_split_small_files = False
+    packing_window = 0
+    stream_transformations = False
+    cipher_mode = "cbc"
 
     def __init__(self, root=None):
         self.load(root)
@@ -239,11 +272,31 @@ class _SlowSenderSettings(_PlainNode):
 
 class _ToImage(_PlainNode):
     enabled = False
+    chunked = False
 
     def __init__(self, root=None):
         self.load(root)
 
 
+class _Database(_PlainNode):
+    path = "data.db"
+    url = None  # SQLAlchemy database URL (overrides path)
+    # SQLite pragmas set on each connection (see fcb.database.helpers)
+    journal_mode = "WAL"
+    synchronous = "NORMAL"
+    cache_size = _Size("64M")
+    mmap_size = _Size("256M")
+    temp_store = "MEMORY"
+    busy_timeout = 30  # seconds
+
+    def __init__(self, root=None):
+        self.load(root)
+
+    @property
+    def connect_string(self):
+        return self.url if self.url else "sqlite:///" + self.path
+
+
 class _Debugging(_PlainNode):
     enabled = False
 
@@ -252,30 +305,34 @@ class _Debugging(_PlainNode):
 
 
 class _ExcludePaths(object):
-    path_filter_list = []
+    """
+    Rules of the paths to exclude (see PathMatcher)
+    """
+    file_names = []
+    dir_names = []
+    regexes = []
 
     def __init__(self, root=None):
+        self.file_names = []
+        self.dir_names = []
+        self.regexes = []
         if root is None:
             return
 
         for node in root:
             tag = node.tag
+            if not node.text:
+                continue
             if tag == "file_name":
-                self.path_filter_list.append(self._get_file_regex(node.text))
-            if tag == "dir_name":
-                self.path_filter_list.append(self._get_dir_regex(node.text))
-            if tag == "regex_file_name":
-                self.path_filter_list.append(self._get_re_file_regex(node.text))
-            if tag == "regex_dir_name":
-                self.path_filter_list.append(self._get_re_dir_regex(node.text))
-            if tag == "regex":
-                self.path_filter_list.append(node.text)
-            else:
-                _parse_field(self, node)
-
-    @staticmethod
-    def _get_dir_regex(dir_name):
-        return _ExcludePaths._get_re_dir_regex(re.escape(dir_name))
+                self.file_names.append(node.text)
+            elif tag == "dir_name":
+                self.dir_names.append(node.text)
+            elif tag == "regex_file_name":
+                self.regexes.append(self._get_re_file_regex(node.text))
+            elif tag == "regex_dir_name":
+                self.regexes.append(self._get_re_dir_regex(node.text))
+            elif tag == "regex":
+                self.regexes.append(node.text)
 
     @staticmethod
     def _get_re_dir_regex(re_dir_pattern):
@@ -285,10 +342,6 @@ class _ExcludePaths(object):
             "/?$"
         ))
 
-    @staticmethod
-    def _get_file_regex(file_name):
-        return _ExcludePaths._get_re_file_regex(re.escape(file_name))
-
     @staticmethod
     def _get_re_file_regex(re_file_pattern):
         return "".join((
@@ -320,6 +373,7 @@ class Settings(object):
     mega_settings = None
     slow_sender = None
     debugging = _Debugging()
+    database = _Database()
 
     def __init__(self, file_path):
         self._parse(Etree.parse(file_path))
@@ -359,6 +413,8 @@ class Settings(object):
                 self.slow_sender = _SlowSenderSettings(node)
             elif tag == "debugging":
                 self.debugging = _Debugging(node)
+            elif tag == "database":
+                self.database = _Database(node)
             else:
                 log.warning("Tag '%s' not recognized. Will be ignored.", tag)
 
@@ -1,11 +1,185 @@
+"""
+Digests (sha1 and others supported by hashlib) of files and data streams
+
+Files are read with large reusable buffers (or mmap'ed if big) and hashlib releases the GIL while hashing them, so
+many files can be hashed concurrently with threads (see gen_digests_of_files)
+"""
 import hashlib
-from functools import partial
+import mmap
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+# size of the buffer used to read the files
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# files of (at least) this size are mmap'ed instead of read (0 means never mmap)
+DEFAULT_MMAP_THRESHOLD = 64 * 1024 * 1024
+
+_thread_buffers = threading.local()  # reusable read buffer of each thread
+
+
+def _get_buffer(buffer_size):
+    buf = getattr(_thread_buffers, "buffer", None)
+    if buf is None or len(buf) != buffer_size:
+        buf = _thread_buffers.buffer = bytearray(buffer_size)
+    return buf
 
 
-def gen_sha1(file_path):
+def gen_digests(file_path, algorithms=("sha1",), buffer_size=DEFAULT_BUFFER_SIZE,
+                mmap_threshold=DEFAULT_MMAP_THRESHOLD):
+    """
+    Computes several digests of the file content reading it only once
+    :param algorithms: names of the digests to compute (any supported by hashlib.new, e.g. sha1, sha256 or blake2b)
+    :return: list with the hexdigest of each algorithm (in the same order)
+    """
+    digests = [hashlib.new(algorithm) for algorithm in algorithms]
     with open(file_path, mode='rb') as f:
-        d = hashlib.sha1()
-        #TODO make the amount of bytes of buffer (128) configurable
-        for buf in iter(partial(f.read, 128), b''):
+        size = os.fstat(f.fileno()).st_size
+        if mmap_threshold and size >= mmap_threshold:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for d in digests:
+                    d.update(mapped)
+            finally:
+                mapped.close()
+        else:
+            buf = _get_buffer(buffer_size)
+            view = memoryview(buf)
+            while True:
+                read = f.readinto(buf)
+                if not read:
+                    break
+                data = view[:read] if read < buffer_size else view
+                for d in digests:
+                    d.update(data)
+    return [d.hexdigest() for d in digests]
+
+
+def gen_sha1(file_path, buffer_size=DEFAULT_BUFFER_SIZE):
+    return gen_digests(file_path, buffer_size=buffer_size)[0]
+
+
+def gen_sha1_of_range(file_path, offset, length, buffer_size=DEFAULT_BUFFER_SIZE):
+    """
+    :return: sha1 of length bytes of the file from offset
+    """
+    d = hashlib.sha1()
+    with open_range(file_path, offset, length) as f:
+        while True:
+            buf = f.read(buffer_size)
+            if not buf:
+                break
             d.update(buf)
-    return d.hexdigest()       
\ No newline at end of file
+    return d.hexdigest()
+
+
+def gen_digests_of_files(file_paths, algorithms=("sha1",), workers=0, buffer_size=DEFAULT_BUFFER_SIZE,
+                         mmap_threshold=DEFAULT_MMAP_THRESHOLD):
+    """
+    Computes the digests of many files concurrently
+    :param workers: amount of threads hashing files (0 means one per CPU)
+    :return: generator of (file path, list of hexdigests as returned by gen_digests) in the order of file_paths
+    """
+    def digests_of(file_path):
+        return file_path, gen_digests(file_path, algorithms, buffer_size, mmap_threshold)
+
+    pool = ThreadPool(workers if workers != 0 else None)
+    try:
+        for result in pool.imap(digests_of, file_paths):
+            yield result
+    finally:
+        pool.terminate()
+
+
+class _DigestingFile(object):
+    """
+    Base of the file like wrappers which compute the sha1 (and count the bytes) of the data passing through them
+    """
+
+    def __init__(self, fileobj, extra_digests=()):
+        """
+        :param extra_digests: other digests (objects with an update method) also updated with the data
+        """
+        self._fileobj = fileobj
+        self._digest = hashlib.sha1()
+        self._extra_digests = extra_digests
+        self._size = 0
+
+    def _account(self, buf):
+        self._digest.update(buf)
+        for extra_digest in self._extra_digests:
+            extra_digest.update(buf)
+        self._size += len(buf)
+
+    @property
+    def size(self):
+        """ amount of bytes that passed through the wrapper """
+        return self._size
+
+    def hexdigest(self):
+        """ sha1 of the data that passed through the wrapper (same format as gen_sha1) """
+        return self._digest.hexdigest()
+
+    def close(self):
+        self._fileobj.close()
+
+
+class DigestingReader(_DigestingFile):
+    """
+    Wraps a file opened for reading so the data read is digested on the fly
+    """
+
+    def read(self, size=-1):
+        buf = self._fileobj.read(size)
+        self._account(buf)
+        return buf
+
+
+class DigestingWriter(_DigestingFile):
+    """
+    Wraps a file opened for writing so the data written is digested on the fly
+    """
+
+    def write(self, buf):
+        self._account(buf)
+        self._fileobj.write(buf)
+
+    def flush(self):
+        self._fileobj.flush()
+
+    def tell(self):
+        return self._size
+
+
+class RangeReader(object):
+    """
+    File like object to read (at most) length bytes of a file from offset
+    """
+
+    def __init__(self, fileobj, offset, length):
+        self._fileobj = fileobj
+        self._fileobj.seek(offset)
+        self._remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        buf = self._fileobj.read(size) if size > 0 else b""
+        self._remaining -= len(buf)
+        return buf
+
+    def close(self):
+        self._fileobj.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def open_range(file_path, offset, length):
+    """
+    :return: RangeReader of length bytes of the file from offset
+    """
+    return RangeReader(open(file_path, "rb"), offset, length)
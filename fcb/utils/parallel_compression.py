@@ -0,0 +1,130 @@
+"""
+pbzip2 like compression: the data is split in chunks which are compressed independently (each one as a complete
+stream) in a process pool, and the resulting streams are written in order one after the other.
+
+Note: concatenated bzip2 streams are valid bzip2 data (standard bzip2/tar can read them) but python 2 bz2 module
+only decompresses the first stream of them.
+
+The same mechanism (ParallelChunkWriter) is used by other transformations whose chunks can be processed
+independently (e.g. CTR encryption).
+"""
+import bz2
+import multiprocessing
+import threading
+from collections import deque
+from functools import partial
+
+from fcb.utils.log_helper import get_logger_module
+
+_log = get_logger_module("parallel_compression")
+
+# bzip2 block size when using compression level 9 (the default used by tarfile)
+BZ2_CHUNK_SIZE = 900 * 1000
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _bz2_compress(level, data):
+    return bz2.compress(data, level)
+
+
+def _ignore_offset(function, offset, chunk):
+    return function(chunk)
+
+
+def bz2_compress_function(level=9):
+    """
+    :return: picklable function that compresses a chunk of data into a bzip2 stream
+    """
+    return partial(_bz2_compress, level)
+
+
+def get_pool(workers):
+    """
+    :param workers: amount of processes of the pool (0 means one per cpu)
+    :return: process pool shared by all the users requiring the same amount of workers
+    """
+    if workers == 0:
+        workers = multiprocessing.cpu_count()
+    with _pools_lock:
+        if workers not in _pools:
+            _log.debug("Creating compression pool with %d processes", workers)
+            _pools[workers] = multiprocessing.Pool(processes=workers)
+        return _pools[workers]
+
+
+class ParallelChunkWriter(object):
+    """
+    File like object (write only) which processes the data written to it by chunks in a process pool and writes the
+    results (in the same order) into fileobj
+
+    The underlying fileobj is not closed by close()
+    """
+
+    def __init__(self, fileobj, chunk_function, workers, chunk_size):
+        """
+        :param fileobj: file like object where the processed data is written
+        :param chunk_function: picklable function which receives the offset of a chunk (in the data written) and the
+                               chunk, and returns the data to write into fileobj
+        :param workers: amount of processes to use (0 means one per cpu)
+        :param chunk_size: amount of bytes processed independently
+        """
+        self._fileobj = fileobj
+        self._chunk_function = chunk_function
+        self._pool = get_pool(workers)
+        self._chunk_size = chunk_size
+        # keep every worker busy but avoid buffering too much data in memory
+        self._max_pending = 2 * (workers if workers != 0 else multiprocessing.cpu_count())
+        self._buffer = []
+        self._buffered = 0
+        self._submitted = 0
+        self._pending = deque()
+
+    def write(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self._chunk_size:
+            data = "".join(self._buffer)
+            offset = 0
+            while len(data) - offset >= self._chunk_size:
+                self._submit(data[offset:offset + self._chunk_size])
+                offset += self._chunk_size
+            self._buffer = [data[offset:]]
+            self._buffered = len(data) - offset
+
+    def close(self):
+        if self._buffered:
+            self._submit("".join(self._buffer))
+        self._buffer = []
+        self._buffered = 0
+        while self._pending:
+            self._write_oldest()
+
+    def _submit(self, chunk):
+        self._pending.append(self._pool.apply_async(self._chunk_function, (self._submitted, chunk)))
+        self._submitted += len(chunk)
+        while len(self._pending) > self._max_pending:
+            self._write_oldest()
+
+    def _write_oldest(self):
+        self._fileobj.write(self._pending.popleft().get())
+
+
+class ParallelCompressionWriter(ParallelChunkWriter):
+    """
+    File like object (write only) which compresses the data written to it in a process pool and writes the result
+    into fileobj
+
+    The underlying fileobj is not closed by close()
+    """
+
+    def __init__(self, fileobj, compress_function, workers, chunk_size=BZ2_CHUNK_SIZE):
+        """
+        :param fileobj: file like object where the compressed data is written
+        :param compress_function: picklable function which receives a chunk of data and returns it compressed
+        :param workers: amount of processes to use (0 means one per cpu)
+        :param chunk_size: amount of bytes compressed independently
+        """
+        ParallelChunkWriter.__init__(self, fileobj=fileobj, chunk_function=partial(_ignore_offset, compress_function),
+                                     workers=workers, chunk_size=chunk_size)
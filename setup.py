@@ -39,7 +39,9 @@ setup(
             'fcb-check = fcb.upload_checker:main',
             'fcb-untransform = fcb.untransform_file:main',
             'fcb-cleanup = fcb.db_cleanup:main',
+            'fcb-vacuum-digest-cache = fcb.digest_cache_vacuum:main',
             'fcb-createdb = fcb.database.schema:main',
+            'fcb-db-upgrade = fcb.database.upgrade:main',
         ]
     }
 )
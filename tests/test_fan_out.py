@@ -0,0 +1,76 @@
+import threading
+import unittest
+
+from fcb.framework.workflow.FanOut import FanOut
+from fcb.framework.workflow.SenderTask import SenderTask, SendingError
+
+
+class _Block(object):
+    """
+    Compressor Block replacement with the attributes used by the senders
+    """
+
+    def __init__(self, destinations):
+        self.destinations = destinations
+        self.send_destinations = []
+        self.failed_destinations = {}
+        self.destinations_verif_data = {}
+
+
+class _Sender(SenderTask):
+    """
+    Sender of a single destination which raises error (if any) instead of sending
+    """
+
+    def do_init(self, destination, error=None):
+        self._destination = destination
+        self._error = error
+
+    def destinations(self):
+        return [self._destination]
+
+    def do_send(self, block):
+        if self._error is not None:
+            raise self._error
+
+
+class _Collector(object):
+    """
+    Next task of the FanOut, keeps the data handed to it
+    """
+
+    def __init__(self):
+        self.received = []
+        self.done = threading.Event()
+
+    def handle_data(self, data):
+        self.received.append(data)
+        self.done.set()
+
+
+class TestFanOutOfSenders(unittest.TestCase):
+    def _send(self, *senders):
+        collector = _Collector()
+        fan_out = FanOut(collector, list(senders))
+        block = _Block(destinations=[sender.destinations()[0] for sender in senders])
+        fan_out.handle_data(block)
+        self.assertTrue(collector.done.wait(10), "block wasn't handed on")
+        self.assertEqual([block], collector.received)
+        self.assertEqual({}, fan_out._pending)
+        return block
+
+    def test_block_is_handed_on_when_a_sender_raises_unexpected_error(self):
+        block = self._send(_Sender(None, "ok"), _Sender(None, "broken", IOError("disk gone")))
+
+        self.assertEqual(["ok"], block.send_destinations)
+        self.assertEqual({"broken": "disk gone"}, block.failed_destinations)
+
+    def test_sending_error_is_recorded(self):
+        block = self._send(_Sender(None, "ok"), _Sender(None, "failing", SendingError()))
+
+        self.assertEqual(["ok"], block.send_destinations)
+        self.assertEqual({"failing": "SendingError"}, block.failed_destinations)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from fcb.processing.transformations.ToImage import from_file_to_image, from_image_to_file, _image_to_file_chunked, \
+    _UnsupportedPng
+
+
+class TestImageRoundTrip(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp(prefix="test_to_image_")
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _round_trip(self, data, chunked):
+        src_path = os.path.join(self.path, "src")
+        img_path = src_path + ".png"
+        out_path = os.path.join(self.path, "out")
+        with open(src_path, "wb") as f:
+            f.write(data)
+        from_file_to_image(src_path, img_path, chunked=chunked)
+        from_image_to_file(img_path, out_path)
+        with open(out_path, "rb") as f:
+            self.assertEqual(data, f.read())
+        return img_path
+
+    def test_chunked_image(self):
+        for size in (1, 1000, 3 * 1009, 100003):  # exact and padded (prime amount of pixels) images
+            self._round_trip(os.urandom(size), chunked=True)
+
+    def test_pil_image(self):
+        for size in (1, 1000, 3 * 1009, 100003):
+            self._round_trip(os.urandom(size), chunked=False)
+
+    def test_pil_image_with_adaptive_filtering(self):
+        data = "".join(chr(number % 251) for number in xrange(200000))  # filtered with Average/Paeth by PIL
+        img_path = self._round_trip(data, chunked=False)
+
+        out_path = os.path.join(self.path, "unsupported")
+        self.assertRaises(_UnsupportedPng, _image_to_file_chunked, img_path, out_path)
+        self.assertFalse(os.path.exists(out_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
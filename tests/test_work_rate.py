@@ -0,0 +1,56 @@
+import unittest
+
+from fcb.framework.workflow.WorkRate import WorkRateController, COMPRESS_STAGE, SEND_STAGE, TEMP_SPACE_REASON
+
+
+class _TempSpace(object):
+    """
+    TempSpaceController replacement whose space is set by the test
+    """
+
+    def __init__(self, has_space):
+        self.space = has_space
+
+    def has_space(self):
+        return self.space
+
+
+class TestWaitForSlot(unittest.TestCase):
+    def test_polls_while_temp_space_is_exhausted_and_a_container_is_open(self):
+        temp_space = _TempSpace(has_space=False)
+        controller = WorkRateController(max_pending_for_processing=10, temp_space_controller=temp_space)
+        controller.stages[COMPRESS_STAGE].take(1, 100)  # files waiting for their container to be filled
+
+        self.assertFalse(controller.try_acquire_slot("path", 10))
+        self.assertEqual(TEMP_SPACE_REASON, controller._denied_reason)
+        self.assertIsNone(controller.wait_for_slot(controller))
+
+        temp_space.space = True
+        self.assertTrue(controller.try_acquire_slot("path", 10))
+
+    def test_polls_while_temp_space_is_exhausted_and_containers_are_sent(self):
+        controller = WorkRateController(max_pending_for_processing=10,
+                                        temp_space_controller=_TempSpace(has_space=False))
+        controller.stages[SEND_STAGE].take(1, 100)
+
+        self.assertFalse(controller.try_acquire_slot("path", 10))
+        self.assertIsNone(controller.wait_for_slot(controller))
+
+    def test_polls_when_only_the_compress_stage_holds_credits(self):
+        controller = WorkRateController(max_pending_for_processing=1)
+        controller.stages[COMPRESS_STAGE].take(1, 100)
+        self.assertTrue(controller.try_acquire_slot("path", 10))
+
+        self.assertFalse(controller.try_acquire_slot("other path", 10))
+        self.assertIsNone(controller.wait_for_slot(controller))
+
+    def test_waits_for_credits_while_containers_are_sent(self):
+        controller = WorkRateController(max_pending_for_processing=1)
+        controller.stages[SEND_STAGE].take(1, 100)
+
+        self.assertFalse(controller.try_acquire_slot("path", 10))
+        self.assertIsNotNone(controller.wait_for_slot(controller))
+
+
+if __name__ == '__main__':
+    unittest.main()